@@ -52,23 +52,32 @@ def main() -> None:
 
     client = get_minio()
 
+    # One fan-out job per reference image: the image is downloaded, staged and encoded once
+    # and every driving video for it renders in the same invocation.
+    by_image = {}
     for spec in specs:
-        marker = f"/tmp/start_avatar_{spec.name}.txt"
+        by_image.setdefault(spec.image_key, []).append(spec)
+
+    for image_key, group in by_image.items():
+        group_name = os.path.splitext(os.path.basename(image_key))[0]
+        marker = f"/tmp/start_avatar_{group_name}.txt"
         start = time.time()
         with open(marker, "w") as f:
             f.write(
                 f"start_unix={start}\n"
-                f"image_key={spec.image_key}\n"
-                f"driving_video_key={spec.driving_video_key}\n"
+                f"image_key={image_key}\n"
+                f"driving_video_keys={[spec.driving_video_key for spec in group]}\n"
             )
 
-        img_bytes = client.get_object(bucket, spec.image_key).read()
+        img_bytes = client.get_object(bucket, image_key).read()
         job = {
             "input": {
                 "user_id": out_user,
-                "avatar_id": spec.name,
+                "avatar_id": group_name,
                 "image_base64": base64.b64encode(img_bytes).decode("utf-8"),
-                "driving_video_path": spec.driving_video_key,
+                "driving_video_paths": [
+                    {"driving_video_path": spec.driving_video_key, "name": spec.name} for spec in group
+                ],
             }
         }
         result = handler.handler(job)
@@ -81,16 +90,17 @@ def main() -> None:
             f.write(f"duration_s={duration_s}\n")
             f.write(f"result={result}\n")
 
-        print(
-            {
-                "name": spec.name,
-                "duration_s": duration_s,
-                "minio_key": result.get("minio_key"),
-                "video_url": result.get("video_url"),
-                "error": result.get("error"),
-            },
-            flush=True,
-        )
+        for item in result.get("results") or [{"name": group_name, "error": result.get("error")}]:
+            print(
+                {
+                    "name": item.get("name"),
+                    "group_duration_s": duration_s,
+                    "minio_key": item.get("minio_key"),
+                    "video_url": item.get("video_url"),
+                    "error": item.get("error"),
+                },
+                flush=True,
+            )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,80 @@
+"""
+Peak-RSS benchmark for the base64 input/output paths.
+
+Each case runs in a fresh subprocess and reports how far its peak RSS rose above the
+baseline taken just before the operation (after the payload itself is in memory, which is
+what the handler receives from RunPod).
+
+    python bench_base64.py                 # 80 MB (BASE64_FALLBACK_MAX_MB default)
+    python bench_base64.py --size-mb 200
+"""
+
+import argparse
+import base64
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from b64stream import decode_to_file, encode_file
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _run_case(case: str, src: str, workdir: str) -> None:
+    if case.startswith("decode"):
+        with open(src, "rb") as f:
+            payload = base64.b64encode(f.read()).decode("ascii")
+        baseline = _peak_rss_mb()
+        dest = os.path.join(workdir, f"{case}.bin")
+        started = time.perf_counter()
+        if case == "decode_oneshot":
+            with open(dest, "wb") as f:
+                f.write(base64.b64decode(payload))
+        else:
+            decode_to_file(payload, dest)
+    else:
+        baseline = _peak_rss_mb()
+        started = time.perf_counter()
+        if case == "encode_oneshot":
+            with open(src, "rb") as f:
+                result = base64.b64encode(f.read()).decode("utf-8")
+        else:
+            result = encode_file(src)
+        del result
+    elapsed = time.perf_counter() - started
+    print(f"{case:16s} peak +{_peak_rss_mb() - baseline:8.1f} MB   {elapsed:6.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak RSS of one-shot vs. streaming base64")
+    parser.add_argument("--size-mb", type=int, default=80)
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    parser.add_argument("--src", help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        _run_case(args.case, args.src, args.workdir)
+        return
+
+    with tempfile.TemporaryDirectory() as workdir:
+        src = os.path.join(workdir, "payload.bin")
+        with open(src, "wb") as f:
+            for _ in range(args.size_mb):
+                f.write(os.urandom(1024 * 1024))
+        print(f"payload: {args.size_mb} MB binary, {args.size_mb * 4 / 3:.0f} MB base64")
+        for case in ("decode_oneshot", "decode_stream", "encode_oneshot", "encode_stream"):
+            subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--case", case, "--src", src, "--workdir", workdir],
+                check=True,
+            )
+
+
+if __name__ == "__main__":
+    main()
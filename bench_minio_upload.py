@@ -0,0 +1,203 @@
+"""
+Upload-phase benchmark: per-call MinIO clients vs. the handler's pooled client.
+
+Runs against a small in-process S3-compatible stand-in (enough of the API for
+bucket checks, single PUTs and multipart uploads) that adds per-request latency and a
+per-connection bandwidth cap, so it behaves like a remote object store rather than
+loopback. Point it at a real MinIO with --endpoint to measure that instead.
+
+    python bench_minio_upload.py
+    python bench_minio_upload.py --size-mb 120 --latency-ms 40 --conn-mbps 200
+    python bench_minio_upload.py --endpoint localhost:9000 --access-key minio --secret-key minio123
+"""
+
+import argparse
+import hashlib
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+BUCKET = "bench"
+_S3_NS = "http://s3.amazonaws.com/doc/2006-03-01/"
+
+
+class _StubS3(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency_s = 0.02
+    bytes_per_s = 25e6
+    requests = 0
+    _lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def _begin(self):
+        with self._lock:
+            _StubS3.requests += 1
+        time.sleep(self.latency_s)
+        url = urlsplit(self.path)
+        return url.path.strip("/").split("/", 1), parse_qs(url.query, keep_blank_values=True)
+
+    def _drain(self):
+        remaining = int(self.headers.get("Content-Length") or 0)
+        h = hashlib.md5()
+        while remaining:
+            chunk = self.rfile.read(min(remaining, 1024 * 1024))
+            if not chunk:
+                break
+            h.update(chunk)
+            remaining -= len(chunk)
+            time.sleep(len(chunk) / self.bytes_per_s)
+        return h.hexdigest()
+
+    def _reply(self, status=200, body=b"", headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body and self.command != "HEAD":
+            self.wfile.write(body)
+
+    def do_HEAD(self):
+        self._begin()
+        self._reply()
+
+    def do_GET(self):
+        parts, query = self._begin()
+        if "location" in query:
+            body = f'<LocationConstraint xmlns="{_S3_NS}">us-east-1</LocationConstraint>'
+            self._reply(body=body.encode(), headers={"Content-Type": "application/xml"})
+        else:
+            self._reply(404)
+
+    def do_PUT(self):
+        self._begin()
+        etag = self._drain()
+        self._reply(headers={"ETag": f'"{etag}"'})
+
+    def do_POST(self):
+        parts, query = self._begin()
+        self._drain()
+        key = parts[1] if len(parts) > 1 else ""
+        if "uploads" in query:
+            body = (
+                f'<InitiateMultipartUploadResult xmlns="{_S3_NS}"><Bucket>{parts[0]}</Bucket>'
+                f"<Key>{key}</Key><UploadId>{uuid.uuid4().hex}</UploadId></InitiateMultipartUploadResult>"
+            )
+        else:
+            body = (
+                f'<CompleteMultipartUploadResult xmlns="{_S3_NS}"><Bucket>{parts[0]}</Bucket>'
+                f'<Key>{key}</Key><ETag>"{uuid.uuid4().hex}-1"</ETag></CompleteMultipartUploadResult>'
+            )
+        self._reply(body=body.encode(), headers={"Content-Type": "application/xml"})
+
+
+def _thumbnail(video_path, thumb_path):
+    # The benchmark payload is random bytes, so stand in for ffmpeg with a fixed-cost step.
+    time.sleep(0.3)
+    with open(thumb_path, "wb") as f:
+        f.write(os.urandom(40 * 1024))
+
+
+def before(args, video, thumb):
+    """The previous upload path: a fresh client and bucket check per object, sequential."""
+    from minio import Minio
+
+    def upload(path, key):
+        client = Minio(args.endpoint, access_key=args.access_key, secret_key=args.secret_key, secure=False)
+        if not client.bucket_exists(BUCKET):
+            client.make_bucket(BUCKET)
+        client.fput_object(BUCKET, key, path)
+        return client.presigned_get_object(BUCKET, key)
+
+    upload(video, "before/idle.mp4")
+    _thumbnail(video, thumb)
+    upload(thumb, "before/thumb.jpg")
+
+
+def after(args, video, thumb):
+    """Pooled client, memoized bucket check, tuned multipart, thumbnail alongside the video."""
+    import handler
+
+    def thumbnail():
+        _thumbnail(video, thumb)
+        return handler.upload_to_minio(thumb, "after/thumb.jpg")
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        pending = pool.submit(thumbnail)
+        handler.upload_to_minio(video, "after/idle.mp4")
+        pending.result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MinIO upload-phase benchmark")
+    parser.add_argument("--size-mb", type=int, default=60)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--conn-mbps", type=float, default=400, help="stand-in bandwidth per connection (Mbit/s)")
+    parser.add_argument("--endpoint", help="real MinIO endpoint (host:port) instead of the stand-in")
+    parser.add_argument("--access-key", default="bench")
+    parser.add_argument("--secret-key", default="bench-secret")
+    args = parser.parse_args()
+
+    server = None
+    if not args.endpoint:
+        _StubS3.latency_s = args.latency_ms / 1000
+        _StubS3.bytes_per_s = args.conn_mbps * 1e6 / 8
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _StubS3)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        args.endpoint = f"127.0.0.1:{server.server_address[1]}"
+
+    # handler reads its MinIO settings at import time.
+    os.environ.update(
+        {
+            "RUNPOD_START_SERVERLESS": "false",
+            "MINIO_ENDPOINT": args.endpoint,
+            "MINIO_ACCESS_KEY": args.access_key,
+            "MINIO_SECRET_KEY": args.secret_key,
+            "MINIO_BUCKET": BUCKET,
+            "MINIO_USE_SSL": "false",
+        }
+    )
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import handler  # noqa: F401 - import outside the timed runs
+
+    logging.getLogger("handler").setLevel(logging.WARNING)
+
+    workdir = tempfile.mkdtemp()
+    try:
+        video = os.path.join(workdir, "idle.mp4")
+        with open(video, "wb") as f:
+            for _ in range(args.size_mb):
+                f.write(os.urandom(1024 * 1024))
+        thumb = os.path.join(workdir, "thumb.jpg")
+        print(f"endpoint {args.endpoint}, {args.size_mb} MB video + thumbnail, {args.runs} runs")
+        for name, fn in (("before", before), ("after", after)):
+            times = []
+            requests_before = _StubS3.requests
+            for _ in range(args.runs):
+                started = time.perf_counter()
+                fn(args, video, thumb)
+                times.append(time.perf_counter() - started)
+            extra = ""
+            if server:
+                extra = f"  {(_StubS3.requests - requests_before) / args.runs:.0f} requests/run"
+            print(f"{name:7s} best {min(times):6.2f}s  mean {sum(times) / len(times):6.2f}s{extra}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+        if server:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -69,6 +69,13 @@ if [ -d /ComfyUI/custom_nodes/ComfyUI-AdaptiveWindowSize/ComfyUI-AdaptiveWindowS
   mv -f ./* ../ || true
 fi
 
+# Handler-side helper nodes (tensor cache save/load) shipped with this repo.
+if [ -d /comfy_nodes/wan_avatar_nodes ]; then
+  echo "Installing wan_avatar_nodes..."
+  rm -rf /ComfyUI/custom_nodes/wan_avatar_nodes
+  cp -r /comfy_nodes/wan_avatar_nodes /ComfyUI/custom_nodes/wan_avatar_nodes
+fi
+
 echo "Pinning onnxruntime-gpu==1.22.0 (as in Dockerfile)..."
 python3 -m pip install --upgrade onnxruntime-gpu==1.22.0
 
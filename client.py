@@ -7,10 +7,10 @@ Usage:
     python client.py --image-url https://example.com/photo.jpg --user-id user_123 --avatar-id avatar_456
     python client.py --image-minio-path input-avatars/user.png --driving-video-path sitting-woman/video-conference-woman.mp4
     python client.py --image-minio-path user-avatars/<user>/<avatar>/source.png --driving-video-path templates/wan/sitting-woman.mp4 --output-video-key user-avatars/<user>/<avatar>/idle.mp4
+    python client.py --image-minio-path input-avatars/jobs.png --driving-video-paths sitting-woman/video-conference-man-1.mp4 sitting-woman/video-conference-woman-2.mp4
 """
 
 import argparse
-import base64
 import json
 import os
 import sys
@@ -19,6 +19,8 @@ import time
 import requests
 from dotenv import load_dotenv
 
+from b64stream import decode_to_file, encode_file
+
 load_dotenv()
 
 RUNPOD_API_KEY = os.getenv("RUNPOD_API_KEY")
@@ -49,6 +51,7 @@ class WanAvatarClient:
         template_id: str = None,
         driving_video_url: str = None,
         driving_video_path: str = None,
+        driving_video_paths: list = None,
         user_id: str = None,
         avatar_id: str = None,
         prompt: str = None,
@@ -69,8 +72,7 @@ class WanAvatarClient:
         elif image_base64:
             payload["image_base64"] = image_base64
         elif image_path:
-            with open(image_path, "rb") as f:
-                payload["image_base64"] = base64.b64encode(f.read()).decode("utf-8")
+            payload["image_base64"] = encode_file(image_path)
         else:
             raise ValueError("Provide image_url, image_minio_path, image_base64, or image_path")
 
@@ -80,6 +82,9 @@ class WanAvatarClient:
             payload["driving_video_url"] = driving_video_url
         if driving_video_path:
             payload["driving_video_path"] = driving_video_path
+        if driving_video_paths:
+            # Fan-out: one job renders every variant; output has a per-item "results" list.
+            payload["driving_video_paths"] = driving_video_paths
 
         if user_id:
             payload["user_id"] = user_id
@@ -123,7 +128,20 @@ class WanAvatarClient:
             status = resp.json()
 
             state = status.get("status")
-            print(f"  [{elapsed}s] Status: {state}")
+            progress = status.get("output") if state == "IN_PROGRESS" else None
+            if isinstance(progress, dict):
+                detail = progress.get("class_type") or progress.get("stage") or ""
+                if progress.get("steps"):
+                    detail += f" step {progress['step']}/{progress['steps']}"
+                if progress.get("segments"):
+                    detail = f"segment {progress['segment'] + 1}/{progress['segments']} {detail}"
+                if progress.get("name") is not None:
+                    detail = f"[{progress['name']}] {detail}"
+                if progress.get("hls_playlist_url"):
+                    detail += f" (playable: {progress['hls_playlist_url']})"
+                print(f"  [{elapsed}s] Status: {state} {detail}")
+            else:
+                print(f"  [{elapsed}s] Status: {state}")
 
             if state == "COMPLETED":
                 return status.get("output", {})
@@ -135,14 +153,14 @@ class WanAvatarClient:
     def save_video(self, result: dict, output_path: str = "output.mp4"):
         """Save video from result to a local file."""
         if "video_base64" in result:
-            with open(output_path, "wb") as f:
-                f.write(base64.b64decode(result["video_base64"]))
+            decode_to_file(result["video_base64"], output_path)
             print(f"Saved video to {output_path}")
         elif "video_url" in result:
-            resp = requests.get(result["video_url"])
-            resp.raise_for_status()
-            with open(output_path, "wb") as f:
-                f.write(resp.content)
+            with requests.get(result["video_url"], stream=True) as resp:
+                resp.raise_for_status()
+                with open(output_path, "wb") as f:
+                    for chunk in resp.iter_content(chunk_size=1024 * 1024):
+                        f.write(chunk)
             print(f"Downloaded video to {output_path}")
         else:
             print("No video data in result")
@@ -156,6 +174,11 @@ def main():
     parser.add_argument("--template", help="Template ID (expects /templates/<template>.mp4 in worker)")
     parser.add_argument("--driving-video-url", help="Driving video URL")
     parser.add_argument("--driving-video-path", help="Driving video object key in MinIO bucket")
+    parser.add_argument(
+        "--driving-video-paths",
+        nargs="+",
+        help="Several driving video keys in MinIO; renders all variants in one job",
+    )
     parser.add_argument("--user-id", help="User ID for MinIO path")
     parser.add_argument("--avatar-id", help="Avatar ID for MinIO path")
     parser.add_argument("--prompt", help="Custom positive prompt")
@@ -180,6 +203,7 @@ def main():
         template_id=args.template,
         driving_video_url=args.driving_video_url,
         driving_video_path=args.driving_video_path,
+        driving_video_paths=args.driving_video_paths,
         user_id=args.user_id,
         avatar_id=args.avatar_id,
         prompt=args.prompt,
@@ -194,6 +218,12 @@ def main():
     if "video_url" in result or "video_base64" in result:
         client.save_video(result, args.output)
 
+    stem, ext = os.path.splitext(args.output)
+    for item in result.get("results") or []:
+        print(f"  [{item.get('name')}] {item.get('status')}: {item.get('minio_key') or item.get('error')}")
+        if "video_url" in item or "video_base64" in item:
+            client.save_video(item, f"{stem}_{item.get('name')}{ext}")
+
     if "minio_key" in result:
         print(f"MinIO key: {result['minio_key']}")
 
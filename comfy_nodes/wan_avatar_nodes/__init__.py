@@ -0,0 +1,111 @@
+"""
+ComfyUI nodes used by the wan-avatar-serverless handler.
+
+Tensor cache nodes persist intermediate results (preprocessing artifacts, embeddings) to an
+absolute path chosen by the handler, and load them back in later prompts so the expensive
+upstream nodes can be dropped from the graph.
+
+Importing the pack also installs the model download gate (see model_gate.py).
+"""
+
+import os
+
+import torch
+
+from .model_gate import install as _install_model_gate
+
+CACHE_FORMAT = 1
+
+
+def _to_cpu(value):
+    if isinstance(value, torch.Tensor):
+        return value.detach().cpu()
+    if isinstance(value, dict):
+        return {k: _to_cpu(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(_to_cpu(v) for v in value)
+    return value
+
+
+def _encode(value, encoding):
+    if encoding == "u8":
+        # IMAGE / MASK tensors are float32 in [0, 1]; uint8 is lossless enough for
+        # pose renders and masks and is 4x smaller on disk.
+        return (value.detach().clamp(0, 1) * 255).round().to(torch.uint8).cpu()
+    return _to_cpu(value)
+
+
+def _decode(value, encoding):
+    if encoding == "u8":
+        return value.to(torch.float32) / 255.0
+    return value
+
+
+def save_cached(value, path, encoding="raw"):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    torch.save({"format": CACHE_FORMAT, "encoding": encoding, "value": _encode(value, encoding)}, tmp)
+    os.replace(tmp, path)
+
+
+def load_cached(path):
+    payload = torch.load(path, map_location="cpu", weights_only=False)
+    if payload.get("format") != CACHE_FORMAT:
+        raise ValueError(f"Unsupported cache format in {path}: {payload.get('format')}")
+    return _decode(payload["value"], payload.get("encoding", "raw"))
+
+
+def _make_nodes(type_name, encoding):
+    class SaveNode:
+        @classmethod
+        def INPUT_TYPES(cls):
+            return {"required": {"value": (type_name,), "path": ("STRING", {"default": ""})}}
+
+        RETURN_TYPES = ()
+        FUNCTION = "save"
+        OUTPUT_NODE = True
+        CATEGORY = "WanAvatar/cache"
+
+        def save(self, value, path):
+            save_cached(value, path, encoding)
+            return {}
+
+    class LoadNode:
+        @classmethod
+        def INPUT_TYPES(cls):
+            return {"required": {"path": ("STRING", {"default": ""})}}
+
+        RETURN_TYPES = (type_name,)
+        FUNCTION = "load"
+        CATEGORY = "WanAvatar/cache"
+
+        @classmethod
+        def IS_CHANGED(cls, path):
+            try:
+                return os.path.getmtime(path)
+            except OSError:
+                return float("nan")
+
+        def load(self, path):
+            return (load_cached(path),)
+
+    return SaveNode, LoadNode
+
+
+# Block model loads per file while background downloads are still running.
+_install_model_gate()
+
+NODE_CLASS_MAPPINGS = {}
+NODE_DISPLAY_NAME_MAPPINGS = {}
+
+for _type_name, _label, _encoding in (
+    ("IMAGE", "Image", "u8"),
+    ("MASK", "Mask", "u8"),
+    ("WANVIDEOTEXTEMBEDS", "TextEmbeds", "raw"),
+    ("WANVIDIMAGE_CLIPEMBEDS", "ClipEmbeds", "raw"),
+):
+    _save, _load = _make_nodes(_type_name, _encoding)
+    NODE_CLASS_MAPPINGS[f"WanAvatarSave{_label}"] = _save
+    NODE_CLASS_MAPPINGS[f"WanAvatarLoad{_label}"] = _load
+    NODE_DISPLAY_NAME_MAPPINGS[f"WanAvatarSave{_label}"] = f"Save {_label} (Wan Avatar cache)"
+    NODE_DISPLAY_NAME_MAPPINGS[f"WanAvatarLoad{_label}"] = f"Load {_label} (Wan Avatar cache)"
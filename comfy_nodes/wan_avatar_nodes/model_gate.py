@@ -0,0 +1,96 @@
+"""
+Let ComfyUI start before every model file has landed.
+
+When download_models.py runs in the background it publishes a status file (see
+model_status.py in the worker repo). This module patches `folder_paths` so that:
+
+- files still downloading are listed by `get_filename_list`, so prompts validate;
+- `get_full_path` blocks only until the requested file (and its companions) is ready.
+"""
+
+import json
+import logging
+import os
+import time
+
+import folder_paths
+
+logger = logging.getLogger(__name__)
+
+STATUS_PATH = os.environ.get("MODEL_STATUS_PATH", "/tmp/model_status.json")
+WAIT_TIMEOUT_S = float(os.environ.get("MODEL_WAIT_TIMEOUT_S", "1800"))
+READY_STATES = ("present", "linked", "downloaded")
+
+
+def _read_status():
+    try:
+        with open(STATUS_PATH, "r") as f:
+            return json.load(f).get("files", {})
+    except (OSError, ValueError):
+        return {}
+
+
+def _folder_dirs(folder_name):
+    try:
+        return {os.path.abspath(p) for p in folder_paths.get_folder_paths(folder_name)}
+    except Exception:
+        return set()
+
+
+def _tracked(folder_name, filename, files):
+    """Status entries for `filename` in `folder_name`, plus companions needed with it."""
+    dirs = _folder_dirs(folder_name)
+    matches = []
+    for dest, entry in files.items():
+        if os.path.dirname(os.path.abspath(dest)) not in dirs:
+            continue
+        if os.path.basename(dest) == filename or entry.get("needed_with") == filename:
+            matches.append((dest, entry))
+    return matches
+
+
+def _wait_until_ready(folder_name, filename):
+    deadline = time.monotonic() + WAIT_TIMEOUT_S
+    announced = False
+    while True:
+        waiting = []
+        for dest, entry in _tracked(folder_name, filename, _read_status()):
+            state = entry.get("status")
+            if state == "failed":
+                raise RuntimeError(f"Model download failed: {dest}: {entry.get('error')}")
+            if state not in READY_STATES:
+                waiting.append(dest)
+        if not waiting:
+            return
+        if not announced:
+            logger.info(f"[wan_avatar_nodes] waiting for model download: {waiting}")
+            announced = True
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Timed out waiting for model download: {waiting}")
+        time.sleep(2)
+
+
+def install():
+    if getattr(folder_paths, "_wan_avatar_gate_installed", False):
+        return
+    original_get_full_path = folder_paths.get_full_path
+    original_get_filename_list = folder_paths.get_filename_list
+
+    def get_full_path(folder_name, filename):
+        if os.path.exists(STATUS_PATH):
+            _wait_until_ready(folder_name, filename)
+        return original_get_full_path(folder_name, filename)
+
+    def get_filename_list(folder_name):
+        names = list(original_get_filename_list(folder_name))
+        if os.path.exists(STATUS_PATH):
+            dirs = _folder_dirs(folder_name)
+            for dest, entry in _read_status().items():
+                name = os.path.basename(dest)
+                if entry.get("status") not in READY_STATES and os.path.dirname(dest) in dirs and name not in names:
+                    names.append(name)
+        return names
+
+    folder_paths.get_full_path = get_full_path
+    folder_paths.get_filename_list = get_filename_list
+    folder_paths._wan_avatar_gate_installed = True
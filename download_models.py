@@ -4,10 +4,56 @@ import os
 os.environ.setdefault("HF_HUB_ENABLE_HF_TRANSFER", "1")
 os.environ.setdefault("HF_HUB_DISABLE_PROGRESS_BARS", "1")
 
+import hashlib
+import importlib.util
+import json
+import re
 import shutil
-from dataclasses import dataclass
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import List, Optional
 
-from huggingface_hub import hf_hub_download
+from huggingface_hub import get_hf_file_metadata, hf_hub_download, hf_hub_url, try_to_load_from_cache
+
+from model_status import STATUS_PATH, write_status
+
+_REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+MANIFEST_PATH = os.getenv(
+    "MODELS_MANIFEST",
+    "/models_manifest.json"
+    if os.path.exists("/models_manifest.json")
+    else os.path.join(_REPO_DIR, "models_manifest.json"),
+)
+WORKFLOW_PATH = os.getenv(
+    "WORKFLOW_PATH",
+    "/workflow_replace.json"
+    if os.path.exists("/workflow_replace.json")
+    else os.path.join(_REPO_DIR, "workflow_replace.json"),
+)
+DOWNLOAD_WORKERS = int(os.getenv("MODEL_DOWNLOAD_WORKERS", "4"))
+DOWNLOAD_RETRIES = int(os.getenv("MODEL_DOWNLOAD_RETRIES", "5"))
+REPORT_PATH = os.getenv("MODEL_DOWNLOAD_REPORT", "/tmp/model_download_report.json")
+CHUNK_SIZE = 8 * 1024 * 1024
+HF_TOKEN = os.getenv("HF_TOKEN") or os.getenv("HUGGING_FACE_HUB_TOKEN")
+# hf_transfer splits each file into concurrent ranged requests; huggingface_hub falls
+# back to a single stream without it.
+TRANSFER = (
+    "hf_transfer"
+    if os.environ["HF_HUB_ENABLE_HF_TRANSFER"] == "1" and importlib.util.find_spec("hf_transfer")
+    else "huggingface_hub"
+)
+
+_SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+_print_lock = threading.Lock()
+
+
+def _log(msg: str) -> None:
+    with _print_lock:
+        print(f"[models] {msg}", flush=True)
 
 
 @dataclass(frozen=True)
@@ -16,12 +62,192 @@ class ModelSpec:
     filename: str
     dest_path: str
     revision: str = "main"
+    size: Optional[int] = None
+    sha256: Optional[str] = None
+    # Companion files (e.g. ONNX external weights) load together with this file name.
+    needed_with: Optional[str] = None
+
+
+@dataclass
+class FileReport:
+    dest_path: str
+    status: str = "pending"
+    bytes: int = 0
+    transfer: Optional[str] = None
+    seconds: float = 0.0
+    download_seconds: float = 0.0
+    verify_seconds: float = 0.0
+    mb_per_s: float = 0.0
+    sha256: Optional[str] = None
+    verified: bool = False
+    attempts: int = 0
+    error: Optional[str] = None
+
+
+class IntegrityError(Exception):
+    pass
+
+
+def load_manifest(path: str = MANIFEST_PATH) -> List[ModelSpec]:
+    with open(path, "r") as f:
+        manifest = json.load(f)
+    fields = ModelSpec.__dataclass_fields__
+    return [ModelSpec(**{k: v for k, v in entry.items() if k in fields}) for entry in manifest["files"]]
+
+
+def order_by_first_use(specs: List[ModelSpec], workflow: dict) -> List[ModelSpec]:
+    """
+    Sort specs by the point at which the workflow first needs them.
+
+    Walks the graph depth-first from its sink nodes, dependencies before dependents (the
+    order ComfyUI resolves them in), and records the first node referencing each model
+    file name. Files the workflow never names (e.g. the fp16 SAM2 variant) go last.
+    """
+    referenced = {
+        str(src)
+        for node in workflow.values()
+        for value in (node.get("inputs") or {}).values()
+        if isinstance(value, list) and len(value) == 2
+        for src in value[:1]
+    }
+    sinks = [node_id for node_id in workflow if node_id not in referenced]
+
+    first_use = {}
+    visited = set()
+
+    def visit(node_id):
+        if node_id in visited or node_id not in workflow:
+            return
+        visited.add(node_id)
+        for value in (workflow[node_id].get("inputs") or {}).values():
+            if isinstance(value, list) and len(value) == 2:
+                visit(str(value[0]))
+        for value in (workflow[node_id].get("inputs") or {}).values():
+            if isinstance(value, str):
+                first_use.setdefault(os.path.basename(value), len(first_use))
+
+    for sink in sinks:
+        visit(sink)
+
+    def priority(spec):
+        name = spec.needed_with or os.path.basename(spec.dest_path)
+        return first_use.get(name, len(first_use))
+
+    return sorted(specs, key=priority)
+
+
+class StatusBoard:
+    """Thread-safe writer for the model readiness file (see model_status.py)."""
+
+    def __init__(self, specs: List[ModelSpec], path: str = STATUS_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._files = {
+            spec.dest_path: {
+                "status": "pending",
+                "priority": i,
+                "repo_id": spec.repo_id,
+                "filename": spec.filename,
+                "needed_with": spec.needed_with,
+            }
+            for i, spec in enumerate(specs)
+        }
+        self._flush()
+
+    def _flush(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        write_status(self._files, self.path)
+
+    def update(self, dest_path: str, status: str, error: Optional[str] = None) -> None:
+        with self._lock:
+            entry = self._files.setdefault(dest_path, {})
+            entry["status"] = status
+            if error:
+                entry["error"] = error
+            self._flush()
+
+
+def _marker_path(dest: str) -> str:
+    return dest + ".verified.json"
+
+
+def _read_marker(dest: str) -> Optional[dict]:
+    try:
+        with open(_marker_path(dest), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_marker(dest: str, sha256: Optional[str]) -> None:
+    st = os.stat(dest)
+    with open(_marker_path(dest), "w") as f:
+        json.dump({"size": st.st_size, "mtime": st.st_mtime, "sha256": sha256}, f)
+
+
+def _hash_file(path: str, h=None):
+    h = h or hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h
+
+
+def resolve_expected(spec: ModelSpec) -> ModelSpec:
+    """Fill in size/sha256 from Hugging Face metadata when the manifest leaves them null."""
+    if spec.size is not None and spec.sha256:
+        return spec
+    meta = get_hf_file_metadata(
+        hf_hub_url(spec.repo_id, spec.filename, revision=spec.revision),
+        token=HF_TOKEN,
+    )
+    # For LFS/xet files the ETag is the sha256 of the content; for small git files it isn't.
+    etag = (meta.etag or "").strip('"').lower()
+    sha256 = spec.sha256 or (etag if _SHA256_RE.match(etag) else None)
+    size = spec.size if spec.size is not None else meta.size
+    return ModelSpec(spec.repo_id, spec.filename, spec.dest_path, spec.revision, size, sha256, spec.needed_with)
+
+
+def _marker_matches(spec: ModelSpec) -> bool:
+    """Fast path: a previous run verified this exact file (no network, no hashing)."""
+    marker = _read_marker(spec.dest_path)
+    if not marker or not os.path.exists(spec.dest_path):
+        return False
+    st = os.stat(spec.dest_path)
+    return (
+        marker.get("size") == st.st_size
+        and marker.get("mtime") == st.st_mtime
+        and (spec.size is None or spec.size == st.st_size)
+        and (not spec.sha256 or marker.get("sha256") == spec.sha256)
+    )
+
+
+def is_present(spec: ModelSpec) -> bool:
+    """
+    True if dest_path holds the expected file.
+
+    A sidecar marker (size + mtime + sha256) written after verification makes the common
+    "already downloaded" boot path a stat() instead of re-hashing tens of GB.
+    """
+    if not os.path.exists(spec.dest_path):
+        return False
+    st = os.stat(spec.dest_path)
+    if st.st_size == 0 or (spec.size is not None and st.st_size != spec.size):
+        return False
+    marker = _read_marker(spec.dest_path)
+    if marker and marker.get("size") == st.st_size and marker.get("mtime") == st.st_mtime:
+        return not spec.sha256 or marker.get("sha256") == spec.sha256
+    if spec.sha256:
+        actual = _hash_file(spec.dest_path).hexdigest()
+        if actual != spec.sha256:
+            _log(f"checksum mismatch, re-downloading: {spec.dest_path}")
+            return False
+    _write_marker(spec.dest_path, spec.sha256)
+    return True
 
 
 def _link_or_copy(src: str, dest: str) -> None:
     os.makedirs(os.path.dirname(dest), exist_ok=True)
-    if os.path.exists(dest) and os.path.getsize(dest) > 0:
-        return
     # huggingface_hub may return a symlink inside the snapshot; ComfyUI model discovery
     # can reject broken links. Resolve to the underlying blob file before linking/copying.
     src_real = os.path.realpath(src)
@@ -36,90 +262,164 @@ def _link_or_copy(src: str, dest: str) -> None:
     os.replace(tmp, dest)
 
 
-def download_models() -> None:
-    specs = [
-        ModelSpec(
-            repo_id="Kijai/WanVideo_comfy",
-            filename="Wan2_1_VAE_bf16.safetensors",
-            dest_path="/ComfyUI/models/vae/Wan2_1_VAE_bf16.safetensors",
-        ),
-        ModelSpec(
-            repo_id="Comfy-Org/Wan_2.1_ComfyUI_repackaged",
-            filename="split_files/clip_vision/clip_vision_h.safetensors",
-            dest_path="/ComfyUI/models/clip_vision/clip_vision_h.safetensors",
-        ),
-        ModelSpec(
-            repo_id="Kijai/WanVideo_comfy",
-            filename="umt5-xxl-enc-bf16.safetensors",
-            dest_path="/ComfyUI/models/text_encoders/umt5-xxl-enc-bf16.safetensors",
-        ),
-        ModelSpec(
-            repo_id="Kijai/WanVideo_comfy_fp8_scaled",
-            filename="Wan22Animate/Wan2_2-Animate-14B_fp8_e4m3fn_scaled_KJ.safetensors",
-            dest_path="/ComfyUI/models/diffusion_models/Wan2_2-Animate-14B_fp8_e4m3fn_scaled_KJ.safetensors",
-        ),
-        ModelSpec(
-            repo_id="eddy1111111/lightx2v_it2v_adaptive_fusionv_1.safetensors",
-            filename="lightx2v_elite_it2v_animate_face.safetensors",
-            dest_path="/ComfyUI/models/loras/lightx2v_elite_it2v_animate_face.safetensors",
-        ),
-        ModelSpec(
-            repo_id="eddy1111111/lightx2v_it2v_adaptive_fusionv_1.safetensors",
-            filename="WAN22_MoCap_fullbodyCOPY_ED.safetensors",
-            dest_path="/ComfyUI/models/loras/WAN22_MoCap_fullbodyCOPY_ED.safetensors",
-        ),
-        ModelSpec(
-            repo_id="eddy1111111/lightx2v_it2v_adaptive_fusionv_1.safetensors",
-            filename="FullDynamic_Ultimate_Fusion_Elite.safetensors",
-            dest_path="/ComfyUI/models/loras/FullDynamic_Ultimate_Fusion_Elite.safetensors",
-        ),
-        ModelSpec(
-            repo_id="eddy1111111/lightx2v_it2v_adaptive_fusionv_1.safetensors",
-            filename="Wan2.2-Fun-A14B-InP-Fusion-Elite.safetensors",
-            dest_path="/ComfyUI/models/loras/Wan2.2-Fun-A14B-InP-Fusion-Elite.safetensors",
-        ),
-        ModelSpec(
-            repo_id="Wan-AI/Wan2.2-Animate-14B",
-            filename="process_checkpoint/det/yolov10m.onnx",
-            dest_path="/ComfyUI/models/detection/yolov10m.onnx",
-        ),
-        ModelSpec(
-            repo_id="Kijai/vitpose_comfy",
-            filename="onnx/vitpose_h_wholebody_model.onnx",
-            dest_path="/ComfyUI/models/detection/vitpose_h_wholebody_model.onnx",
-        ),
-        ModelSpec(
-            repo_id="Kijai/vitpose_comfy",
-            filename="onnx/vitpose_h_wholebody_data.bin",
-            dest_path="/ComfyUI/models/detection/vitpose_h_wholebody_data.bin",
-        ),
-        ModelSpec(
-            repo_id="Kijai/sam2-safetensors",
-            filename="sam2.1_hiera_base_plus.safetensors",
-            dest_path="/ComfyUI/models/sam2/sam2.1_hiera_base_plus.safetensors",
-        ),
-        # Some nodes auto-download the fp16 variant if missing; prefetch to avoid surprises at runtime.
-        ModelSpec(
-            repo_id="Kijai/sam2-safetensors",
-            filename="sam2.1_hiera_base_plus-fp16.safetensors",
-            dest_path="/ComfyUI/models/sam2/sam2.1_hiera_base_plus-fp16.safetensors",
-        ),
-    ]
-
-    for spec in specs:
-        if os.path.exists(spec.dest_path) and os.path.getsize(spec.dest_path) > 0:
-            print(f"[models] present: {spec.dest_path}", flush=True)
-            continue
-
-        print(f"[models] downloading: {spec.repo_id}::{spec.filename}", flush=True)
-        cached = hf_hub_download(
-            repo_id=spec.repo_id,
-            filename=spec.filename,
-            revision=spec.revision,
+def _hub_download(spec: ModelSpec, report: FileReport, force: bool = False) -> None:
+    """
+    Fetch through huggingface_hub (hf_transfer when installed) into the HF cache, then
+    check size and sha256 of the blob before linking it into place.
+
+    A blob that fails verification is left for the next attempt to replace with
+    `force=True`.
+    """
+    started = time.monotonic()
+    cached = hf_hub_download(
+        spec.repo_id, spec.filename, revision=spec.revision, token=HF_TOKEN, force_download=force
+    )
+    blob = os.path.realpath(cached)
+    report.transfer = TRANSFER
+    report.download_seconds = round(time.monotonic() - started, 2)
+    report.bytes = os.path.getsize(blob)
+
+    started = time.monotonic()
+    digest = _hash_file(blob).hexdigest()
+    report.verify_seconds = round(time.monotonic() - started, 2)
+    if spec.size is not None and report.bytes != spec.size:
+        raise IntegrityError(f"size mismatch for {spec.dest_path}: {report.bytes} != {spec.size}")
+    if spec.sha256 and digest != spec.sha256:
+        raise IntegrityError(f"sha256 mismatch for {spec.dest_path}: {digest} != {spec.sha256}")
+    _link_or_copy(blob, spec.dest_path)
+    _write_marker(spec.dest_path, digest)
+    report.sha256 = digest
+    report.verified = bool(spec.sha256)
+
+
+def fetch_model(spec: ModelSpec) -> FileReport:
+    report = FileReport(dest_path=spec.dest_path)
+    started = time.monotonic()
+    try:
+        if _marker_matches(spec):
+            report.status = "present"
+            report.sha256 = (_read_marker(spec.dest_path) or {}).get("sha256")
+            report.verified = bool(report.sha256)
+            _log(f"present: {spec.dest_path}")
+            return report
+        # Without pinned values and without the Hub (offline / rate-limited) there is
+        # nothing to verify against; a file without a matching marker may be truncated,
+        # so this fails rather than passing it as present.
+        spec = resolve_expected(spec)
+        report.sha256 = spec.sha256
+        if is_present(spec):
+            report.status = "present"
+            report.verified = bool(spec.sha256)
+            _log(f"present: {spec.dest_path}")
+            return report
+
+        # Reuse the Hugging Face cache (e.g. RunPod cached models) when it has the file.
+        cached = try_to_load_from_cache(spec.repo_id, spec.filename, revision=spec.revision)
+        if isinstance(cached, str) and os.path.exists(cached):
+            _link_or_copy(cached, spec.dest_path)
+            if is_present(spec):
+                report.status = "linked"
+                report.verified = bool(spec.sha256)
+                _log(f"linked from HF cache: {spec.dest_path}")
+                return report
+
+        _log(f"downloading ({TRANSFER}): {spec.repo_id}::{spec.filename}")
+        force = False
+        for attempt in range(1, DOWNLOAD_RETRIES + 1):
+            report.attempts = attempt
+            try:
+                _hub_download(spec, report, force=force)
+                break
+            # hf_transfer reports failed transfers as RuntimeError.
+            except (OSError, RuntimeError, IntegrityError) as e:
+                if attempt == DOWNLOAD_RETRIES:
+                    raise
+                # Interrupted transfers resume from the cache's .incomplete file; a
+                # corrupt blob has to be fetched again from scratch.
+                force = isinstance(e, IntegrityError)
+                _log(f"retrying {spec.filename} after attempt {attempt}: {e}")
+                time.sleep(min(30, 2 ** attempt))
+        report.status = "downloaded"
+        _log(f"ready: {spec.dest_path}")
+    except Exception as e:
+        report.status = "failed"
+        report.error = f"{type(e).__name__}: {e}"
+        _log(f"FAILED: {spec.dest_path}: {report.error}")
+    finally:
+        report.seconds = round(time.monotonic() - started, 2)
+        if report.bytes and report.download_seconds:
+            report.mb_per_s = round(report.bytes / (1024 * 1024) / report.download_seconds, 1)
+    return report
+
+
+def write_report(reports: List[FileReport], wall_seconds: float) -> None:
+    payload = {
+        "wall_seconds": round(wall_seconds, 2),
+        "bytes": sum(r.bytes for r in reports),
+        "workers": DOWNLOAD_WORKERS,
+        "transfer": TRANSFER,
+        "files": [asdict(r) for r in reports],
+    }
+    os.makedirs(os.path.dirname(REPORT_PATH) or ".", exist_ok=True)
+    with open(REPORT_PATH, "w") as f:
+        json.dump(payload, f, indent=2)
+    _log(f"report: {REPORT_PATH} ({payload['bytes'] / 1e9:.1f}GB in {payload['wall_seconds']}s)")
+
+
+def download_models(specs: Optional[List[ModelSpec]] = None) -> List[FileReport]:
+    specs = specs if specs is not None else load_manifest()
+    try:
+        with open(WORKFLOW_PATH, "r") as f:
+            specs = order_by_first_use(specs, json.load(f))
+    except (OSError, ValueError) as e:
+        _log(f"workflow not readable ({e}); keeping manifest order")
+    board = StatusBoard(specs)
+
+    def run(spec: ModelSpec) -> FileReport:
+        board.update(spec.dest_path, "downloading")
+        report = fetch_model(spec)
+        board.update(spec.dest_path, report.status, report.error if report.status == "failed" else None)
+        return report
+
+    started = time.monotonic()
+    # The pool starts work in submission order, so earlier-needed files land first.
+    with ThreadPoolExecutor(max_workers=max(1, DOWNLOAD_WORKERS)) as pool:
+        reports = list(pool.map(run, specs))
+    write_report(reports, time.monotonic() - started)
+    return reports
+
+
+def pin_manifest(path: str = MANIFEST_PATH) -> None:
+    """
+    Fill in null size/sha256 from Hugging Face metadata and pin each file's revision to the
+    commit it resolved to, so later downloads verify without reaching the Hub first.
+    """
+    with open(path, "r") as f:
+        manifest = json.load(f)
+    for entry in manifest["files"]:
+        meta = get_hf_file_metadata(
+            hf_hub_url(entry["repo_id"], entry["filename"], revision=entry.get("revision", "main")),
+            token=HF_TOKEN,
         )
-        _link_or_copy(cached, spec.dest_path)
-        print(f"[models] ready: {spec.dest_path}", flush=True)
+        etag = (meta.etag or "").strip('"').lower()
+        if not entry.get("sha256"):
+            if not _SHA256_RE.match(etag):
+                _log(f"no sha256 in metadata (not an LFS file?), left unpinned: {entry['filename']}")
+                continue
+            entry["sha256"] = etag
+        entry["size"] = entry.get("size") or meta.size
+        entry["revision"] = meta.commit_hash or entry.get("revision", "main")
+        _log(f"pinned {entry['repo_id']}::{entry['filename']} @ {entry['revision'][:12]}")
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+        f.write("\n")
+    os.replace(tmp, path)
 
 
 if __name__ == "__main__":
-    download_models()
+    if sys.argv[1:] == ["--pin"]:
+        pin_manifest()
+        sys.exit(0)
+    results = download_models()
+    sys.exit(1 if any(r.status == "failed" for r in results) else 0)
@@ -0,0 +1,202 @@
+"""
+Embedding caches for the conditioning nodes of `workflow_replace.json`.
+
+Text embeddings (node 65, WanVideoTextEncodeCached) are keyed by the text encoder's sha256
+(pinned in the model manifest, or recorded when the download was verified), precision and
+both prompts. On a hit node 65 is replaced by a loader node, so the umt5-xxl
+encoder is never loaded; on a miss a save node captures the embeddings for next time.
+
+CLIP-vision embeddings (node 70, WanVideoClipVisionEncode) are keyed by the pixel content of
+the reference image plus the resize/encode parameters, so repeat avatars skip loading and
+running clip_vision_h (node 71).
+"""
+
+import functools
+import hashlib
+import json
+import os
+
+TEXT_ENCODE_NODE_ID = "65"
+CLIP_ENCODE_NODE_ID = "70"
+CLIP_LOADER_NODE_ID = "71"
+IMAGE_RESIZE_NODE_ID = "64"
+EMBED_SUFFIX = ".pt"
+
+_TEXT_SAVE_NODE_ID = "9100"
+_TEXT_LOAD_NODE_ID = "9101"
+_CLIP_SAVE_NODE_ID = "9102"
+_CLIP_LOAD_NODE_ID = "9103"
+
+_fingerprints = {}
+
+
+def file_fingerprint(path: str, sample_bytes: int = 4 * 1024 * 1024) -> str:
+    """
+    Cheap identity for multi-GB model files: size plus sha256 of the head and tail.
+
+    Memoized per (path, size, mtime) so each worker hashes the encoder at most once.
+    """
+    st = os.stat(path)
+    memo_key = (path, st.st_size, st.st_mtime)
+    if memo_key not in _fingerprints:
+        h = hashlib.sha256(str(st.st_size).encode("utf-8"))
+        with open(path, "rb") as f:
+            h.update(f.read(sample_bytes))
+            if st.st_size > sample_bytes:
+                f.seek(max(sample_bytes, st.st_size - sample_bytes))
+                h.update(f.read(sample_bytes))
+        _fingerprints[memo_key] = h.hexdigest()
+    return _fingerprints[memo_key]
+
+
+def pinned_sha256(manifest_path: str, model_name: str):
+    """sha256 the model manifest (download_models.py) pins for `model_name`, or None."""
+    try:
+        with open(manifest_path, "r") as f:
+            files = json.load(f)["files"]
+    except (OSError, ValueError, KeyError):
+        return None
+    for entry in files:
+        if os.path.basename(entry["dest_path"]) == model_name:
+            return entry.get("sha256")
+    return None
+
+
+def verified_sha256(path: str):
+    """
+    sha256 recorded by download_models.py in `<path>.verified.json` when it verified the
+    file, or None if there is no marker or the file changed since.
+    """
+    try:
+        with open(path + ".verified.json", "r") as f:
+            marker = json.load(f)
+        st = os.stat(path)
+    except (OSError, ValueError):
+        return None
+    if marker.get("size") != st.st_size or marker.get("mtime") != st.st_mtime:
+        return None
+    return marker.get("sha256")
+
+
+def text_embeds_key(workflow: dict, text_encoder_dir: str, manifest_path: str = None):
+    """
+    Return the cache key for node 65's output, or None while the encoder is unidentified.
+
+    The encoder is identified by content: the sha256 pinned in the manifest (known before
+    the multi-GB file has finished downloading), else the digest download_models.py
+    recorded when it verified the file, else a fingerprint of the file itself.
+    """
+    inputs = workflow[TEXT_ENCODE_NODE_ID]["inputs"]
+    encoder_path = os.path.join(text_encoder_dir, inputs["model_name"])
+    sha256 = (pinned_sha256(manifest_path, inputs["model_name"]) if manifest_path else None) or verified_sha256(
+        encoder_path
+    )
+    if sha256:
+        encoder = f"sha256:{sha256}"
+    elif os.path.isfile(encoder_path):
+        encoder = file_fingerprint(encoder_path)
+    else:
+        return None
+    params = {
+        "encoder": encoder,
+        "precision": inputs.get("precision"),
+        "quantization": inputs.get("quantization"),
+        "positive": inputs["positive_prompt"],
+        "negative": inputs["negative_prompt"],
+    }
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def image_content_sha256(path: str) -> str:
+    """
+    sha256 of the decoded RGB pixels (plus size), so metadata-only differences between
+    uploads of the same image still hit. Falls back to the file bytes without Pillow.
+
+    Memoized per (path, size, mtime): the CLIP embed cache and result dedup both key on it.
+    """
+    st = os.stat(path)
+    return _image_content_sha256(os.path.realpath(path), st.st_size, st.st_mtime_ns)
+
+
+@functools.lru_cache(maxsize=256)
+def _image_content_sha256(path: str, size: int, mtime_ns: int) -> str:
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+    with Image.open(path) as img:
+        img = ImageOps.exif_transpose(img).convert("RGB")
+        h = hashlib.sha256(f"{img.width}x{img.height}".encode("utf-8"))
+        h.update(img.tobytes())
+    return h.hexdigest()
+
+
+def clip_embeds_key(image_sha256: str, workflow: dict) -> str:
+    """Key node 70's output by image content and everything between LoadImage and the encoder."""
+    resize = dict(workflow[IMAGE_RESIZE_NODE_ID]["inputs"])
+    resize.pop("image", None)
+    encode = dict(workflow[CLIP_ENCODE_NODE_ID]["inputs"])
+    encode.pop("clip_vision", None)
+    encode.pop("image_1", None)
+    params = {
+        "image": image_sha256,
+        "width": workflow["150"]["inputs"]["value"],
+        "height": workflow["151"]["inputs"]["value"],
+        "resize": resize,
+        "encode": encode,
+        "clip_vision": workflow[CLIP_LOADER_NODE_ID]["inputs"]["clip_name"],
+    }
+    return hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def _rewire(workflow: dict, source: tuple, target: list) -> None:
+    for node in workflow.values():
+        inputs = node.get("inputs") or {}
+        for input_name, value in inputs.items():
+            if isinstance(value, list) and len(value) == 2 and (str(value[0]), value[1]) == source:
+                inputs[input_name] = target
+
+
+def _capture(workflow: dict, node_id: str, save_id: str, label: str, path: str) -> None:
+    workflow[save_id] = {
+        "inputs": {"value": [node_id, 0], "path": path},
+        "class_type": f"WanAvatarSave{label}",
+        "_meta": {"title": f"Cache {label}"},
+    }
+
+
+def _use_cached(workflow: dict, node_ids: tuple, load_id: str, label: str, path: str) -> None:
+    workflow[load_id] = {
+        "inputs": {"path": path},
+        "class_type": f"WanAvatarLoad{label}",
+        "_meta": {"title": f"Cached {label}"},
+    }
+    _rewire(workflow, (node_ids[0], 0), [load_id, 0])
+    for node_id in node_ids:
+        workflow.pop(node_id, None)
+
+
+def capture_text_embeds(workflow: dict, path: str) -> None:
+    _capture(workflow, TEXT_ENCODE_NODE_ID, _TEXT_SAVE_NODE_ID, "TextEmbeds", path)
+
+
+def use_cached_text_embeds(workflow: dict, path: str) -> None:
+    _use_cached(workflow, (TEXT_ENCODE_NODE_ID,), _TEXT_LOAD_NODE_ID, "TextEmbeds", path)
+
+
+def capture_clip_embeds(workflow: dict, path: str) -> None:
+    _capture(workflow, CLIP_ENCODE_NODE_ID, _CLIP_SAVE_NODE_ID, "ClipEmbeds", path)
+
+
+def use_cached_clip_embeds(workflow: dict, path: str) -> None:
+    # The CLIP-vision loader only feeds node 70, so it goes too.
+    _use_cached(workflow, (CLIP_ENCODE_NODE_ID, CLIP_LOADER_NODE_ID), _CLIP_LOAD_NODE_ID, "ClipEmbeds", path)
+
+
+def text_encode_only_workflow(workflow: dict, path: str) -> dict:
+    """Minimal prompt that runs node 65 and saves its output (used to prime the cache)."""
+    prime = {TEXT_ENCODE_NODE_ID: json.loads(json.dumps(workflow[TEXT_ENCODE_NODE_ID]))}
+    capture_text_embeds(prime, path)
+    return prime
@@ -10,13 +10,50 @@ COMFYUI_USE_SAGE_ATTENTION="${COMFYUI_USE_SAGE_ATTENTION:-false}"
 COMFYUI_EXTRA_ARGS="${COMFYUI_EXTRA_ARGS:-}"
 
 if [ "${DOWNLOAD_MODELS_ON_START:-true}" = "true" ]; then
-    echo "Downloading models (if missing)..."
-    python3 /download_models.py
+    if [ "${LAZY_MODEL_DOWNLOADS:-true}" = "true" ]; then
+        # Files download in first-use order while ComfyUI boots; wan_avatar_nodes makes each
+        # model load wait only for its own file (status in MODEL_STATUS_PATH).
+        echo "Downloading models in the background (if missing)..."
+        python3 /download_models.py &
+    else
+        echo "Downloading models (if missing)..."
+        python3 /download_models.py
+    fi
+fi
+
+# Persist torch.compile (inductor) and Triton caches across restarts, keyed by GPU type,
+# torch version and WanVideoWrapper commit so an incompatible cache is never reused.
+if [ "${PERSIST_COMPILE_CACHE:-true}" = "true" ]; then
+    GPU_NAME="$(nvidia-smi --query-gpu=name --format=csv,noheader 2>/dev/null | head -n1 | tr ' ' '_' | tr -cd 'A-Za-z0-9._-' || true)"
+    TORCH_VERSION="$(python3 -c 'import torch; print(torch.__version__)' 2>/dev/null || echo unknown)"
+    COMPILE_CACHE_KEY="${GPU_NAME:-unknown-gpu}__torch-${TORCH_VERSION}__wan-${WAN_WRAPPER_COMMIT:-unknown}"
+    COMPILE_CACHE_DIR="${COMPILE_CACHE_ROOT:-${CACHE_ROOT:-/cache}/compile}/${COMPILE_CACHE_KEY}"
+    mkdir -p "${COMPILE_CACHE_DIR}/inductor" "${COMPILE_CACHE_DIR}/triton"
+    export TORCHINDUCTOR_CACHE_DIR="${COMPILE_CACHE_DIR}/inductor"
+    export TRITON_CACHE_DIR="${COMPILE_CACHE_DIR}/triton"
+    export TORCHINDUCTOR_FX_GRAPH_CACHE=1
+    export TORCHINDUCTOR_AUTOGRAD_CACHE=1
+    echo "Compile cache: ${COMPILE_CACHE_DIR}"
 fi
 
-# Start ComfyUI in the background
-echo "Starting ComfyUI in the background..."
-COMFY_ARGS=(--listen 0.0.0.0 --port "${COMFYUI_PORT}")
+# One ComfyUI per GPU: COMFYUI_INSTANCES=auto starts one per visible GPU, each pinned with
+# CUDA_VISIBLE_DEVICES on COMFYUI_PORT+i. The handler routes jobs between them.
+COMFYUI_INSTANCES="${COMFYUI_INSTANCES:-1}"
+if [ "${COMFYUI_INSTANCES}" = "auto" ]; then
+    COMFYUI_INSTANCES="$(nvidia-smi -L 2>/dev/null | grep -c '^GPU' || true)"
+    if [ "${COMFYUI_INSTANCES:-0}" -lt 1 ]; then
+        COMFYUI_INSTANCES=1
+    fi
+fi
+# Optional explicit device list (comma-separated), defaults to 0..N-1.
+IFS=',' read -r -a GPU_IDS <<< "${COMFYUI_GPU_IDS:-$(seq -s, 0 $((COMFYUI_INSTANCES - 1)))}"
+if [ "${#GPU_IDS[@]}" -lt "${COMFYUI_INSTANCES}" ]; then
+    echo "Error: COMFYUI_GPU_IDS lists ${#GPU_IDS[@]} device(s) (${COMFYUI_GPU_IDS:-}) for ${COMFYUI_INSTANCES} instances"
+    exit 1
+fi
+export COMFYUI_INSTANCES COMFYUI_PORT
+
+COMFY_ARGS=(--listen 0.0.0.0)
 if [ "${COMFYUI_USE_SAGE_ATTENTION}" = "true" ]; then
   COMFY_ARGS+=(--use-sage-attention)
 fi
@@ -25,17 +62,51 @@ if [ -n "${COMFYUI_EXTRA_ARGS}" ]; then
   # shellcheck disable=SC2206
   COMFY_ARGS+=(${COMFYUI_EXTRA_ARGS})
 fi
-python3 -u /ComfyUI/main.py "${COMFY_ARGS[@]}" &
 
-# Wait for ComfyUI to be ready
+start_comfyui() {
+    local i="$1"
+    local args=("${COMFY_ARGS[@]}" --port "$((COMFYUI_PORT + i))")
+    if [ "${COMFYUI_INSTANCES}" -gt 1 ]; then
+        # Separate output/temp dirs so output counters of different instances never collide
+        # (the handler expects these paths).
+        args+=(--output-directory "/ComfyUI/output/gpu${i}" --temp-directory "/tmp/comfyui_gpu${i}")
+        CUDA_VISIBLE_DEVICES="${GPU_IDS[$i]}" python3 -u /ComfyUI/main.py "${args[@]}"
+    else
+        python3 -u /ComfyUI/main.py "${args[@]}"
+    fi
+}
+
+# Restart an instance if it crashes (e.g. CUDA error); backoff grows to 30s.
+supervise_comfyui() {
+    local i="$1" restarts=0 status
+    while true; do
+        start_comfyui "$i" && status=0 || status=$?
+        restarts=$((restarts + 1))
+        echo "ComfyUI instance ${i} exited with status ${status}; restart #${restarts}"
+        sleep $(( restarts < 6 ? restarts * 5 : 30 ))
+    done
+}
+
+echo "Starting ${COMFYUI_INSTANCES} ComfyUI instance(s) in the background..."
+for ((i = 0; i < COMFYUI_INSTANCES; i++)); do
+    supervise_comfyui "$i" &
+done
+
+# Wait for every instance to be ready
 echo "Waiting for ComfyUI to be ready..."
 wait_count=0
 while [ $wait_count -lt "${COMFYUI_READY_TIMEOUT}" ]; do
-    if curl -s "http://${COMFYUI_HOST}:${COMFYUI_PORT}/" > /dev/null 2>&1; then
+    ready=0
+    for ((i = 0; i < COMFYUI_INSTANCES; i++)); do
+        if curl -s "http://${COMFYUI_HOST}:$((COMFYUI_PORT + i))/" > /dev/null 2>&1; then
+            ready=$((ready + 1))
+        fi
+    done
+    if [ "$ready" -eq "${COMFYUI_INSTANCES}" ]; then
         echo "ComfyUI is ready!"
         break
     fi
-    echo "Waiting for ComfyUI... (${wait_count}/${COMFYUI_READY_TIMEOUT})"
+    echo "Waiting for ComfyUI... ${ready}/${COMFYUI_INSTANCES} ready (${wait_count}/${COMFYUI_READY_TIMEOUT})"
     sleep 2
     wait_count=$((wait_count + 2))
 done
@@ -45,6 +116,7 @@ if [ $wait_count -ge "${COMFYUI_READY_TIMEOUT}" ]; then
     exit 1
 fi
 
-# Start the handler in the foreground
+# Start the handler in the foreground. With WARMUP_ON_START=true (default) it renders a short
+# warmup clip before registering with RunPod, so the worker only reports ready once warm.
 echo "Starting the handler..."
 exec python handler.py
@@ -1,22 +1,74 @@
 import runpod
+import asyncio
+import copy
 import os
 import websocket
-import base64
+import binascii
+import functools
+import hashlib
 import json
+import math
 import uuid
 import logging
+import urllib.error
+import urllib.parse
 import urllib.request
 import time
 import random
+import queue
 import shutil
 import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
 from datetime import datetime
 
+from b64stream import decode_to_file, encode_file
+from embed_cache import (
+    EMBED_SUFFIX,
+    capture_clip_embeds,
+    capture_text_embeds,
+    clip_embeds_key,
+    image_content_sha256,
+    text_embeds_key,
+    text_encode_only_workflow,
+    use_cached_clip_embeds,
+    use_cached_text_embeds,
+)
+from http_download import DownloadTooLarge
+from http_download import download as http_download
+from http_download import probe as http_probe
+from input_cache import InputCache, cache_key, link_or_copy
+from input_probe import ProbeError, probe_image, probe_video
+from interpolate import get_interpolator
+from loop_synth import MODES as LOOP_MODES
+from loop_synth import make_loop
+from model_status import read_status, wait_for_files
+from preprocess_cache import (
+    ARTIFACT_SUFFIX,
+    ARTIFACTS,
+    add_capture_nodes,
+    file_sha256,
+    preprocess_key,
+    use_cached_artifacts,
+)
+from segments import SegmentStitcher, count_frames, hls_playlist, plan_segments
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 server_address = os.getenv("SERVER_ADDRESS", "127.0.0.1")
 client_id = str(uuid.uuid4())
+# One ComfyUI per GPU on consecutive ports (entrypoint.sh resolves COMFYUI_INSTANCES=auto);
+# with several instances each writes to its own output/temp directory.
+COMFYUI_PORT = int(os.getenv("COMFYUI_PORT", "8188"))
+COMFYUI_INSTANCES = max(1, int(os.getenv("COMFYUI_INSTANCES", "1")))
+COMFYUI_HEALTH_TTL_S = float(os.getenv("COMFYUI_HEALTH_TTL_S", "5"))
+# A prompt fails with no_instance once no ComfyUI instance has been healthy for this long
+# (waiting for a slot on a healthy but busy instance does not count).
+COMFYUI_READY_TIMEOUT_S = float(os.getenv("COMFYUI_READY_TIMEOUT_S", "600"))
 
 # MinIO config from environment
 MINIO_ENDPOINT = os.getenv("MINIO_ENDPOINT", "twin-storage.dexsync.com")
@@ -25,6 +77,11 @@ MINIO_SECRET_KEY = os.getenv("MINIO_SECRET_KEY", "")
 MINIO_BUCKET = os.getenv("MINIO_BUCKET", "avatars")
 MINIO_USE_SSL = os.getenv("MINIO_USE_SSL", "false").lower() == "true"
 DEFAULT_DRIVING_VIDEO_PATH = os.getenv("DEFAULT_DRIVING_VIDEO_PATH", "")
+# Upload tuning: multipart part size (MiB, min 5), parts uploaded in parallel per object,
+# and pooled HTTP connections shared by every MinIO call in the process.
+MINIO_PART_SIZE_MB = max(5, int(os.getenv("MINIO_PART_SIZE_MB", "16")))
+MINIO_UPLOAD_CONCURRENCY = int(os.getenv("MINIO_UPLOAD_CONCURRENCY", "4"))
+MINIO_POOL_SIZE = int(os.getenv("MINIO_POOL_SIZE", "16"))
 
 # Fixed generation parameters
 FPS = 24
@@ -58,8 +115,155 @@ WORKFLOW_PATH = os.getenv(
     else os.path.join(_REPO_DIR, "workflow_replace.json"),
 )
 COMFY_INPUT_DIR = "/ComfyUI/input"
+COMFY_MODELS_DIR = "/ComfyUI/models"
+# Nodes that resolve (or auto-download) model files themselves instead of through
+# folder_paths, so the ComfyUI-side download gate can't see them: class_type -> subfolder.
+UNGATED_MODEL_NODES = {"DownloadAndLoadSAM2Model": "sam2"}
+# Local caches live on container disk by default; point CACHE_ROOT at a network volume to
+# share them across workers.
+CACHE_ROOT = os.getenv("CACHE_ROOT", "/cache")
+INPUT_CACHE_ENABLED = os.getenv("INPUT_CACHE_ENABLED", "true").lower() == "true"
+INPUT_CACHE_DIR = os.getenv("INPUT_CACHE_DIR", os.path.join(CACHE_ROOT, "inputs"))
+INPUT_CACHE_MAX_MB = int(os.getenv("INPUT_CACHE_MAX_MB", "4096"))
+# Driving-video preprocessing artifacts (pose renders, face crops, SAM2 mask). Requires the
+# wan_avatar_nodes custom node pack. Set PREPROCESS_CACHE_MINIO_PREFIX to share artifacts
+# across workers through MINIO_BUCKET.
+PREPROCESS_CACHE_ENABLED = os.getenv("PREPROCESS_CACHE_ENABLED", "true").lower() == "true"
+PREPROCESS_CACHE_DIR = os.getenv("PREPROCESS_CACHE_DIR", os.path.join(CACHE_ROOT, "preprocess"))
+PREPROCESS_CACHE_MAX_MB = int(os.getenv("PREPROCESS_CACHE_MAX_MB", "20480"))
+PREPROCESS_CACHE_MINIO_PREFIX = os.getenv("PREPROCESS_CACHE_MINIO_PREFIX", "").strip("/")
+# Text (node 65) and CLIP-vision (node 70) embeddings. With a persistent CACHE_ROOT or EMBED_CACHE_MINIO_PREFIX, a fresh
+# worker never has to load the umt5-xxl encoder for prompts it has seen before.
+EMBED_CACHE_ENABLED = os.getenv("EMBED_CACHE_ENABLED", "true").lower() == "true"
+EMBED_CACHE_DIR = os.getenv("EMBED_CACHE_DIR", os.path.join(CACHE_ROOT, "embeds"))
+EMBED_CACHE_MAX_MB = int(os.getenv("EMBED_CACHE_MAX_MB", "2048"))
+EMBED_CACHE_MINIO_PREFIX = os.getenv("EMBED_CACHE_MINIO_PREFIX", "").strip("/")
+CLIP_EMBED_CACHE_ENABLED = os.getenv("CLIP_EMBED_CACHE_ENABLED", "true").lower() == "true"
+PRIME_TEXT_EMBEDS = os.getenv("PRIME_TEXT_EMBEDS", "true").lower() == "true"
+TEXT_ENCODER_DIR = os.path.join(COMFY_MODELS_DIR, "text_encoders")
+# Same lookup as download_models.py; identifies the text encoder for the embed cache key.
+MODELS_MANIFEST = os.getenv(
+    "MODELS_MANIFEST",
+    "/models_manifest.json"
+    if os.path.exists("/models_manifest.json")
+    else os.path.join(os.path.dirname(os.path.abspath(__file__)), "models_manifest.json"),
+)
+# Result deduplication: a job identical to a completed one (same image and driving video
+# content, prompts, render options and seed, or the same idempotency_key when unseeded)
+# gets the earlier output copied to its own output keys. The index is kept locally and, so retries that land
+# on another worker also hit, under RESULT_INDEX_MINIO_PREFIX (empty disables).
+RESULT_DEDUP_ENABLED = os.getenv("RESULT_DEDUP_ENABLED", "true").lower() == "true"
+RESULT_INDEX_DIR = os.getenv("RESULT_INDEX_DIR", os.path.join(CACHE_ROOT, "results"))
+RESULT_INDEX_MINIO_PREFIX = os.getenv("RESULT_INDEX_MINIO_PREFIX", "result-index").strip("/")
+# Warmup: render a short clip per WARMUP_BUCKETS resolution before taking jobs so torch.compile (node 35,
+# dynamic=False) is done before the first customer job. WARMUP_FRAMES=0 uses the sampler's
+# frame window size so the compiled shapes match real jobs.
+WARMUP_ON_START = os.getenv("WARMUP_ON_START", "true").lower() == "true"
+WARMUP_DRIVING_VIDEO_PATH = os.getenv("WARMUP_DRIVING_VIDEO_PATH", "")
+WARMUP_TEMPLATE_ID = os.getenv("WARMUP_TEMPLATE_ID", "")
+WARMUP_FRAMES = int(os.getenv("WARMUP_FRAMES", "0"))
+# image_url / driving_video_url downloads: parallel Range connections, retries per
+# request, socket timeout (a stalled connection is retried from its last byte) and
+# size limits checked before the body is fetched.
+URL_DOWNLOAD_CONNECTIONS = int(os.getenv("URL_DOWNLOAD_CONNECTIONS", "4"))
+URL_DOWNLOAD_RETRIES = int(os.getenv("URL_DOWNLOAD_RETRIES", "4"))
+URL_DOWNLOAD_TIMEOUT_S = float(os.getenv("URL_DOWNLOAD_TIMEOUT_S", "30"))
+MAX_IMAGE_MB = float(os.getenv("MAX_IMAGE_MB", "30"))
+MAX_VIDEO_MB = float(os.getenv("MAX_VIDEO_MB", "500"))
 BASE64_FALLBACK_MAX_MB = int(os.getenv("BASE64_FALLBACK_MAX_MB", "80"))
+# Admission control, checked on the probed inputs before anything is queued (0 disables a
+# limit). Driving videos over MAX_DRIVING_FRAMES (counted at FPS) are rejected, or cut to
+# the limit when ADMISSION_AUTO_TRIM (or the job's "auto_trim") is set.
+MAX_DRIVING_FRAMES = int(os.getenv("MAX_DRIVING_FRAMES", str(120 * 24)))
+MAX_VIDEO_PIXELS = int(os.getenv("MAX_VIDEO_PIXELS", str(2560 * 1440)))
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", str(36 * 1000 * 1000)))
+ALLOWED_VIDEO_CODECS = {
+    c.strip() for c in os.getenv("ALLOWED_VIDEO_CODECS", "h264,hevc,vp8,vp9,av1,mpeg4,mjpeg,prores").split(",") if c.strip()
+}
+ADMISSION_AUTO_TRIM = os.getenv("ADMISSION_AUTO_TRIM", "false").lower() == "true"
+# Cost estimate: fixed per-prompt overhead plus sampler seconds per rendered frame per
+# megapixel. Calibrate from node_timings / TIMINGS_LOG_PATH on the target GPU.
+COST_OVERHEAD_S = float(os.getenv("COST_OVERHEAD_S", "20"))
+COST_S_PER_MEGAPIXEL_FRAME = float(os.getenv("COST_S_PER_MEGAPIXEL_FRAME", "2.5"))
+# Fail-fast deadlines (seconds, 0 disables). NODE_TIMEOUTS_JSON overrides per class_type,
+# e.g. {"WanVideoSampler": 1800, "Sam2Segmentation": 300}.
+JOB_TIMEOUT_S = float(os.getenv("JOB_TIMEOUT_S", "3000"))
+NODE_TIMEOUT_S = float(os.getenv("NODE_TIMEOUT_S", "0"))
+NODE_TIMEOUTS = json.loads(os.getenv("NODE_TIMEOUTS_JSON", "{}") or "{}")
+WS_POLL_INTERVAL_S = float(os.getenv("WS_POLL_INTERVAL_S", "5"))
+# Concurrent jobs per worker (RunPod concurrency_modifier; defaults to one per ComfyUI
+# instance). Above 1 the handler runs async:
+# inputs for the next job download and stage while ComfyUI executes the current prompt.
+# MAX_PROMPTS_IN_FLIGHT bounds how many prompts sit in each ComfyUI instance's queue.
+MAX_CONCURRENT_JOBS = int(os.getenv("MAX_CONCURRENT_JOBS", str(COMFYUI_INSTANCES)))
+MAX_PROMPTS_IN_FLIGHT = int(os.getenv("MAX_PROMPTS_IN_FLIGHT", "2"))
+# Minimum seconds between RunPod progress updates for sampler steps (node changes always go out).
+PROGRESS_UPDATE_INTERVAL_S = float(os.getenv("PROGRESS_UPDATE_INTERVAL_S", "2"))
+# Per-job phase timings are appended here as JSONL (empty disables).
+TIMINGS_LOG_PATH = os.getenv("TIMINGS_LOG_PATH", "/tmp/job_timings.jsonl")
 THUMBNAIL_SIZE = int(os.getenv("THUMBNAIL_SIZE", "512"))
+# Driving videos longer than SEGMENT_SECONDS (0 disables; jobs may set "segment_seconds")
+# render as windows overlapping by SEGMENT_OVERLAP_FRAMES, crossfaded at the seams and
+# published as a growing HLS playlist while later windows render.
+SEGMENT_SECONDS = float(os.getenv("SEGMENT_SECONDS", "0"))
+SEGMENT_OVERLAP_FRAMES = int(os.getenv("SEGMENT_OVERLAP_FRAMES", "12"))
+# Idle loops: when a job sets "loop_seconds", only the first LOOP_RENDER_SECONDS of the
+# driving video are rendered and loop_synth.py repeats them seamlessly on the CPU
+# ("loop_mode": crossfade or pingpong).
+LOOP_RENDER_SECONDS = float(os.getenv("LOOP_RENDER_SECONDS", "5"))
+LOOP_BLEND_FRAMES = int(os.getenv("LOOP_BLEND_FRAMES", "12"))
+# Diffuse the driving video at RENDER_FPS (jobs may set "render_fps"; FPS disables) and
+# interpolate back to FPS on the CPU with FRAME_INTERPOLATOR: minterpolate, blend,
+# duplicate, or module:function for a custom one (see interpolate.py).
+RENDER_FPS = int(os.getenv("RENDER_FPS", str(FPS)))
+FRAME_INTERPOLATOR = os.getenv("FRAME_INTERPOLATOR", "minterpolate")
+# Output resolution buckets (name -> [width, height], multiples of 16). Node 35 compiles
+# with dynamic=False, so every bucket is its own compiled graph; jobs pick one by name or
+# snap to the nearest. VIDEO_WIDTH x VIDEO_HEIGHT is the default (added as "default" if it
+# is not a bucket). WARMUP_BUCKETS (comma-separated) are warmed at start.
+RESOLUTION_BUCKETS = json.loads(os.getenv("RESOLUTION_BUCKETS_JSON", "") or "null") or {
+    "720p": [1280, 720],
+    "720p_portrait": [720, 1280],
+    "540p": [960, 544],
+    "square": [720, 720],
+}
+DEFAULT_RESOLUTION = next(
+    (name for name, size in RESOLUTION_BUCKETS.items() if tuple(size) == (WIDTH, HEIGHT)), "default"
+)
+RESOLUTION_BUCKETS.setdefault(DEFAULT_RESOLUTION, [WIDTH, HEIGHT])
+WARMUP_BUCKETS = [b.strip() for b in os.getenv("WARMUP_BUCKETS", DEFAULT_RESOLUTION).split(",") if b.strip()]
+# Quality tiers ("quality" job input). Draft diffuses at DRAFT_SCALE of the bucket size
+# and DRAFT_RENDER_FPS, then interpolates and upscales to the bucket size at FPS on the CPU.
+QUALITY_TIERS = ("draft", "standard")
+DEFAULT_QUALITY = os.getenv("DEFAULT_QUALITY", "standard")
+DRAFT_SCALE = float(os.getenv("DRAFT_SCALE", "0.6"))
+DRAFT_RENDER_FPS = int(os.getenv("DRAFT_RENDER_FPS", "12"))
+DRAFT_INTERPOLATOR = os.getenv("DRAFT_INTERPOLATOR", "blend")
+# Draft renders at its own (smaller) size, i.e. its own compiled graph: warm each
+# WARMUP_BUCKETS bucket at these tiers (comma-separated; "standard" alone skips draft).
+WARMUP_QUALITIES = [q.strip() for q in os.getenv("WARMUP_QUALITIES", "standard,draft").split(",") if q.strip()]
+
+
+class ComfyExecutionError(Exception):
+    """A prompt failed, was interrupted or ran past its deadline inside ComfyUI."""
+
+    def __init__(self, message, node_id=None, node_type=None, error_type="execution_error", details=None):
+        super().__init__(message)
+        self.node_id = node_id
+        self.node_type = node_type
+        self.error_type = error_type
+        self.details = details or {}
+
+    def to_result(self) -> dict:
+        result = {
+            "error": str(self),
+            "error_type": self.error_type,
+            "node_id": self.node_id,
+            "node_type": self.node_type,
+        }
+        if self.details:
+            result["details"] = self.details
+        return result
 
 
 def _sanitize_minio_key(key: str) -> str:
@@ -107,48 +311,104 @@ def _generate_thumbnail(video_path: str, thumbnail_path: str) -> None:
     subprocess.run(cmd, check=True)
 
 
+_minio_client = None
+_minio_lock = threading.Lock()
+_known_buckets = set()
+
+
 def get_minio_client():
-    from minio import Minio
+    """Process-wide MinIO client; its pooled connections are reused across calls and threads."""
+    global _minio_client
+    if _minio_client is None:
+        with _minio_lock:
+            if _minio_client is None:
+                import certifi
+                import urllib3
+                from minio import Minio
+
+                http_client = urllib3.PoolManager(
+                    maxsize=MINIO_POOL_SIZE,
+                    timeout=urllib3.Timeout(connect=30, read=300),
+                    cert_reqs="CERT_REQUIRED",
+                    ca_certs=os.environ.get("SSL_CERT_FILE") or certifi.where(),
+                    retries=urllib3.Retry(total=5, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504]),
+                )
+                _minio_client = Minio(
+                    MINIO_ENDPOINT,
+                    access_key=MINIO_ACCESS_KEY,
+                    secret_key=MINIO_SECRET_KEY,
+                    secure=MINIO_USE_SSL,
+                    http_client=http_client,
+                )
+    return _minio_client
 
-    return Minio(
-        MINIO_ENDPOINT,
-        access_key=MINIO_ACCESS_KEY,
-        secret_key=MINIO_SECRET_KEY,
-        secure=MINIO_USE_SSL,
-    )
 
+def ensure_bucket(bucket):
+    """Create `bucket` if needed; checked once per process rather than once per upload."""
+    if bucket in _known_buckets:
+        return
+    from minio.error import S3Error
 
-def upload_to_minio(local_path, object_name):
-    """Upload a file to MinIO and return a presigned URL."""
     client = get_minio_client()
+    if not client.bucket_exists(bucket):
+        try:
+            client.make_bucket(bucket)
+        except S3Error as e:
+            if e.code not in ("BucketAlreadyOwnedByYou", "BucketAlreadyExists"):
+                raise
+    _known_buckets.add(bucket)
 
-    if not client.bucket_exists(MINIO_BUCKET):
-        client.make_bucket(MINIO_BUCKET)
 
-    client.fput_object(MINIO_BUCKET, object_name, local_path)
+def upload_to_minio(local_path, object_name, content_type="application/octet-stream"):
+    """Upload a file to MinIO (parallel multipart for large files) and return a presigned URL."""
+    from minio.error import S3Error
+
+    client = get_minio_client()
+    ensure_bucket(MINIO_BUCKET)
+    try:
+        client.fput_object(
+            MINIO_BUCKET,
+            object_name,
+            local_path,
+            content_type=content_type,
+            part_size=MINIO_PART_SIZE_MB * 1024 * 1024,
+            num_parallel_uploads=MINIO_UPLOAD_CONCURRENCY,
+        )
+    except S3Error as e:
+        if e.code == "NoSuchBucket":
+            # Deleted since we memoized it; recheck on the next upload.
+            _known_buckets.discard(MINIO_BUCKET)
+        raise
     logger.info(f"Uploaded to MinIO: {MINIO_BUCKET}/{object_name}")
 
     url = client.presigned_get_object(MINIO_BUCKET, object_name)
     return url
 
 
-def download_file(url, output_path):
-    """Download a file from a URL."""
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    with urllib.request.urlopen(url, timeout=120) as response:
-        with open(output_path, "wb") as f:
-            shutil.copyfileobj(response, f)
-    logger.info(f"Downloaded {url} -> {output_path}")
-    return output_path
+def download_file(url, output_path, max_mb=None, remote=None):
+    """Download a file from a URL (parallel ranges, retries and resume; see http_download.py)."""
+    try:
+        return http_download(
+            url,
+            output_path,
+            max_bytes=int(max_mb * 1024 * 1024) if max_mb else None,
+            connections=URL_DOWNLOAD_CONNECTIONS,
+            retries=URL_DOWNLOAD_RETRIES,
+            timeout=URL_DOWNLOAD_TIMEOUT_S,
+            remote=remote,
+        )
+    except DownloadTooLarge as e:
+        raise InputError(str(e))
 
 
 def save_base64(data, output_path):
-    """Decode base64 data and save to file."""
+    """Decode base64 data to a file in chunks (the payload is never duplicated as bytes)."""
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    decoded = base64.b64decode(data)
-    with open(output_path, "wb") as f:
-        f.write(decoded)
-    logger.info(f"Saved base64 data to {output_path}")
+    try:
+        size = decode_to_file(data, output_path)
+    except (binascii.Error, ValueError) as e:
+        raise InputError(f"Invalid base64 payload for {os.path.basename(output_path)}: {e}")
+    logger.info(f"Saved base64 data to {output_path} ({size} bytes)")
     return output_path
 
 
@@ -161,37 +421,1106 @@ def download_minio_object(object_name, output_path):
     return output_path
 
 
-def queue_prompt(prompt):
-    url = f"http://{server_address}:8188/prompt"
-    p = {"prompt": prompt, "client_id": client_id}
-    data = json.dumps(p).encode("utf-8")
-    req = urllib.request.Request(url, data=data)
-    return json.loads(urllib.request.urlopen(req).read())
+_caches = {}
 
 
-def get_history(prompt_id):
-    url = f"http://{server_address}:8188/history/{prompt_id}"
-    with urllib.request.urlopen(url) as response:
-        return json.loads(response.read())
+def _get_cache(name, enabled, root, max_mb):
+    if not enabled:
+        return None
+    if name not in _caches:
+        try:
+            _caches[name] = InputCache(root, max_mb * 1024 * 1024)
+        except OSError as e:
+            logger.warning(f"{name} cache disabled ({root}): {e}")
+            _caches[name] = None
+    return _caches[name]
 
 
-def wait_for_completion(ws, prompt):
-    """Submit prompt to ComfyUI and wait for video output via WebSocket."""
-    prompt_id = queue_prompt(prompt)["prompt_id"]
-    logger.info(f"Queued prompt: {prompt_id}")
+def get_input_cache():
+    return _get_cache("input", INPUT_CACHE_ENABLED, INPUT_CACHE_DIR, INPUT_CACHE_MAX_MB)
 
-    while True:
-        out = ws.recv()
-        if isinstance(out, str):
-            message = json.loads(out)
-            if message["type"] == "executing":
-                data = message["data"]
-                if data["node"] is None and data["prompt_id"] == prompt_id:
+
+def get_preprocess_cache():
+    return _get_cache("preprocess", PREPROCESS_CACHE_ENABLED, PREPROCESS_CACHE_DIR, PREPROCESS_CACHE_MAX_MB)
+
+
+def get_embed_cache():
+    return _get_cache("embed", EMBED_CACHE_ENABLED, EMBED_CACHE_DIR, EMBED_CACHE_MAX_MB)
+
+
+def fetch_minio_input(object_name, output_path):
+    """Resolve a MinIO input through the local cache, falling back to a plain download."""
+    cache = get_input_cache()
+    object_name = _sanitize_minio_key(object_name)
+    if cache is None:
+        return download_minio_object(object_name, output_path)
+    try:
+        stat = get_minio_client().stat_object(MINIO_BUCKET, object_name)
+    except Exception as e:
+        logger.warning(f"MinIO stat failed for {object_name}, bypassing cache: {e}")
+        return download_minio_object(object_name, output_path)
+
+    key = cache_key("minio", MINIO_ENDPOINT, MINIO_BUCKET, object_name, stat.etag, stat.size)
+    suffix = os.path.splitext(object_name)[1]
+    return cache.fetch(key, lambda tmp: download_minio_object(object_name, tmp), suffix=suffix)
+
+
+def fetch_url_input(url, output_path, max_mb=None):
+    """Resolve a URL input through the local cache when the server exposes validators."""
+    cache = get_input_cache()
+    if cache is None:
+        return download_file(url, output_path, max_mb)
+    try:
+        remote = http_probe(url, timeout=URL_DOWNLOAD_TIMEOUT_S)
+    except Exception as e:
+        logger.warning(f"Could not read validators for {url[:80]}, bypassing cache: {e}")
+        return download_file(url, output_path, max_mb)
+    # The probe is reused by the download, so the URL is only probed once.
+    parsed = urllib.parse.urlsplit(url)
+    if remote.etag:
+        # Presigned URLs change their query string per signature; the ETag pins the content.
+        key = cache_key("url", parsed.scheme, parsed.netloc, parsed.path, remote.etag)
+    elif remote.last_modified:
+        key = cache_key("url", url, remote.last_modified, remote.size)
+    else:
+        return download_file(url, output_path, max_mb, remote=remote)
+    suffix = os.path.splitext(parsed.path)[1]
+    return cache.fetch(key, lambda tmp: download_file(url, tmp, max_mb, remote=remote), suffix=suffix)
+
+
+def _artifact_minio_key(minio_prefix, key, name, suffix):
+    return f"{minio_prefix}/{key}/{name}{suffix}"
+
+
+def lookup_cached_artifacts(cache, minio_prefix, key, names, suffix):
+    """
+    Return {name: local path} if every artifact for `key` is cached, else None.
+
+    Falls back to the MinIO mirror under `minio_prefix` (when set) on a local miss.
+    """
+    paths = {name: cache.get(cache_key(key, name), suffix) for name in names}
+    if all(paths.values()):
+        return paths
+    if not minio_prefix:
+        return None
+    try:
+        client = get_minio_client()
+        for name in names:
+            client.stat_object(MINIO_BUCKET, _artifact_minio_key(minio_prefix, key, name, suffix))
+        return {
+            name: cache.fetch(
+                cache_key(key, name),
+                lambda tmp, name=name: download_minio_object(
+                    _artifact_minio_key(minio_prefix, key, name, suffix), tmp
+                ),
+                suffix=suffix,
+            )
+            for name in names
+        }
+    except Exception as e:
+        logger.info(f"Cached artifacts not in MinIO ({minio_prefix}/{key[:12]}): {e}")
+        return None
+
+
+@dataclass
+class PendingCapture:
+    """Artifacts a prompt writes via wan_avatar_nodes save nodes, adopted into a cache on success."""
+
+    cache: InputCache
+    minio_prefix: str
+    key: str
+    staged: dict
+    suffix: str
+
+    def commit(self) -> None:
+        for name, staged in self.staged.items():
+            if not os.path.isfile(staged):
+                logger.warning(f"Artifact {name} was not written; not caching {self.key[:12]}")
+                return
+        stored = {
+            name: self.cache.put(cache_key(self.key, name), staged, self.suffix)
+            for name, staged in self.staged.items()
+        }
+        logger.info(f"Cached artifacts {sorted(stored)} ({self.key[:12]})")
+
+        if self.minio_prefix:
+            def mirror():
+                try:
+                    client = get_minio_client()
+                    for name, path in stored.items():
+                        client.fput_object(
+                            MINIO_BUCKET,
+                            _artifact_minio_key(self.minio_prefix, self.key, name, self.suffix),
+                            path,
+                        )
+                    logger.info(f"Mirrored artifacts {sorted(stored)} ({self.key[:12]}) to MinIO")
+                except Exception as e:
+                    logger.warning(f"Artifact mirror to MinIO failed: {e}")
+
+            threading.Thread(target=mirror, daemon=True).start()
+
+
+@functools.lru_cache(maxsize=256)
+def _content_sha256(path, size, mtime_ns):
+    return file_sha256(path)
+
+
+def content_sha256(path):
+    """file_sha256, memoized per (path, size, mtime) so a job hashes each input once."""
+    st = os.stat(path)
+    return _content_sha256(os.path.realpath(path), st.st_size, st.st_mtime_ns)
+
+
+# Job inputs besides the media and seed that change the rendered video.
+_RESULT_KEY_INPUTS = (
+    "prompt",
+    "negative_prompt",
+    "loop_seconds",
+    "loop_mode",
+    "loop_render_seconds",
+    "segment_seconds",
+    "auto_trim",
+)
+
+
+# The workflow file ships with the image; a changed graph means a different render.
+_WORKFLOW_SHA256 = file_sha256(WORKFLOW_PATH)
+
+
+def result_key(job_input, settings, image_path, video_path, seed):
+    """
+    Idempotency key for a render; `seed` is None when the job did not fix one, and then the
+    job's `idempotency_key` stands in for it (a retry, not a request for a fresh take).
+    """
+    params = {
+        "image": image_content_sha256(image_path),
+        "video": content_sha256(video_path),
+        "seed": seed,
+        "idempotency_key": None if seed is not None else str(job_input["idempotency_key"]),
+        "settings": asdict(settings),
+        "inputs": {name: job_input.get(name) for name in _RESULT_KEY_INPUTS},
+        "workflow": _WORKFLOW_SHA256,
+        "steps": STEPS,
+        "cfg": CFG,
+    }
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _result_index_path(key):
+    return os.path.join(RESULT_INDEX_DIR, key[:2], f"{key}.json")
+
+
+def lookup_result(key):
+    """
+    The recorded result for `key` with fresh presigned URLs, or None. Entries whose video
+    has since been deleted from MinIO are dropped.
+    """
+    path = _result_index_path(key)
+    entry = None
+    if os.path.isfile(path):
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError) as e:
+            # Truncated or corrupt (e.g. a crash mid-write on a shared volume): a miss.
+            logger.warning(f"Ignoring unreadable result index {path}: {e}")
+            return None
+    elif RESULT_INDEX_MINIO_PREFIX:
+        response = None
+        try:
+            response = get_minio_client().get_object(MINIO_BUCKET, f"{RESULT_INDEX_MINIO_PREFIX}/{key}.json")
+            entry = json.loads(response.read())
+        except Exception:
+            return None
+        finally:
+            if response is not None:
+                response.close()
+                response.release_conn()
+    if not isinstance(entry, dict) or not entry.get("minio_key"):
+        return None
+
+    client = get_minio_client()
+    try:
+        client.stat_object(MINIO_BUCKET, entry["minio_key"])
+    except Exception as e:
+        logger.info(f"Deduplicated output {entry['minio_key']} is gone; rendering again: {e}")
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return None
+    if not os.path.isfile(path):
+        _write_result_index(path, entry)
+    entry["video_url"] = client.presigned_get_object(MINIO_BUCKET, entry["minio_key"])
+    if entry.get("thumbnail_key"):
+        entry["thumbnail_url"] = client.presigned_get_object(MINIO_BUCKET, entry["thumbnail_key"])
+    return entry
+
+
+def _write_result_index(path, entry):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(entry, f)
+    os.replace(tmp, path)
+
+
+# Result fields worth replaying; URLs are re-signed on every hit and timings are per run.
+_RESULT_INDEX_FIELDS = (
+    "minio_key",
+    "thumbnail_key",
+    "seed",
+    "template_id",
+    "fps",
+    "width",
+    "height",
+    "resolution",
+    "quality",
+    "render_fps",
+    "interpolator",
+    "render_width",
+    "render_height",
+    "loop",
+)
+
+
+def copy_minio_object(src_key, dest_key):
+    """Server-side copy within MINIO_BUCKET; returns a presigned URL for `dest_key`."""
+    from minio.commonconfig import CopySource
+
+    client = get_minio_client()
+    client.copy_object(MINIO_BUCKET, dest_key, CopySource(MINIO_BUCKET, src_key))
+    logger.info(f"Copied MinIO object {src_key} -> {dest_key}")
+    return client.presigned_get_object(MINIO_BUCKET, dest_key)
+
+
+def replay_result(entry, minio_key, thumbnail_key, path_prefix, timer):
+    """
+    Deliver a recorded result at this job's own output keys: server-side copies of the
+    earlier video and thumbnail, or a thumbnail cut from the video when the earlier job
+    did not ask for one.
+    """
+    result = dict(entry, minio_key=minio_key, thumbnail_key=thumbnail_key, thumbnail_url=None)
+    with timer.phase("upload"):
+        if entry["minio_key"] != minio_key:
+            result["video_url"] = copy_minio_object(entry["minio_key"], minio_key)
+    if not thumbnail_key:
+        return result
+    try:
+        if entry.get("thumbnail_key") == thumbnail_key:
+            result["thumbnail_url"] = entry["thumbnail_url"]
+        elif entry.get("thumbnail_key"):
+            with timer.phase("thumbnail"):
+                result["thumbnail_url"] = copy_minio_object(entry["thumbnail_key"], thumbnail_key)
+        else:
+            video_path = download_minio_object(minio_key, f"{path_prefix}_dedup.mp4")
+            result["thumbnail_url"] = upload_thumbnail(video_path, f"{path_prefix}_thumb.jpg", thumbnail_key, timer)
+    except Exception as e:
+        logger.warning(f"Thumbnail generation/upload skipped: {e}")
+        result["thumbnail_key"] = None
+    return result
+
+
+def record_result(key, result):
+    entry = {name: result[name] for name in _RESULT_INDEX_FIELDS if result.get(name) is not None}
+    if not result.get("thumbnail_url"):
+        entry.pop("thumbnail_key", None)
+    entry["created_at"] = datetime.utcnow().isoformat() + "Z"
+    try:
+        path = _result_index_path(key)
+        _write_result_index(path, entry)
+        if RESULT_INDEX_MINIO_PREFIX:
+            get_minio_client().fput_object(
+                MINIO_BUCKET, f"{RESULT_INDEX_MINIO_PREFIX}/{key}.json", path, content_type="application/json"
+            )
+    except Exception as e:
+        logger.warning(f"Could not record result {key[:12]} for deduplication: {e}")
+
+
+def _job_seed(job_input):
+    seed = job_input.get("seed")
+    if seed is None:
+        return None
+    try:
+        seed = int(seed)
+    except (TypeError, ValueError):
+        raise InputError("seed must be an integer")
+    if not 0 <= seed < 2**32:
+        raise InputError("seed must be between 0 and 2**32 - 1")
+    return seed
+
+
+def _staging_dir(cache, task_id):
+    # Staged files must share a filesystem with the cache so commit() can os.replace them.
+    return os.path.join(cache.root, "staging", task_id)
+
+
+def _stage_cached(cache, task_id, cached, suffix):
+    """
+    Hardlink cache hits into the task's staging dir, so the loader nodes read a path that
+    eviction cannot remove mid-job (entries are only protected for a few minutes).
+    """
+    staging = _staging_dir(cache, task_id)
+    os.makedirs(staging, exist_ok=True)
+    staged = {}
+    for name, path in cached.items():
+        staged[name] = os.path.join(staging, f"{name}{suffix}")
+        link_or_copy(path, staged[name])
+    return staged
+
+
+def apply_preprocess_cache(workflow, video_path, task_id):
+    """
+    Rewrite `workflow` to use cached driving-video artifacts, or to capture them.
+
+    Returns a PendingCapture on a miss, None on a hit (or when disabled).
+    """
+    cache = get_preprocess_cache()
+    if cache is None:
+        return None
+    key = preprocess_key(content_sha256(video_path), workflow)
+    cached = lookup_cached_artifacts(cache, PREPROCESS_CACHE_MINIO_PREFIX, key, ARTIFACTS, ARTIFACT_SUFFIX)
+    if cached:
+        logger.info(f"Preprocess cache hit: {key[:12]}")
+        use_cached_artifacts(workflow, _stage_cached(cache, task_id, cached, ARTIFACT_SUFFIX))
+        return None
+
+    logger.info(f"Preprocess cache miss: {key[:12]}")
+    staging = _staging_dir(cache, task_id)
+    staged = {name: os.path.join(staging, f"{name}{ARTIFACT_SUFFIX}") for name in ARTIFACTS}
+    add_capture_nodes(workflow, staged)
+    return PendingCapture(cache, PREPROCESS_CACHE_MINIO_PREFIX, key, staged, ARTIFACT_SUFFIX)
+
+
+def _apply_embed_cache(workflow, task_id, key, name, use_cached, capture):
+    cache = get_embed_cache()
+    if cache is None or key is None:
+        return None
+    cached = lookup_cached_artifacts(cache, EMBED_CACHE_MINIO_PREFIX, key, (name,), EMBED_SUFFIX)
+    if cached:
+        logger.info(f"Embed cache hit ({name}): {key[:12]}")
+        use_cached(workflow, _stage_cached(cache, task_id, cached, EMBED_SUFFIX)[name])
+        return None
+
+    logger.info(f"Embed cache miss ({name}): {key[:12]}")
+    staged = {name: os.path.join(_staging_dir(cache, task_id), f"{name}{EMBED_SUFFIX}")}
+    capture(workflow, staged[name])
+    return PendingCapture(cache, EMBED_CACHE_MINIO_PREFIX, key, staged, EMBED_SUFFIX)
+
+
+def apply_text_embed_cache(workflow, task_id):
+    """Load node 65's embeddings from the cache, or capture them. Same contract as above."""
+    if get_embed_cache() is None:
+        return None
+    key = text_embeds_key(workflow, TEXT_ENCODER_DIR, MODELS_MANIFEST)
+    return _apply_embed_cache(workflow, task_id, key, "text_embeds", use_cached_text_embeds, capture_text_embeds)
+
+
+def apply_clip_embed_cache(workflow, image_path, task_id):
+    """Load node 70's CLIP-vision embeddings for this reference image, or capture them."""
+    if get_embed_cache() is None or not CLIP_EMBED_CACHE_ENABLED:
+        return None
+    key = clip_embeds_key(image_content_sha256(image_path), workflow)
+    return _apply_embed_cache(workflow, task_id, key, "clip_embeds", use_cached_clip_embeds, capture_clip_embeds)
+
+
+def prime_text_embeds():
+    """
+    Populate the text embedding cache for the default prompts.
+
+    Runs a prompt containing only node 65 plus its save node, so the encoder is loaded once
+    per cache lifetime (not once per worker) when the cache is persistent.
+    """
+    cache = get_embed_cache()
+    if cache is None:
+        return
+    with open(WORKFLOW_PATH, "r") as f:
+        workflow = json.load(f)
+    workflow["65"]["inputs"]["positive_prompt"] = POSITIVE_PROMPT
+    workflow["65"]["inputs"]["negative_prompt"] = NEGATIVE_PROMPT
+    key = text_embeds_key(workflow, TEXT_ENCODER_DIR, MODELS_MANIFEST)
+    if key is not None and lookup_cached_artifacts(
+        cache, EMBED_CACHE_MINIO_PREFIX, key, ("text_embeds",), EMBED_SUFFIX
+    ):
+        logger.info(f"Default text embeds already cached ({key[:12]})")
+        return
+    if key is None or not os.path.isfile(os.path.join(TEXT_ENCODER_DIR, workflow["65"]["inputs"]["model_name"])):
+        # Priming would block boot on the encoder download; the first job captures them.
+        logger.info("Text encoder not present yet; skipping text embed priming")
+        return
+
+    task_id = f"prime_{uuid.uuid4().hex[:12]}"
+    path = os.path.join(_staging_dir(cache, task_id), f"text_embeds{EMBED_SUFFIX}")
+    try:
+        wait_for_completion(get_comfy_session(), text_encode_only_workflow(workflow, path))
+        PendingCapture(cache, EMBED_CACHE_MINIO_PREFIX, key, {"text_embeds": path}, EMBED_SUFFIX).commit()
+    finally:
+        shutil.rmtree(_staging_dir(cache, task_id), ignore_errors=True)
+
+
+def _cleanup_staging(task_id):
+    for cache in (get_preprocess_cache(), get_embed_cache()):
+        if cache is not None:
+            shutil.rmtree(_staging_dir(cache, task_id), ignore_errors=True)
+
+
+def wait_for_ungated_models(workflow):
+    """Wait for background model downloads that the workflow's ungated nodes will read."""
+    nodes = {
+        node_id: node["class_type"]
+        for node_id, node in workflow.items()
+        if node.get("class_type") in UNGATED_MODEL_NODES
+    }
+    if not nodes:
+        return
+    folders = {os.path.join(COMFY_MODELS_DIR, UNGATED_MODEL_NODES[c]) for c in nodes.values()}
+    # Only the files the nodes name (matched by basename, as download_models orders them),
+    # plus their companions: other files in the folder may be scheduled last of all.
+    names = {
+        os.path.basename(value)
+        for node_id in nodes
+        for value in workflow[node_id]["inputs"].values()
+        if isinstance(value, str)
+    }
+    paths = [
+        dest
+        for dest, entry in read_status().items()
+        if os.path.dirname(dest) in folders
+        and (os.path.basename(dest) in names or entry.get("needed_with") in names)
+    ]
+    try:
+        wait_for_files(paths)
+    except (RuntimeError, TimeoutError) as e:
+        node_id, node_type = next(iter(nodes.items()))
+        raise ComfyExecutionError(str(e), node_id=node_id, node_type=node_type, error_type="model_unavailable")
+
+
+class ComfySession:
+    """
+    Long-lived ComfyUI connection owned by the worker process.
+
+    The HTTP readiness probe and WebSocket handshake happen once after boot; every job
+    reuses the same socket. One reader thread owns the socket and routes each event to the
+    queue of the prompt it belongs to, so concurrent jobs never see each other's messages.
+    A dropped socket is re-established by the reader, which then tells every waiter to
+    check /history for a completion it may have missed.
+    """
+
+    RECONNECTED = "wan_avatar.reconnected"
+    LOST = "wan_avatar.lost"
+    # Events for prompts nobody has subscribed to yet (the prompt can start before
+    # queue_prompt returns its id); kept briefly so subscribe() can replay them.
+    MAX_ORPHAN_PROMPTS = 64
+
+    def __init__(
+        self,
+        host: str,
+        port: int = 8188,
+        client_id: str = None,
+        output_dir: str = "/ComfyUI/output",
+        temp_dir: str = "/ComfyUI/temp",
+    ):
+        self.host = host
+        self.port = port
+        self.client_id = client_id or str(uuid.uuid4())
+        self.output_dir = output_dir
+        self.temp_dir = temp_dir
+        self.ws = None
+        self.running_prompt = None
+        self._lock = threading.Lock()
+        self._routes_lock = threading.Lock()
+        self._subscribers = {}
+        self._orphans = OrderedDict()
+        self._reader = None
+        # (width, height) shapes this process has compiled the sampler graph for.
+        self.warm_shapes = set()
+
+    @property
+    def http_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def _wait_http(self) -> None:
+        logger.info(f"Checking ComfyUI at {self.http_url}/")
+        for attempt in range(180):
+            try:
+                urllib.request.urlopen(f"{self.http_url}/", timeout=5)
+                logger.info(f"ComfyUI HTTP ready (attempt {attempt + 1})")
+                return
+            except Exception:
+                if attempt == 179:
+                    raise Exception("ComfyUI server not reachable after 3 minutes")
+                time.sleep(1)
+
+    def connect(self) -> None:
+        """Wait for ComfyUI HTTP, then connect WebSocket."""
+        self.close()
+        self._wait_http()
+
+        ws_url = f"ws://{self.host}:{self.port}/ws?clientId={self.client_id}"
+        for attempt in range(36):
+            ws = websocket.WebSocket()
+            try:
+                ws.connect(ws_url)
+                ws.settimeout(3600)
+                logger.info(f"WebSocket connected (attempt {attempt + 1})")
+                self.ws = ws
+                break
+            except Exception:
+                if attempt == 35:
+                    raise Exception("WebSocket connection failed after 3 minutes")
+                time.sleep(5)
+        if self._reader is None or not self._reader.is_alive():
+            self._reader = threading.Thread(target=self._read_loop, name="comfy-ws-reader", daemon=True)
+            self._reader.start()
+
+    def is_alive(self) -> bool:
+        if self.ws is None or not self.ws.connected:
+            return False
+        try:
+            self.ws.ping()
+            return True
+        except Exception:
+            return False
+
+    def ensure_connected(self) -> None:
+        with self._lock:
+            if not self.is_alive():
+                if self.ws is not None:
+                    logger.warning("ComfyUI WebSocket is dead; reconnecting")
+                self.connect()
+
+    def close(self) -> None:
+        if self.ws is not None:
+            try:
+                self.ws.close()
+            except Exception:
+                pass
+            self.ws = None
+
+    def subscribe(self, prompt_id) -> queue.Queue:
+        events = queue.Queue()
+        with self._routes_lock:
+            self._subscribers[prompt_id] = events
+            for message in self._orphans.pop(prompt_id, []):
+                events.put(message)
+        return events
+
+    def unsubscribe(self, prompt_id) -> None:
+        with self._routes_lock:
+            self._subscribers.pop(prompt_id, None)
+
+    def _route(self, message) -> None:
+        data = message.get("data") or {}
+        prompt_id = data.get("prompt_id")
+        if message.get("type") == "executing" and prompt_id:
+            self.running_prompt = prompt_id if data.get("node") is not None else None
+        elif message.get("type") == "progress" and not prompt_id:
+            # Older ComfyUI builds don't tag progress; it belongs to the running prompt.
+            prompt_id = self.running_prompt
+        if not prompt_id:
+            return
+        with self._routes_lock:
+            events = self._subscribers.get(prompt_id)
+            if events is not None:
+                events.put(message)
+                return
+            self._orphans.setdefault(prompt_id, []).append(message)
+            self._orphans.move_to_end(prompt_id)
+            while len(self._orphans) > self.MAX_ORPHAN_PROMPTS:
+                self._orphans.popitem(last=False)
+
+    def _broadcast(self, event_type) -> None:
+        with self._routes_lock:
+            for events in self._subscribers.values():
+                events.put({"type": event_type, "data": {}})
+
+    def _read_loop(self) -> None:
+        while True:
+            ws = self.ws
+            try:
+                if ws is None:
+                    raise ConnectionError("not connected")
+                out = ws.recv()
+            except websocket.WebSocketTimeoutException:
+                continue
+            except Exception as e:
+                # The prompts keep running inside ComfyUI; reconnect and let each waiter
+                # check whether it missed its completion while the socket was down.
+                logger.warning(f"WebSocket dropped: {e}")
+                try:
+                    self.ensure_connected()
+                except Exception as reconnect_error:
+                    # ComfyUI is down (crashed, restarting); fail the prompts waiting on it
+                    # rather than letting them run into the job deadline.
+                    logger.warning(f"WebSocket reconnect to port {self.port} failed: {reconnect_error}")
+                    # The supervisor restarts it with an empty compile cache.
+                    self.warm_shapes.clear()
+                    self._broadcast(self.LOST)
+                    time.sleep(5)
+                    continue
+                # A dropped socket usually means ComfyUI restarted; its compiled graphs are gone.
+                self.warm_shapes.clear()
+                self._broadcast(self.RECONNECTED)
+                continue
+            if not isinstance(out, str):
+                # Binary frames are latent previews (and carry no prompt_id); progress and
+                # timing come from the JSON events.
+                continue
+            try:
+                self._route(json.loads(out))
+            except Exception as e:
+                logger.warning(f"Could not route ComfyUI message: {e}")
+
+    def _post(self, path, body=None):
+        data = json.dumps(body or {}).encode("utf-8")
+        req = urllib.request.Request(f"{self.http_url}{path}", data=data)
+        with urllib.request.urlopen(req, timeout=30) as response:
+            raw = response.read()
+        return json.loads(raw) if raw.strip() else None
+
+    def queue_prompt(self, prompt):
+        try:
+            return self._post("/prompt", {"prompt": prompt, "client_id": self.client_id})
+        except urllib.error.HTTPError as e:
+            # Validation failures come back as HTTP 400 with per-node details.
+            try:
+                body = json.loads(e.read())
+            except Exception:
+                raise e
+            node_errors = body.get("node_errors") or {}
+            node_id = next(iter(node_errors), None)
+            node_type = (prompt.get(node_id) or {}).get("class_type") if node_id else None
+            message = (body.get("error") or {}).get("message") or "Prompt rejected by ComfyUI"
+            raise ComfyExecutionError(
+                message,
+                node_id=node_id,
+                node_type=node_type,
+                error_type="prompt_validation_error",
+                details={"node_errors": node_errors},
+            )
+
+    def interrupt(self, prompt_id=None) -> None:
+        """Stop `prompt_id` if it is running and drop it from the pending queue."""
+        try:
+            if prompt_id is None or self.running_prompt == prompt_id:
+                # Builds that support it only interrupt the named prompt; older ones stop
+                # whatever is running, which is this prompt.
+                self._post("/interrupt", {"prompt_id": prompt_id} if prompt_id else None)
+            if prompt_id:
+                self._post("/queue", {"delete": [prompt_id]})
+        except Exception as e:
+            logger.warning(f"ComfyUI interrupt/queue cleanup failed: {e}")
+
+    def in_queue(self, prompt_id) -> bool:
+        with urllib.request.urlopen(f"{self.http_url}/queue", timeout=10) as response:
+            state = json.loads(response.read())
+        entries = (state.get("queue_running") or []) + (state.get("queue_pending") or [])
+        return any(len(entry) > 1 and entry[1] == prompt_id for entry in entries)
+
+    def healthy(self) -> bool:
+        try:
+            urllib.request.urlopen(f"{self.http_url}/", timeout=2)
+            return True
+        except Exception:
+            return False
+
+    def get_history(self, prompt_id):
+        with urllib.request.urlopen(f"{self.http_url}/history/{prompt_id}") as response:
+            return json.loads(response.read())
+
+
+class PhaseTimer:
+    """Wall-clock seconds per named phase of one job (repeated phases accumulate)."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.phases = {}
+
+    def add(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add(name, time.monotonic() - started)
+
+    def report(self):
+        total = time.monotonic() - self.started
+        execution = self.phases.get("comfy_execution", 0.0)
+        return {
+            "phases": {name: round(seconds, 3) for name, seconds in self.phases.items()},
+            "total_s": round(total, 3),
+            "overhead_s": round(total - execution, 3),
+        }
+
+
+def log_timings(job, task_id, result):
+    if not TIMINGS_LOG_PATH:
+        return
+    line = {
+        "ts": datetime.utcnow().isoformat() + "Z",
+        "job_id": job.get("id"),
+        "task_id": task_id,
+        "status": "FAILED" if result.get("error") else "COMPLETED",
+        "error_type": result.get("error_type"),
+        "timings": result.get("timings"),
+    }
+    try:
+        os.makedirs(os.path.dirname(TIMINGS_LOG_PATH) or ".", exist_ok=True)
+        with open(TIMINGS_LOG_PATH, "a") as f:
+            f.write(json.dumps(line) + "\n")
+    except OSError as e:
+        logger.warning(f"Could not append timings to {TIMINGS_LOG_PATH}: {e}")
+
+
+class ProgressReporter:
+    """Throttled `runpod.serverless.progress_update` for one job."""
+
+    def __init__(self, job, interval=PROGRESS_UPDATE_INTERVAL_S):
+        self.job = job
+        self.interval = interval
+        self._last = 0.0
+
+    def __call__(self, update, force=False):
+        now = time.monotonic()
+        if not force and now - self._last < self.interval:
+            return
+        self._last = now
+        try:
+            runpod.serverless.progress_update(self.job, update)
+        except Exception as e:
+            logger.warning(f"Progress update failed: {e}")
+
+    def scoped(self, **context):
+        """Reporter that tags every update with `context` (e.g. the fan-out item)."""
+        return lambda update, force=False: self(dict(context, **update), force=force)
+
+
+@dataclass
+class ExecutionTrace:
+    """
+    Per-node wall-clock breakdown of one prompt, built from ComfyUI WebSocket events.
+
+    `executing` starts a node (and ends the previous one), `executed` ends an output node,
+    `execution_cached` lists nodes ComfyUI skipped and `progress` carries sampler steps.
+    """
+
+    prompt: dict
+    on_progress: object = None
+    nodes: dict = field(default_factory=dict)
+    current_node: str = None
+    node_started: float = 0.0
+    started: float = field(default_factory=time.monotonic)
+    execution_started: float = None
+    instance_port: int = None
+    warm_start: bool = None
+
+    def queued(self):
+        self.started = time.monotonic()
+
+    def begin(self):
+        """First event for this prompt: it has left the ComfyUI queue."""
+        if self.execution_started is None:
+            self.execution_started = time.monotonic()
+
+    def node_type(self, node_id):
+        return (self.prompt.get(str(node_id)) or {}).get("class_type") if node_id is not None else None
+
+    def _end_current(self, now):
+        entry = self.nodes.get(self.current_node)
+        if entry is not None and entry.get("seconds") is None:
+            entry["seconds"] = round(now - self.node_started, 3)
+
+    def executing(self, node_id):
+        now = time.monotonic()
+        self._end_current(now)
+        self.current_node = node_id
+        self.node_started = now
+        if node_id is None:
+            return
+        self.nodes[node_id] = {"class_type": self.node_type(node_id), "seconds": None, "cached": False}
+        self._report(force=True)
+
+    def executed(self, node_id):
+        if node_id == self.current_node:
+            self._end_current(time.monotonic())
+
+    def cached(self, node_ids):
+        for node_id in node_ids or []:
+            self.nodes[node_id] = {"class_type": self.node_type(node_id), "seconds": 0.0, "cached": True}
+
+    def progress(self, node_id, value, maximum):
+        self._report(step=value, steps=maximum, node=node_id or self.current_node)
+
+    def _report(self, force=False, node=None, **extra):
+        if not self.on_progress:
+            return
+        node = node or self.current_node
+        update = {
+            "stage": "executing",
+            "node": node,
+            "class_type": self.node_type(node),
+            "nodes_done": sum(1 for entry in self.nodes.values() if entry.get("seconds") is not None),
+            "nodes_total": len(self.prompt),
+            "elapsed_s": round(time.monotonic() - self.started, 1),
+        }
+        if extra.get("steps"):
+            update.update(extra, percent=round(100.0 * extra["step"] / extra["steps"], 1))
+        self.on_progress(update, force=force)
+
+    def summary(self):
+        """Nodes in execution order plus the slowest class_types, for the job result."""
+        self._end_current(time.monotonic())
+        by_type = {}
+        for entry in self.nodes.values():
+            if entry.get("seconds"):
+                by_type[entry["class_type"]] = round(by_type.get(entry["class_type"], 0.0) + entry["seconds"], 3)
+        return {
+            "total_s": round(time.monotonic() - self.started, 3),
+            "queue_wait_s": round((self.execution_started or time.monotonic()) - self.started, 3),
+            "nodes": [dict(entry, node=node_id) for node_id, entry in self.nodes.items()],
+            "by_class_type": dict(sorted(by_type.items(), key=lambda kv: kv[1], reverse=True)),
+            "instance_port": self.instance_port,
+            "warm_start": self.warm_start,
+        }
+
+
+class ComfyRouter:
+    """
+    Dispatch prompts across ComfyUI instances (one per GPU).
+
+    `reserve()` hands out the healthy instance with the fewest prompts in flight, blocking
+    while every instance already has `max_in_flight`. Health is a cheap HTTP probe, cached
+    for COMFYUI_HEALTH_TTL_S; instances the entrypoint is restarting are skipped until
+    they answer again.
+    """
+
+    def __init__(self, sessions, max_in_flight=MAX_PROMPTS_IN_FLIGHT):
+        self.sessions = list(sessions)
+        self.max_in_flight = max(1, max_in_flight)
+        self._load = {id(session): 0 for session in self.sessions}
+        self._health = {}
+        self._cond = threading.Condition()
+
+    def _is_healthy(self, session) -> bool:
+        checked_at, ok = self._health.get(id(session), (0.0, False))
+        if time.monotonic() - checked_at > COMFYUI_HEALTH_TTL_S:
+            ok = session.healthy()
+            self._health[id(session)] = (time.monotonic(), ok)
+        return ok
+
+    def _pick(self, healthy, shape=None):
+        free = [s for s in healthy if self._load[id(s)] < self.max_in_flight]
+        # Least loaded first; between equally loaded (e.g. idle) instances, one that has
+        # already compiled this shape. A busy warm instance never beats an idle cold one.
+        return min(free, key=lambda s: (self._load[id(s)], shape not in s.warm_shapes)) if free else None
+
+    def reserve(self, session=None, timeout=None, shape=None) -> ComfySession:
+        """
+        Take a prompt slot on `session`, or on the least-loaded healthy instance (preferring
+        one already warm for `shape` on a tie).
+
+        Raises ComfyExecutionError (no_instance) once no candidate has been healthy for
+        `timeout` seconds, or if the chosen instance cannot be connected to.
+        """
+        candidates = [session] if session is not None else self.sessions
+        unhealthy_since = None
+        while True:
+            # Health probes are blocking HTTP calls; run them outside the lock so
+            # release() from other jobs never waits on them.
+            healthy = [s for s in candidates if self._is_healthy(s)]
+            with self._cond:
+                chosen = self._pick(healthy, shape)
+                if chosen is not None:
+                    self._load[id(chosen)] += 1
                     break
-        # Binary data (previews etc.) — skip
-        continue
+                if healthy:
+                    # Busy, not down: wait for a slot as long as it takes.
+                    unhealthy_since = None
+                else:
+                    unhealthy_since = unhealthy_since or time.monotonic()
+                    if timeout and time.monotonic() - unhealthy_since > timeout:
+                        raise ComfyExecutionError(
+                            f"No healthy ComfyUI instance for {timeout:g}s", error_type="no_instance"
+                        )
+                # Re-probe unhealthy instances periodically even if no slot is released.
+                self._cond.wait(timeout=COMFYUI_HEALTH_TTL_S)
+        try:
+            chosen.ensure_connected()
+        except Exception as e:
+            self._health[id(chosen)] = (time.monotonic(), False)
+            self.release(chosen)
+            raise ComfyExecutionError(
+                f"Could not connect to ComfyUI on port {chosen.port}: {e}", error_type="no_instance"
+            ) from e
+        return chosen
+
+    def release(self, session) -> None:
+        with self._cond:
+            self._load[id(session)] -= 1
+            self._cond.notify_all()
+
+    def status(self):
+        return [
+            {
+                "port": s.port,
+                "in_flight": self._load[id(s)],
+                "healthy": self._health.get(id(s), (0, None))[1],
+                "warm_shapes": sorted(s.warm_shapes),
+            }
+            for s in self.sessions
+        ]
+
+
+_comfy_router = None
+_comfy_router_lock = threading.Lock()
+
+
+def get_comfy_router() -> ComfyRouter:
+    global _comfy_router
+    with _comfy_router_lock:
+        if _comfy_router is None:
+            multi = COMFYUI_INSTANCES > 1
+            _comfy_router = ComfyRouter(
+                ComfySession(
+                    server_address,
+                    COMFYUI_PORT + i,
+                    client_id=client_id,
+                    output_dir=f"/ComfyUI/output/gpu{i}" if multi else "/ComfyUI/output",
+                    temp_dir=f"/tmp/comfyui_gpu{i}/temp" if multi else "/ComfyUI/temp",
+                )
+                for i in range(COMFYUI_INSTANCES)
+            )
+    return _comfy_router
+
+
+def get_comfy_session() -> ComfySession:
+    """Return the first ComfyUI session, connecting (or reconnecting) as needed."""
+    session = get_comfy_router().sessions[0]
+    session.ensure_connected()
+    return session
+
+
+def _node_deadline(node_type):
+    timeout = NODE_TIMEOUTS.get(node_type, NODE_TIMEOUT_S) if node_type else NODE_TIMEOUT_S
+    return float(timeout or 0)
+
 
-    history = get_history(prompt_id)[prompt_id]
+def _follow_prompt(session, prompt_id, events, trace):
+    """Consume this prompt's routed events until it finishes, fails or hits a deadline."""
+    node_type_of = trace.node_type
+    while True:
+        now = time.monotonic()
+        current_node = trace.current_node
+        # The job deadline counts from when the prompt left the queue (or from queueing,
+        # while it is still waiting), so prompts queued behind another job aren't penalised.
+        job_started = trace.execution_started or trace.started
+        if JOB_TIMEOUT_S and now - job_started > JOB_TIMEOUT_S:
+            session.interrupt(prompt_id)
+            raise ComfyExecutionError(
+                f"Job exceeded deadline of {JOB_TIMEOUT_S:.0f}s",
+                node_id=current_node,
+                node_type=node_type_of(current_node),
+                error_type="job_timeout",
+            )
+        node_timeout = _node_deadline(node_type_of(current_node)) if current_node else 0
+        if node_timeout and now - trace.node_started > node_timeout:
+            session.interrupt(prompt_id)
+            raise ComfyExecutionError(
+                f"Node {current_node} ({node_type_of(current_node)}) exceeded deadline of {node_timeout:.0f}s",
+                node_id=current_node,
+                node_type=node_type_of(current_node),
+                error_type="node_timeout",
+            )
+
+        try:
+            message = events.get(timeout=WS_POLL_INTERVAL_S)
+        except queue.Empty:
+            continue
+
+        data = message.get("data") or {}
+        msg_type = message.get("type")
+        if msg_type == ComfySession.RECONNECTED:
+            if prompt_id in session.get_history(prompt_id):
+                trace.executing(None)
+                return
+            if not session.in_queue(prompt_id):
+                # ComfyUI restarted and forgot the prompt.
+                raise ComfyExecutionError(
+                    f"ComfyUI on port {session.port} restarted while running the prompt",
+                    node_id=trace.current_node,
+                    node_type=node_type_of(trace.current_node),
+                    error_type="instance_restarted",
+                )
+            continue
+        if msg_type == ComfySession.LOST:
+            raise ComfyExecutionError(
+                f"Lost connection to ComfyUI on port {session.port}",
+                node_id=trace.current_node,
+                node_type=node_type_of(trace.current_node),
+                error_type="instance_lost",
+            )
+
+        trace.begin()
+        if msg_type == "executing":
+            trace.executing(data.get("node"))
+            if data.get("node") is None:
+                return
+        elif msg_type == "executed":
+            trace.executed(data.get("node"))
+        elif msg_type == "execution_cached":
+            trace.cached(data.get("nodes"))
+        elif msg_type == "progress":
+            trace.progress(data.get("node"), data.get("value"), data.get("max"))
+        elif msg_type == "execution_error":
+            node_id = data.get("node_id")
+            exception_type = data.get("exception_type") or ""
+            error_type = "out_of_memory" if "OutOfMemory" in exception_type else "execution_error"
+            raise ComfyExecutionError(
+                f"{data.get('node_type') or node_type_of(node_id)} (node {node_id}) failed: "
+                f"{exception_type}: {(data.get('exception_message') or '').strip()}",
+                node_id=node_id,
+                node_type=data.get("node_type") or node_type_of(node_id),
+                error_type=error_type,
+                details={"exception_type": exception_type, "traceback": (data.get("traceback") or [])[-5:]},
+            )
+        elif msg_type == "execution_interrupted":
+            node_id = data.get("node_id")
+            raise ComfyExecutionError(
+                f"Execution interrupted at node {node_id}",
+                node_id=node_id,
+                node_type=data.get("node_type") or node_type_of(node_id),
+                error_type="execution_interrupted",
+            )
+
+
+def wait_for_completion(session, prompt, trace=None):
+    """
+    Submit prompt to ComfyUI and wait for video output via WebSocket.
+
+    Raises ComfyExecutionError as soon as ComfyUI reports an execution error or interrupt
+    for this prompt, or when the per-job / per-node deadline is exceeded (in which case the
+    prompt is interrupted and removed from the queue so the worker is free again). Node
+    timings and sampler progress are recorded on `trace`.
+    """
+    trace = trace or ExecutionTrace(prompt)
+    prompt_id = session.queue_prompt(prompt)["prompt_id"]
+    events = session.subscribe(prompt_id)
+    trace.queued()
+    logger.info(f"Queued prompt: {prompt_id}")
+    try:
+        _follow_prompt(session, prompt_id, events, trace)
+    finally:
+        session.unsubscribe(prompt_id)
+
+    summary = trace.summary()
+    slowest = list(summary["by_class_type"].items())[:3]
+    logger.info(f"Prompt {prompt_id} finished in {summary['total_s']:.1f}s; slowest: {slowest}")
+
+    history = session.get_history(prompt_id)[prompt_id]
 
     def resolve_comfy_file(file_info):
         # ComfyUI may return either an absolute path ("fullpath") or a tuple of
@@ -210,9 +1539,9 @@ def wait_for_completion(ws, prompt):
         file_type = file_info.get("type") or "output"
 
         if file_type == "temp":
-            root = "/ComfyUI/temp"
+            root = session.temp_dir
         else:
-            root = "/ComfyUI/output"
+            root = session.output_dir
 
         return os.path.join(root, subfolder, filename)
 
@@ -231,182 +1560,786 @@ def wait_for_completion(ws, prompt):
     return None
 
 
-def connect_comfyui():
-    """Wait for ComfyUI HTTP, then connect WebSocket."""
-    http_url = f"http://{server_address}:8188/"
-    logger.info(f"Checking ComfyUI at {http_url}")
-
-    for attempt in range(180):
-        try:
-            urllib.request.urlopen(http_url, timeout=5)
-            logger.info(f"ComfyUI HTTP ready (attempt {attempt + 1})")
-            break
-        except Exception:
-            if attempt == 179:
-                raise Exception("ComfyUI server not reachable after 3 minutes")
-            time.sleep(1)
+def _extract_frame(video_path, image_path):
+    subprocess.run(
+        ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error", "-ss", "0.5", "-i", video_path, "-frames:v", "1", image_path],
+        check=True,
+    )
 
-    ws_url = f"ws://{server_address}:8188/ws?clientId={client_id}"
-    ws = websocket.WebSocket()
-    for attempt in range(36):
-        try:
-            ws.connect(ws_url)
-            ws.settimeout(3600)
-            logger.info(f"WebSocket connected (attempt {attempt + 1})")
-            return ws
-        except Exception:
-            if attempt == 35:
-                raise Exception("WebSocket connection failed after 3 minutes")
-            time.sleep(5)
 
+def _warmup_video_source():
+    if WARMUP_DRIVING_VIDEO_PATH:
+        return {"driving_video_path": WARMUP_DRIVING_VIDEO_PATH}
+    if WARMUP_TEMPLATE_ID:
+        return {"template_id": WARMUP_TEMPLATE_ID}
+    if DEFAULT_DRIVING_VIDEO_PATH:
+        return {"driving_video_path": DEFAULT_DRIVING_VIDEO_PATH}
+    if os.path.isdir(TEMPLATES_DIR):
+        templates = sorted(f for f in os.listdir(TEMPLATES_DIR) if f.endswith(".mp4"))
+        if templates:
+            return {"template_id": templates[0][: -len(".mp4")]}
+    return None
 
-def handler(job):
-    job_input = job.get("input", {})
-    logger.info(f"Received job: {json.dumps({k: v[:50] + '...' if isinstance(v, str) and len(v) > 50 else v for k, v in job_input.items()})}")
 
-    task_id = f"task_{uuid.uuid4().hex[:12]}"
-    comfy_input_files = []
+def run_warmup(session=None, resolution=None, quality="standard"):
+    """
+    Render a short clip from a real driving video (its own first frame as the reference
+    image, so detection finds a person) and discard the output. This compiles the sampler
+    graph for the `resolution` bucket at `quality`'s render size into the persistent
+    inductor cache and loads every model once.
+    """
+    settings = resolve_render_settings({"resolution": resolution or DEFAULT_RESOLUTION, "quality": quality})
+    width, height = settings.width, settings.height
+    source = _warmup_video_source()
+    if source is None:
+        logger.info("No warmup driving video configured or bundled; skipping warmup")
+        return
+    task_id = f"warmup_{uuid.uuid4().hex[:12]}"
+    staged_files = []
     output_path = None
-    template_id = job_input.get("template_id")
+    started = time.monotonic()
     try:
-        # --- Resolve image input ---
-        image_path = None
-        if "image_url" in job_input:
-            image_path = download_file(
-                job_input["image_url"],
-                os.path.join(task_id, "input_image.jpg"),
+        video_path = resolve_driving_video(source, task_id)
+        os.makedirs(task_id, exist_ok=True)
+        image_path = os.path.join(task_id, "warmup_image.jpg")
+        _extract_frame(video_path, image_path)
+        comfy_image_name = stage_comfy_input(image_path, f"{task_id}_input_image.jpg", staged_files)
+        comfy_video_name = stage_comfy_input(video_path, f"{task_id}_driving_video.mp4", staged_files)
+
+        workflow = build_workflow(
+            {}, comfy_image_name, comfy_video_name, seed=0, fps=settings.fps, width=width, height=height
+        )
+        frames = WARMUP_FRAMES or int(workflow["198"]["inputs"].get("frame_window_size") or 77)
+        workflow["63"]["inputs"]["frame_load_cap"] = frames
+        output_path = execute_workflow(workflow, image_path, video_path, task_id, session=session)
+        where = f" on port {session.port}" if session else ""
+        logger.info(
+            f"Warmup finished{where} in {time.monotonic() - started:.1f}s ({width}x{height}, {frames} frames)"
+        )
+    finally:
+        shutil.rmtree(task_id, ignore_errors=True)
+        _cleanup_staging(task_id)
+        cleanup_comfy_inputs(task_id)
+        for staged_file in staged_files + ([output_path] if output_path else []):
+            try:
+                os.remove(staged_file)
+            except OSError:
+                pass
+
+
+class InputError(ValueError):
+    """Invalid or unresolvable job input; reported to the caller as {"error": ...}."""
+
+
+def comfy_input_path(task_id, name):
+    """Job-owned path inside COMFY_INPUT_DIR; uncached inputs are written straight here."""
+    return os.path.join(COMFY_INPUT_DIR, f"{task_id}_{name}")
+
+
+def resolve_image_input(job_input, task_id):
+    if "image_url" in job_input:
+        return fetch_url_input(
+            job_input["image_url"],
+            comfy_input_path(task_id, "input_image.jpg"),
+            max_mb=MAX_IMAGE_MB,
+        )
+    if "image_minio_path" in job_input:
+        minio_image_path = _sanitize_minio_key(job_input["image_minio_path"])
+        if not minio_image_path:
+            raise InputError("image_minio_path is empty")
+        return fetch_minio_input(
+            minio_image_path,
+            comfy_input_path(task_id, "input_image.png"),
+        )
+    if "image_base64" in job_input:
+        return save_base64(
+            job_input["image_base64"],
+            comfy_input_path(task_id, "input_image.jpg"),
+        )
+    raise InputError("Provide one of: image_url, image_minio_path, image_base64")
+
+
+def resolve_driving_video(spec, task_id, name="driving_video"):
+    """Resolve a driving video from a job input (or fan-out item) dict to a local path."""
+    video_path = None
+    if "driving_video_url" in spec:
+        video_path = fetch_url_input(
+            spec["driving_video_url"],
+            comfy_input_path(task_id, f"{name}.mp4"),
+            max_mb=MAX_VIDEO_MB,
+        )
+    elif "driving_video_base64" in spec:
+        video_path = save_base64(
+            spec["driving_video_base64"],
+            comfy_input_path(task_id, f"{name}.mp4"),
+        )
+    else:
+        template_id = spec.get("template_id")
+        minio_video_path = _sanitize_minio_key(spec.get("driving_video_path") or DEFAULT_DRIVING_VIDEO_PATH)
+        if minio_video_path:
+            video_path = fetch_minio_input(
+                minio_video_path,
+                comfy_input_path(task_id, f"{name}.mp4"),
             )
-        elif "image_minio_path" in job_input:
-            minio_image_path = _sanitize_minio_key(job_input["image_minio_path"])
-            if minio_image_path:
-                image_path = download_minio_object(
-                    minio_image_path,
-                    os.path.join(task_id, "input_image.png"),
-                )
-        elif "image_base64" in job_input:
-            image_path = save_base64(
-                job_input["image_base64"],
-                os.path.join(task_id, "input_image.jpg"),
+        elif template_id:
+            local_template_path = os.path.join(TEMPLATES_DIR, f"{template_id}.mp4")
+            if os.path.exists(local_template_path):
+                video_path = local_template_path
+            else:
+                available = [
+                    f.replace(".mp4", "")
+                    for f in os.listdir(TEMPLATES_DIR)
+                    if f.endswith(".mp4")
+                ]
+                raise InputError(f"Template '{template_id}' not found. Available: {available}")
+
+    if not video_path:
+        raise InputError(
+            "Provide one of: driving_video_url, driving_video_base64, "
+            "driving_video_path, or template_id"
+        )
+    return video_path
+
+
+def resolve_output_keys(job_input, item=None, variant=None):
+    """
+    Return (video key, thumbnail key or None) for a job, or for one fan-out item.
+
+    Item-level keys win; otherwise job-level prefixes apply, with the variant name added
+    so fan-out outputs never collide.
+    """
+    source = item or job_input
+    user_id = job_input.get("user_id", "unknown")
+    avatar_id = job_input.get("avatar_id", uuid.uuid4().hex[:8])
+    timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+    filename = f"idle_{variant}_{timestamp}.mp4" if variant else f"idle_{timestamp}.mp4"
+
+    output_video_key = source.get("output_video_key") or source.get("output_key")
+    output_video_prefix = (
+        source.get("output_video_prefix")
+        or job_input.get("output_video_prefix")
+        or job_input.get("output_prefix")
+    )
+    if output_video_key:
+        minio_key = _sanitize_minio_key(str(output_video_key))
+    elif output_video_prefix:
+        output_video_prefix = _sanitize_minio_key(str(output_video_prefix)).rstrip("/")
+        minio_key = f"{output_video_prefix}/{filename}"
+    else:
+        minio_key = f"{user_id}/{avatar_id}/{filename}"
+
+    output_thumbnail_key = source.get("output_thumbnail_key") or source.get("thumbnail_key")
+    output_thumbnail_key = _sanitize_minio_key(str(output_thumbnail_key)) if output_thumbnail_key else None
+    return minio_key, output_thumbnail_key
+
+
+def stage_comfy_input(src_path, name, staged_files):
+    """
+    Make an input visible under /ComfyUI/input (LoadImage/VHS_LoadVideo are most reliable
+    there) and return the name to put in the workflow.
+
+    Inputs already written there are used in place. Cache entries are hardlinked (or
+    reflinked) and bundled templates symlinked; bytes are only copied across filesystems.
+    Only the staged name is ever removed, so shared sources are never touched.
+    """
+    os.makedirs(COMFY_INPUT_DIR, exist_ok=True)
+    if os.path.dirname(os.path.abspath(src_path)) == os.path.abspath(COMFY_INPUT_DIR):
+        name = os.path.basename(src_path)
+    else:
+        templates_dir = os.path.realpath(TEMPLATES_DIR) + os.sep
+        dest = os.path.join(COMFY_INPUT_DIR, name)
+        method = link_or_copy(src_path, dest, allow_symlink=os.path.realpath(src_path).startswith(templates_dir))
+        logger.info(f"Staged {name} ({method})")
+    staged_files.append(os.path.join(COMFY_INPUT_DIR, name))
+    return name
+
+
+def cleanup_comfy_inputs(task_id):
+    """Remove every job-owned entry in COMFY_INPUT_DIR (links are unlinked, never followed)."""
+    prefix = f"{task_id}_"
+    try:
+        names = os.listdir(COMFY_INPUT_DIR)
+    except OSError:
+        return
+    for name in names:
+        if name.startswith(prefix):
+            try:
+                os.remove(os.path.join(COMFY_INPUT_DIR, name))
+            except OSError:
+                pass
+
+
+def build_workflow(job_input, comfy_image_name, comfy_video_name, seed, fps=FPS, width=WIDTH, height=HEIGHT):
+    """Load workflow_replace.json and apply the fixed generation parameters for one render."""
+    with open(WORKFLOW_PATH, "r") as f:
+        workflow = json.load(f)
+
+    workflow["57"]["inputs"]["image"] = comfy_image_name
+    workflow["63"]["inputs"]["video"] = comfy_video_name
+    workflow["63"]["inputs"]["force_rate"] = fps
+    workflow["30"]["inputs"]["frame_rate"] = fps
+    workflow["30"]["inputs"]["save_output"] = True
+    # "sageattn" requires the optional `sageattention` package. Default to SDPA for portability.
+    workflow["22"]["inputs"]["attention_mode"] = os.getenv("WAN_ATTENTION_MODE", "sdpa")
+    workflow["65"]["inputs"]["positive_prompt"] = job_input.get("prompt", POSITIVE_PROMPT)
+    workflow["65"]["inputs"]["negative_prompt"] = job_input.get("negative_prompt", NEGATIVE_PROMPT)
+    workflow["27"]["inputs"]["seed"] = seed
+    workflow["27"]["inputs"]["cfg"] = CFG
+    workflow["27"]["inputs"]["steps"] = STEPS
+    workflow["150"]["inputs"]["value"] = width
+    workflow["151"]["inputs"]["value"] = height
+    return workflow
+
+
+def execute_workflow(workflow, image_path, video_path, variant_id, trace=None, timer=None, session=None):
+    """
+    Apply the artifact/embedding caches, run the prompt (on `session`, or the least-loaded
+    ComfyUI instance) and commit any new cache entries.
+    """
+    timer = timer or PhaseTimer()
+    trace = trace or ExecutionTrace(workflow)
+    with timer.phase("cache_lookup"):
+        captures = [
+            apply_preprocess_cache(workflow, video_path, variant_id),
+            apply_text_embed_cache(workflow, variant_id),
+            apply_clip_embed_cache(workflow, image_path, variant_id),
+        ]
+    with timer.phase("model_wait"):
+        wait_for_ungated_models(workflow)
+    router = get_comfy_router()
+    shape = (workflow["150"]["inputs"]["value"], workflow["151"]["inputs"]["value"])
+    with timer.phase("prompt_slot_wait"):
+        session = router.reserve(session, timeout=COMFYUI_READY_TIMEOUT_S, shape=shape)
+    trace.instance_port = session.port
+    trace.warm_start = shape in session.warm_shapes
+    try:
+        output_path = wait_for_completion(session, workflow, trace)
+        session.warm_shapes.add(shape)
+    finally:
+        router.release(session)
+        summary = trace.summary()
+        timer.add("comfy_queue_wait", summary["queue_wait_s"])
+        timer.add("comfy_execution", summary["total_s"] - summary["queue_wait_s"])
+    with timer.phase("cache_commit"):
+        for capture in captures:
+            if capture:
+                capture.commit()
+    return output_path
+
+
+def admit_inputs(job_input, image_path, video_path, settings, loop=None):
+    """
+    Probe the resolved inputs and enforce the admission limits before any GPU work.
+
+    Returns (probe, estimate, frame_cap): frame_cap is the frame_load_cap (at the render
+    fps) when an over-long video is trimmed, else None. Raises InputError on rejection.
+    """
+    try:
+        image = probe_image(image_path)
+        video = probe_video(video_path)
+    except ProbeError as e:
+        raise InputError(str(e))
+    if MAX_IMAGE_PIXELS and image.width * image.height > MAX_IMAGE_PIXELS:
+        raise InputError(
+            f"Reference image is {image.width}x{image.height}, over the {MAX_IMAGE_PIXELS / 1e6:g}MP limit"
+        )
+    if ALLOWED_VIDEO_CODECS and video.codec not in ALLOWED_VIDEO_CODECS:
+        raise InputError(
+            f"Driving video codec {video.codec} is not allowed (allowed: {', '.join(sorted(ALLOWED_VIDEO_CODECS))})"
+        )
+    if MAX_VIDEO_PIXELS and video.width * video.height > MAX_VIDEO_PIXELS:
+        raise InputError(
+            f"Driving video is {video.width}x{video.height}, over the {MAX_VIDEO_PIXELS / 1e6:g}MP limit"
+        )
+    output_frames = video.frames_at(FPS)
+    if output_frames < 1:
+        raise InputError("Driving video has no frames")
+
+    frame_cap = None
+    render_frames = video.frames_at(settings.fps)
+    if loop:
+        # The loop itself is encoded on the CPU at FPS; bound it like a driving video.
+        if MAX_DRIVING_FRAMES and loop[0] * FPS > MAX_DRIVING_FRAMES:
+            raise InputError(
+                f"loop_seconds {loop[0]:g} is over the {MAX_DRIVING_FRAMES / FPS:g}s "
+                f"({MAX_DRIVING_FRAMES}-frame) limit"
             )
-        else:
-            return {"error": "Provide one of: image_url, image_minio_path, image_base64"}
-
-        # --- Resolve driving video ---
-        video_path = None
-        if "driving_video_url" in job_input:
-            video_path = download_file(
-                job_input["driving_video_url"],
-                os.path.join(task_id, "driving_video.mp4"),
+        render_frames = min(render_frames, max(1, int(loop[2] * settings.fps)))
+    elif MAX_DRIVING_FRAMES and output_frames > MAX_DRIVING_FRAMES:
+        if not job_input.get("auto_trim", ADMISSION_AUTO_TRIM):
+            raise InputError(
+                f"Driving video is {video.duration_s:g}s ({output_frames} frames at {FPS} fps), over the "
+                f"{MAX_DRIVING_FRAMES}-frame limit; trim it or set auto_trim"
             )
-        elif "driving_video_base64" in job_input:
-            video_path = save_base64(
-                job_input["driving_video_base64"],
-                os.path.join(task_id, "driving_video.mp4"),
+        frame_cap = render_frames = max(1, MAX_DRIVING_FRAMES * settings.fps // FPS)
+        logger.info(f"Trimming driving video from {output_frames} to {MAX_DRIVING_FRAMES} frames")
+
+    megapixels = settings.width * settings.height / 1e6
+    estimate = {
+        "render_frames": render_frames,
+        "render_megapixels": round(megapixels, 3),
+        "gpu_seconds": round(COST_OVERHEAD_S + render_frames * megapixels * COST_S_PER_MEGAPIXEL_FRAME, 1),
+    }
+    probe = {"image": asdict(image), "video": asdict(video)}
+    return probe, estimate, frame_cap
+
+
+def _number_input(job_input, name, default, cast=float):
+    """`job_input[name]` as a finite number (`default` when absent); InputError otherwise."""
+    value = job_input.get(name)
+    if value is None or value == "":
+        return default
+    try:
+        number = cast(value)
+    except (TypeError, ValueError, OverflowError):
+        raise InputError(f"{name} must be a number, got {str(value)[:40]!r}")
+    if not math.isfinite(number):
+        raise InputError(f"{name} must be a finite number")
+    return number
+
+
+def _loop_request(job_input):
+    """(loop seconds, mode, rendered seconds) for a loop job, else None."""
+    seconds = _number_input(job_input, "loop_seconds", 0.0)
+    if seconds <= 0:
+        return None
+    mode = job_input.get("loop_mode") or "crossfade"
+    if mode not in LOOP_MODES:
+        raise InputError(f"loop_mode must be one of: {', '.join(LOOP_MODES)}")
+    render_seconds = _number_input(job_input, "loop_render_seconds", LOOP_RENDER_SECONDS)
+    if render_seconds <= 0:
+        raise InputError("loop_render_seconds must be positive")
+    # Ping-pong doubles the rendered span for free.
+    if mode == "pingpong":
+        render_seconds /= 2
+    return seconds, mode, min(render_seconds, seconds)
+
+
+@dataclass
+class RenderSettings:
+    """
+    What ComfyUI renders (`width` x `height` at `fps`) and what is delivered: the
+    `resolution` bucket's `out_width` x `out_height` at FPS.
+    """
+
+    quality: str
+    resolution: str
+    out_width: int
+    out_height: int
+    width: int
+    height: int
+    fps: int
+    interpolator: str
+
+
+def snap_resolution(width, height):
+    """Bucket closest in aspect ratio, then in pixel count, to `width` x `height`."""
+
+    def distance(item):
+        w, h = item[1]
+        return (
+            round(abs(math.log((w / h) / (width / height))), 1),
+            abs(math.log((w * h) / (width * height))),
+        )
+
+    return min(RESOLUTION_BUCKETS.items(), key=distance)[0]
+
+
+def resolve_resolution(job_input, image_path=None):
+    """
+    Bucket name for a job: `resolution` by name, "auto" to follow the reference image's
+    aspect ratio, or `width`/`height` snapped to the nearest bucket.
+    """
+    resolution = job_input.get("resolution")
+    if resolution == "auto" and image_path:
+        try:
+            image = probe_image(image_path)
+        except ProbeError as e:
+            raise InputError(f"Could not read reference image size for resolution=auto: {e}")
+        width, height = image.width, image.height
+        # Match the aspect ratio at the default bucket's pixel count.
+        default_w, default_h = RESOLUTION_BUCKETS[DEFAULT_RESOLUTION]
+        scale = math.sqrt(default_w * default_h / (width * height))
+        return snap_resolution(width * scale, height * scale)
+    if resolution:
+        if resolution not in RESOLUTION_BUCKETS:
+            raise InputError(f"resolution must be one of: auto, {', '.join(RESOLUTION_BUCKETS)}")
+        return resolution
+    if job_input.get("width") or job_input.get("height"):
+        try:
+            width, height = int(job_input["width"]), int(job_input["height"])
+        except (KeyError, TypeError, ValueError):
+            raise InputError("width and height must both be positive integers")
+        if width <= 0 or height <= 0:
+            raise InputError("width and height must both be positive integers")
+        return snap_resolution(width, height)
+    return DEFAULT_RESOLUTION
+
+
+def _draft_size(width, height):
+    return max(16, int(width * DRAFT_SCALE) // 16 * 16), max(16, int(height * DRAFT_SCALE) // 16 * 16)
+
+
+def resolve_render_settings(job_input, image_path=None):
+    quality = job_input.get("quality") or DEFAULT_QUALITY
+    if quality not in QUALITY_TIERS:
+        raise InputError(f"quality must be one of: {', '.join(QUALITY_TIERS)}")
+    resolution = resolve_resolution(job_input, image_path)
+    out_width, out_height = RESOLUTION_BUCKETS[resolution]
+    if quality == "draft":
+        settings = RenderSettings(
+            quality,
+            resolution,
+            out_width,
+            out_height,
+            *_draft_size(out_width, out_height),
+            DRAFT_RENDER_FPS,
+            DRAFT_INTERPOLATOR,
+        )
+    else:
+        settings = RenderSettings(
+            quality, resolution, out_width, out_height, out_width, out_height, RENDER_FPS, FRAME_INTERPOLATOR
+        )
+    settings.fps = _number_input(job_input, "render_fps", settings.fps, cast=int)
+    if not 1 <= settings.fps <= FPS:
+        raise InputError(f"render_fps must be between 1 and {FPS}")
+    return settings
+
+
+def _upscale(video_path, output_path, width, height):
+    subprocess.run(
+        [
+            "ffmpeg",
+            "-y",
+            "-hide_banner",
+            "-loglevel",
+            "error",
+            "-i",
+            video_path,
+            "-map",
+            "0:v",
+            "-map",
+            "0:a?",
+            "-vf",
+            f"scale={width}:{height}:flags=lanczos",
+            "-c:v",
+            "libx264",
+            "-crf",
+            "19",
+            "-pix_fmt",
+            "yuv420p",
+            "-c:a",
+            "copy",
+            "-movflags",
+            "+faststart",
+            output_path,
+        ],
+        check=True,
+    )
+
+
+def _segment_frames(job_input, fps=FPS):
+    seconds = _number_input(job_input, "segment_seconds", SEGMENT_SECONDS)
+    if seconds <= 0:
+        return 0
+    # Shorter windows spend more on per-prompt overhead than they save.
+    if seconds < 1:
+        raise InputError("segment_seconds must be at least 1 (or 0 to disable segmenting)")
+    return int(seconds * fps)
+
+
+def render_segmented(
+    workflow,
+    image_path,
+    video_path,
+    variant_id,
+    task_id,
+    minio_key,
+    segment_frames,
+    progress=None,
+    timer=None,
+    fps=FPS,
+    frame_cap=None,
+):
+    """
+    Render a long driving video as overlapping windows, one prompt each.
+
+    Each finished window is blended into the previous one and published to MinIO as an
+    HLS piece (on a background thread, while the next window renders), so the caller can
+    start playback from `hls_playlist_url` long before the job completes. Returns None
+    when the clip fits in one window; otherwise the stitched MP4 path plus segment info.
+    Windows and pieces are at the render rate `fps`; `frame_cap` trims the clip.
+    """
+    timer = timer or PhaseTimer()
+    total = count_frames(video_path, fps)
+    if frame_cap:
+        total = min(total, frame_cap)
+    overlap = min(SEGMENT_OVERLAP_FRAMES, segment_frames // 4)
+    segments = plan_segments(total, segment_frames, overlap)
+    if len(segments) == 1:
+        return None
+
+    workdir = os.path.join(task_id, f"{variant_id}_segments")
+    os.makedirs(workdir, exist_ok=True)
+    hls_prefix = f"{os.path.splitext(minio_key)[0]}_hls/"
+    playlist_key = f"{hls_prefix}index.m3u8"
+    playlist_path = os.path.join(workdir, "index.m3u8")
+    piece_urls = []
+    published = {"url": None, "error": None}
+
+    def publish(piece):
+        if published["error"]:
+            return
+        # Best effort: the stitched MP4 is still uploaded if incremental publishing fails.
+        try:
+            with timer.phase("segment_upload"):
+                piece_urls.append(upload_to_minio(piece.path, f"{hls_prefix}{piece.index:03d}.ts", "video/mp2t"))
+                with open(playlist_path, "w") as f:
+                    f.write(
+                        hls_playlist(
+                            stitcher.pieces, piece_urls, segment_frames / fps, ended=len(piece_urls) == len(segments)
+                        )
+                    )
+                published["url"] = upload_to_minio(playlist_path, playlist_key, "application/vnd.apple.mpegurl")
+        except Exception as e:
+            logger.warning(f"HLS publishing stopped at segment {piece.index}: {e}")
+            published["error"] = str(e)
+            return
+        if progress:
+            progress(
+                {
+                    "stage": "segment_ready",
+                    "segment": piece.index,
+                    "segments": len(segments),
+                    "hls_playlist_url": published["url"],
+                },
+                force=True,
             )
-        else:
-            minio_video_path = _sanitize_minio_key(job_input.get("driving_video_path") or DEFAULT_DRIVING_VIDEO_PATH)
-            if minio_video_path:
-                video_path = download_minio_object(
-                    minio_video_path,
-                    os.path.join(task_id, "driving_video.mp4"),
+
+    stitcher = SegmentStitcher(workdir, segments, fps, overlap, publish=publish)
+    logger.info(f"Rendering {total} frames as {len(segments)} segments ({overlap} frames overlap)")
+    segment_info = []
+    pending = []
+    try:
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            for segment in segments:
+                segment_id = f"{variant_id}_s{segment.index}"
+                segment_workflow = copy.deepcopy(workflow)
+                segment_workflow["63"]["inputs"]["skip_first_frames"] = segment.skip
+                segment_workflow["63"]["inputs"]["frame_load_cap"] = segment.frames
+                segment_progress = None
+                if progress:
+                    segment_progress = lambda update, force=False, i=segment.index: progress(
+                        dict(update, segment=i, segments=len(segments)), force=force
+                    )
+                trace = ExecutionTrace(segment_workflow, on_progress=segment_progress)
+                try:
+                    path = execute_workflow(segment_workflow, image_path, video_path, segment_id, trace, timer)
+                finally:
+                    _cleanup_staging(segment_id)
+                if not path:
+                    raise ComfyExecutionError(
+                        f"No video output from ComfyUI for segment {segment.index}", error_type="no_output"
+                    )
+                segment_info.append(
+                    {"index": segment.index, "skip_frames": segment.skip, "frames": segment.frames, "node_timings": trace.summary()}
                 )
-            elif template_id:
-                local_template_path = os.path.join(TEMPLATES_DIR, f"{template_id}.mp4")
-                if os.path.exists(local_template_path):
-                    video_path = local_template_path
-                else:
-                    available = [
-                        f.replace(".mp4", "")
-                        for f in os.listdir(TEMPLATES_DIR)
-                        if f.endswith(".mp4")
-                    ]
-                    return {
-                        "error": f"Template '{template_id}' not found. Available: {available}"
-                    }
-
-        if not video_path:
-            return {
-                "error": (
-                    "Provide one of: driving_video_url, driving_video_base64, "
-                    "driving_video_path, or template_id"
+                pending.append(pool.submit(stitcher.add, segment.index, path))
+            pending.append(pool.submit(stitcher.finish))
+            for future in pending:
+                future.result()
+        with timer.phase("segment_stitch"):
+            output_path = stitcher.finalize(os.path.join(workdir, "final.mp4"), audio_source=video_path)
+    except Exception:
+        # Rendered windows that never made it into a piece.
+        stitcher.discard()
+        raise
+
+    by_type = {}
+    for info in segment_info:
+        for class_type, seconds in info["node_timings"]["by_class_type"].items():
+            by_type[class_type] = round(by_type.get(class_type, 0.0) + seconds, 3)
+    return {
+        "output_path": output_path,
+        "segments": segment_info,
+        "hls_playlist_key": playlist_key if published["url"] else None,
+        "hls_playlist_url": published["url"],
+        "hls_error": published["error"],
+        "node_timings": {
+            "total_s": round(sum(i["node_timings"]["total_s"] for i in segment_info), 3),
+            "queue_wait_s": round(sum(i["node_timings"]["queue_wait_s"] for i in segment_info), 3),
+            "by_class_type": dict(sorted(by_type.items(), key=lambda kv: kv[1], reverse=True)),
+        },
+    }
+
+
+def upload_thumbnail(video_path, thumb_path, thumbnail_key, timer):
+    with timer.phase("thumbnail"):
+        os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+        _generate_thumbnail(video_path, thumb_path)
+        return upload_to_minio(thumb_path, thumbnail_key)
+
+
+def render_variant(
+    job_input,
+    image_path,
+    comfy_image_name,
+    video_path,
+    task_id,
+    minio_key,
+    output_thumbnail_key,
+    progress=None,
+    timer=None,
+):
+    """Run one (reference image, driving video) pair through ComfyUI and upload the result."""
+    timer = timer or PhaseTimer()
+    variant_id = f"{task_id}_{uuid.uuid4().hex[:6]}"
+    staged_files = []
+    output_path = None
+    template_id = job_input.get("template_id")
+    try:
+        job_seed = _job_seed(job_input)
+        loop = _loop_request(job_input)
+        settings = resolve_render_settings(job_input, image_path)
+        render_fps = settings.fps
+        with timer.phase("probe"):
+            probe, estimate, frame_cap = admit_inputs(job_input, image_path, video_path, settings, loop)
+        admission = {"probe": probe, "estimate": estimate}
+        if frame_cap:
+            admission["trimmed_to_frames"] = MAX_DRIVING_FRAMES
+
+        dedup_key = None
+        # Unseeded jobs only match on an explicit idempotency_key: without one, a repeat
+        # is a request for a new take.
+        if RESULT_DEDUP_ENABLED and (job_seed is not None or job_input.get("idempotency_key")):
+            with timer.phase("dedup_lookup"):
+                dedup_key = result_key(job_input, settings, image_path, video_path, job_seed)
+                previous = lookup_result(dedup_key) if job_input.get("dedupe", True) else None
+            if previous:
+                logger.info(f"Identical job already rendered ({dedup_key[:12]}): {previous['minio_key']}")
+                result = replay_result(
+                    previous, minio_key, output_thumbnail_key, os.path.join(task_id, variant_id), timer
                 )
-            }
-
-        # Comfy LoadImage/VHS_LoadVideo are most reliable when files are under /ComfyUI/input.
-        os.makedirs(COMFY_INPUT_DIR, exist_ok=True)
-        comfy_image_name = f"{task_id}_input_image.jpg"
-        comfy_video_name = f"{task_id}_driving_video.mp4"
-        comfy_image_path = os.path.join(COMFY_INPUT_DIR, comfy_image_name)
-        comfy_video_path = os.path.join(COMFY_INPUT_DIR, comfy_video_name)
-        shutil.copy2(image_path, comfy_image_path)
-        shutil.copy2(video_path, comfy_video_path)
-        comfy_input_files.extend([comfy_image_path, comfy_video_path])
-
-        # --- Load and configure workflow ---
-        with open(WORKFLOW_PATH, "r") as f:
-            workflow = json.load(f)
-
-        seed = random.randint(0, 2**32 - 1)
-
-        workflow["57"]["inputs"]["image"] = comfy_image_name
-        workflow["63"]["inputs"]["video"] = comfy_video_name
-        workflow["63"]["inputs"]["force_rate"] = FPS
-        workflow["30"]["inputs"]["frame_rate"] = FPS
-        workflow["30"]["inputs"]["save_output"] = True
-        # "sageattn" requires the optional `sageattention` package. Default to SDPA for portability.
-        workflow["22"]["inputs"]["attention_mode"] = os.getenv("WAN_ATTENTION_MODE", "sdpa")
-        workflow["65"]["inputs"]["positive_prompt"] = job_input.get("prompt", POSITIVE_PROMPT)
-        workflow["65"]["inputs"]["negative_prompt"] = job_input.get("negative_prompt", NEGATIVE_PROMPT)
-        workflow["27"]["inputs"]["seed"] = seed
-        workflow["27"]["inputs"]["cfg"] = CFG
-        workflow["27"]["inputs"]["steps"] = STEPS
-        workflow["150"]["inputs"]["value"] = WIDTH
-        workflow["151"]["inputs"]["value"] = HEIGHT
+                return dict(result, template_id=template_id, deduplicated=True, **admission)
+
+        with timer.phase("staging"):
+            comfy_video_name = stage_comfy_input(video_path, f"{variant_id}_driving_video.mp4", staged_files)
+
+        seed = random.randint(0, 2**32 - 1) if job_seed is None else job_seed
+        with timer.phase("workflow_load"):
+            workflow = build_workflow(
+                job_input,
+                comfy_image_name,
+                comfy_video_name,
+                seed,
+                fps=render_fps,
+                width=settings.width,
+                height=settings.height,
+            )
+            if loop:
+                workflow["63"]["inputs"]["frame_load_cap"] = max(1, int(loop[2] * render_fps))
+                workflow["30"]["inputs"]["pingpong"] = loop[1] == "pingpong"
+            elif frame_cap:
+                workflow["63"]["inputs"]["frame_load_cap"] = frame_cap
+        # The caches may swap nodes in and out, so the trace reads class_types from the
+        # workflow as it is finally queued.
+        trace = ExecutionTrace(workflow, on_progress=progress)
+        segment_frames = 0 if loop else _segment_frames(job_input, render_fps)
+        segmented = None
 
         # --- Run through ComfyUI ---
-        ws = connect_comfyui()
         try:
-            output_path = wait_for_completion(ws, workflow)
-        finally:
-            ws.close()
+            if segment_frames:
+                segmented = render_segmented(
+                    workflow,
+                    image_path,
+                    video_path,
+                    variant_id,
+                    task_id,
+                    minio_key,
+                    segment_frames,
+                    progress,
+                    timer,
+                    fps=render_fps,
+                    frame_cap=frame_cap,
+                )
+            if segmented:
+                output_path = segmented.pop("output_path")
+            else:
+                output_path = execute_workflow(workflow, image_path, video_path, variant_id, trace, timer)
+        except ComfyExecutionError as e:
+            logger.error(f"ComfyUI execution failed: {e}")
+            result = e.to_result()
+            result.update(
+                {"seed": seed, "template_id": template_id, "quality": settings.quality, "node_timings": trace.summary()}
+            )
+            return result
 
         if not output_path:
-            return {"error": "No video output from ComfyUI"}
+            return {"error": "No video output from ComfyUI", "node_timings": trace.summary()}
 
         logger.info(f"Generated video: {output_path}")
-
-        # --- Upload to MinIO ---
-        user_id = job_input.get("user_id", "unknown")
-        avatar_id = job_input.get("avatar_id", uuid.uuid4().hex[:8])
-        timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-
-        output_video_key = job_input.get("output_video_key") or job_input.get("output_key")
-        output_video_prefix = job_input.get("output_video_prefix") or job_input.get("output_prefix")
-        if output_video_key:
-            minio_key = _sanitize_minio_key(str(output_video_key))
-        elif output_video_prefix:
-            output_video_prefix = _sanitize_minio_key(str(output_video_prefix)).rstrip("/")
-            minio_key = f"{output_video_prefix}/idle_{timestamp}.mp4"
+        if segmented:
+            node_timings = segmented.pop("node_timings")
         else:
-            minio_key = f"{user_id}/{avatar_id}/idle_{timestamp}.mp4"
-
-        output_thumbnail_key = job_input.get("output_thumbnail_key") or job_input.get("thumbnail_key")
-        output_thumbnail_key = _sanitize_minio_key(str(output_thumbnail_key)) if output_thumbnail_key else None
+            node_timings = trace.summary()
+        extra = dict(segmented or {}, quality=settings.quality, **admission)
+        os.makedirs(task_id, exist_ok=True)
+
+        # Interpolate before upscaling: motion estimation is cheaper on fewer pixels.
+        if render_fps != FPS:
+            interpolated_path = os.path.join(task_id, f"{variant_id}_{FPS}fps.mp4")
+            with timer.phase("interpolation"):
+                get_interpolator(settings.interpolator)(output_path, interpolated_path, FPS)
+            os.remove(output_path)
+            output_path = interpolated_path
+            extra.update(render_fps=render_fps, interpolator=settings.interpolator)
+
+        if (settings.width, settings.height) != (settings.out_width, settings.out_height):
+            upscaled_path = os.path.join(task_id, f"{variant_id}_{settings.out_width}x{settings.out_height}.mp4")
+            with timer.phase("upscale"):
+                _upscale(output_path, upscaled_path, settings.out_width, settings.out_height)
+            os.remove(output_path)
+            output_path = upscaled_path
+            extra.update(render_width=settings.width, render_height=settings.height)
+
+        if loop:
+            loop_path = os.path.join(task_id, f"{variant_id}_loop.mp4")
+            with timer.phase("loop_synthesis"):
+                info = make_loop(output_path, loop_path, loop[0], FPS, loop[1], LOOP_BLEND_FRAMES)
+            os.remove(output_path)
+            output_path = loop_path
+            extra["loop"] = asdict(info)
+            logger.info(f"Built {info.seconds}s {info.mode} loop from {info.source_frames} rendered frames")
 
+        # --- Upload to MinIO ---
+        if progress:
+            progress({"stage": "uploading"}, force=True)
         try:
-            presigned_url = upload_to_minio(output_path, minio_key)
-            logger.info(f"Uploaded to MinIO: {minio_key}")
-
             thumbnail_url = None
-            if output_thumbnail_key:
-                try:
-                    thumb_path = os.path.join(task_id, "thumb.jpg")
-                    _generate_thumbnail(output_path, thumb_path)
-                    thumbnail_url = upload_to_minio(thumb_path, output_thumbnail_key)
-                except Exception as e:
-                    logger.warning(f"Thumbnail generation/upload skipped: {e}")
-
-            return {
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                # The thumbnail is extracted and uploaded while the video uploads.
+                thumbnail = (
+                    pool.submit(
+                        upload_thumbnail,
+                        output_path,
+                        os.path.join(task_id, f"{variant_id}_thumb.jpg"),
+                        output_thumbnail_key,
+                        timer,
+                    )
+                    if output_thumbnail_key
+                    else None
+                )
+                with timer.phase("upload"):
+                    presigned_url = upload_to_minio(output_path, minio_key)
+                logger.info(f"Uploaded to MinIO: {minio_key}")
+                if thumbnail:
+                    try:
+                        thumbnail_url = thumbnail.result()
+                    except Exception as e:
+                        logger.warning(f"Thumbnail generation/upload skipped: {e}")
+
+            result = {
                 "minio_key": minio_key,
                 "video_url": presigned_url,
                 "thumbnail_key": output_thumbnail_key,
@@ -414,9 +2347,15 @@ def handler(job):
                 "seed": seed,
                 "template_id": template_id,
                 "fps": FPS,
-                "width": WIDTH,
-                "height": HEIGHT,
+                "width": settings.out_width,
+                "height": settings.out_height,
+                "resolution": settings.resolution,
+                "node_timings": node_timings,
+                **extra,
             }
+            if dedup_key:
+                record_result(dedup_key, result)
+            return result
         except Exception as e:
             logger.error(f"MinIO upload failed: {e}")
             output_size_mb = os.path.getsize(output_path) / (1024 * 1024)
@@ -431,31 +2370,211 @@ def handler(job):
                     "minio_error": str(e),
                 }
 
-            with open(output_path, "rb") as f:
-                video_b64 = base64.b64encode(f.read()).decode("utf-8")
+            with timer.phase("base64_fallback"):
+                video_b64 = encode_file(output_path)
             return {
                 "video_base64": video_b64,
                 "seed": seed,
                 "template_id": template_id,
                 "minio_error": str(e),
                 "fps": FPS,
-                "width": WIDTH,
-                "height": HEIGHT,
+                "width": settings.out_width,
+                "height": settings.out_height,
+                "resolution": settings.resolution,
+                "node_timings": node_timings,
+                **extra,
             }
     finally:
-        shutil.rmtree(task_id, ignore_errors=True)
-        for comfy_input_file in comfy_input_files:
-            try:
-                os.remove(comfy_input_file)
-            except OSError:
-                pass
-        if output_path:
+        with timer.phase("cleanup"):
+            _cleanup_staging(variant_id)
+            for staged_file in staged_files:
+                try:
+                    os.remove(staged_file)
+                except OSError:
+                    pass
+            if output_path:
+                try:
+                    if os.path.isfile(output_path):
+                        os.remove(output_path)
+                except OSError:
+                    pass
+
+
+def _fanout_items(job_input):
+    entries = job_input.get("driving_video_paths")
+    if not isinstance(entries, list) or not entries:
+        raise InputError("driving_video_paths must be a non-empty list")
+    items = []
+    for i, entry in enumerate(entries):
+        if not isinstance(entry, (str, dict)) or not entry:
+            raise InputError(f"driving_video_paths[{i}] must be a path or an object")
+        item = {"driving_video_path": entry} if isinstance(entry, str) else dict(entry)
+        source = item.get("driving_video_path") or item.get("driving_video_url") or item.get("template_id") or ""
+        stem = os.path.splitext(os.path.basename(urllib.parse.urlsplit(str(source)).path))[0]
+        item.setdefault("name", f"{i}_{stem}" if stem else str(i))
+        items.append(item)
+    return items
+
+
+def run_fanout(job_input, image_path, comfy_image_name, task_id, progress=None, timer=None, items=None):
+    """
+    One reference image against N driving videos in a single job.
+
+    The image is resolved and staged once; the prompt and reference-image conditioning are
+    encoded by the first variant and served from the embedding caches for the rest.
+    """
+    timer = timer or PhaseTimer()
+    results = []
+    items = items or _fanout_items(job_input)
+    # One default avatar_id for the whole job, so every variant lands under the same prefix.
+    job_input = dict(job_input, avatar_id=job_input.get("avatar_id") or uuid.uuid4().hex[:8])
+    for index, item in enumerate(items):
+        result = {"index": index, "name": item["name"]}
+        item_progress = progress.scoped(item=index, items=len(items), name=item["name"]) if progress else None
+        try:
+            with timer.phase("resolve_inputs"):
+                video_path = resolve_driving_video(item, task_id, name=f"driving_video_{index}")
+            minio_key, thumbnail_key = resolve_output_keys(job_input, item, variant=item["name"])
+            result.update(
+                render_variant(
+                    dict(job_input, template_id=item.get("template_id")),
+                    image_path,
+                    comfy_image_name,
+                    video_path,
+                    task_id,
+                    minio_key,
+                    thumbnail_key,
+                    progress=item_progress,
+                    timer=timer,
+                )
+            )
+        except InputError as e:
+            result["error"] = str(e)
+        except Exception as e:
+            logger.exception(f"Fan-out item {index} failed")
+            result["error"] = str(e)
+        result["status"] = "FAILED" if result.get("error") else "COMPLETED"
+        results.append(result)
+
+    completed = sum(1 for r in results if r["status"] == "COMPLETED")
+    return {"results": results, "completed": completed, "failed": len(results) - completed}
+
+
+def run_job(job_input, task_id, staged_files, progress, timer):
+    # Validated before any input is fetched.
+    items = _fanout_items(job_input) if job_input.get("driving_video_paths") is not None else None
+    progress({"stage": "resolving_inputs"}, force=True)
+    with timer.phase("resolve_inputs"):
+        image_path = resolve_image_input(job_input, task_id)
+    with timer.phase("staging"):
+        comfy_image_name = stage_comfy_input(image_path, f"{task_id}_input_image.jpg", staged_files)
+
+    if items:
+        return run_fanout(job_input, image_path, comfy_image_name, task_id, progress, timer, items=items)
+
+    with timer.phase("resolve_inputs"):
+        video_path = resolve_driving_video(job_input, task_id)
+    minio_key, output_thumbnail_key = resolve_output_keys(job_input)
+    return render_variant(
+        job_input,
+        image_path,
+        comfy_image_name,
+        video_path,
+        task_id,
+        minio_key,
+        output_thumbnail_key,
+        progress=progress,
+        timer=timer,
+    )
+
+
+def handler(job):
+    job_input = job.get("input", {})
+    logger.info(f"Received job: {json.dumps({k: v[:50] + '...' if isinstance(v, str) and len(v) > 50 else v for k, v in job_input.items()})}")
+
+    task_id = f"task_{uuid.uuid4().hex[:12]}"
+    staged_files = []
+    progress = ProgressReporter(job)
+    timer = PhaseTimer()
+    try:
+        result = run_job(job_input, task_id, staged_files, progress, timer)
+    except InputError as e:
+        result = {"error": str(e), "error_type": "invalid_input"}
+    except ComfyExecutionError as e:
+        logger.error(f"Job {task_id} failed in ComfyUI: {e}")
+        result = e.to_result()
+    except Exception as e:
+        # Anything else (ffmpeg post-processing, MinIO, URL inputs) still gets a structured
+        # result with timings rather than a RunPod-level failure.
+        logger.exception(f"Job {task_id} failed")
+        result = {"error": str(e) or type(e).__name__, "error_type": "internal_error", "exception": type(e).__name__}
+    finally:
+        with timer.phase("cleanup"):
+            shutil.rmtree(task_id, ignore_errors=True)
+            for staged_file in staged_files:
+                try:
+                    os.remove(staged_file)
+                except OSError:
+                    pass
+            # Inputs that failed before staging (e.g. a rejected driving video) too.
+            cleanup_comfy_inputs(task_id)
+
+    result["timings"] = timer.report()
+    logger.info(f"Job {task_id} timings: {json.dumps(result['timings'])}")
+    log_timings(job, task_id, result)
+    return result
+
+
+async def async_handler(job):
+    """Concurrent mode: each job runs on its own thread; ComfyUI events are demultiplexed by prompt_id."""
+    return await asyncio.to_thread(handler, job)
+
+
+def concurrency_modifier(current_concurrency):
+    return MAX_CONCURRENT_JOBS
+
+
+def _warm_instance(session):
+    for resolution in WARMUP_BUCKETS:
+        if resolution not in RESOLUTION_BUCKETS:
+            logger.warning(f"Unknown warmup bucket {resolution!r}; known: {', '.join(RESOLUTION_BUCKETS)}")
+            continue
+        for quality in WARMUP_QUALITIES:
             try:
-                if os.path.isfile(output_path):
-                    os.remove(output_path)
-            except OSError:
-                pass
+                run_warmup(session, resolution, quality)
+            except Exception as e:
+                logger.warning(
+                    f"Warmup of {resolution} ({quality}) failed on port {session.port} "
+                    f"(first job there will compile): {e}"
+                )
+
+
+def warm_all_instances():
+    """Each ComfyUI process compiles its own graphs; warm them in parallel (one per GPU)."""
+    sessions = get_comfy_router().sessions
+    with ThreadPoolExecutor(max_workers=len(sessions)) as pool:
+        list(pool.map(_warm_instance, sessions))
 
 
 if os.getenv("RUNPOD_START_SERVERLESS", "true").lower() == "true":
-    runpod.serverless.start({"handler": handler})
+    # Connect once at boot so the first job doesn't pay the readiness probe + handshake.
+    for session in get_comfy_router().sessions:
+        try:
+            session.ensure_connected()
+        except Exception as e:
+            logger.warning(f"ComfyUI on port {session.port} not connected at boot (will retry per job): {e}")
+    if PRIME_TEXT_EMBEDS:
+        try:
+            prime_text_embeds()
+        except Exception as e:
+            logger.warning(f"Text embed priming failed: {e}")
+    if WARMUP_ON_START:
+        warm_all_instances()
+    if MAX_CONCURRENT_JOBS > 1:
+        logger.info(
+            f"Serving up to {MAX_CONCURRENT_JOBS} concurrent jobs on {COMFYUI_INSTANCES} ComfyUI instance(s) "
+            f"({MAX_PROMPTS_IN_FLIGHT} prompts in flight each)"
+        )
+        runpod.serverless.start({"handler": async_handler, "concurrency_modifier": concurrency_modifier})
+    else:
+        runpod.serverless.start({"handler": handler})
@@ -0,0 +1,219 @@
+"""
+Resilient HTTP(S) downloads for `image_url` / `driving_video_url` inputs.
+
+When the server advertises byte ranges and the file is large enough, it is fetched as
+several concurrent `Range` requests written into place with `os.pwrite`; otherwise as one
+stream. Every request has a socket timeout, so a stalled connection fails fast and is
+retried (with backoff) from the last byte received instead of from zero. A single-stream
+download also resumes from an existing `<dest>.part` (guarded by `If-Range`).
+
+`max_bytes` rejects oversized inputs from the advertised size before any body is read,
+and enforces the limit while streaming when the size is unknown.
+
+    python http_download.py URL DEST [--connections 4] [--max-mb 500]
+"""
+
+import argparse
+import http.client
+import logging
+import os
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+CHUNK_BYTES = 1024 * 1024
+# Below this size per connection, extra connections cost more than they save.
+MIN_SEGMENT_BYTES = 8 * 1024 * 1024
+
+
+class DownloadError(Exception):
+    pass
+
+
+class DownloadTooLarge(DownloadError):
+    pass
+
+
+@dataclass
+class RemoteFile:
+    size: Optional[int]
+    accepts_ranges: bool
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+    @property
+    def validator(self) -> Optional[str]:
+        return self.etag or self.last_modified
+
+
+def probe(url: str, timeout: float = 30) -> RemoteFile:
+    """
+    Size, range support and validator (ETag / Last-Modified) of `url`.
+
+    Uses a 1-byte ranged GET rather than HEAD: presigned S3/MinIO URLs are method-specific
+    and reject HEAD.
+    """
+    req = urllib.request.Request(url, headers={"Range": "bytes=0-0"})
+    with urllib.request.urlopen(req, timeout=timeout) as response:
+        headers = response.headers
+        validators = (headers.get("ETag"), headers.get("Last-Modified"))
+        if response.status == 206:
+            total = headers.get("Content-Range", "").rpartition("/")[2]
+            return RemoteFile(int(total) if total.isdigit() else None, True, *validators)
+        length = headers.get("Content-Length")
+        return RemoteFile(int(length) if length and length.isdigit() else None, False, *validators)
+
+
+def _check_size(size, max_bytes, url):
+    if max_bytes and size is not None and size > max_bytes:
+        raise DownloadTooLarge(
+            f"{url[:80]} is {size / 1024 / 1024:.1f}MB, over the {max_bytes / 1024 / 1024:g}MB limit"
+        )
+
+
+def _with_retries(fn, retries, what):
+    for attempt in range(retries + 1):
+        try:
+            return fn()
+        except DownloadTooLarge:
+            raise
+        except urllib.error.HTTPError as e:
+            # 4xx other than throttling won't get better by retrying.
+            if (400 <= e.code < 500 and e.code not in (408, 429)) or attempt == retries:
+                raise
+            logger.warning(f"{what}: HTTP {e.code}, retrying ({attempt + 1}/{retries})")
+        except (DownloadError, urllib.error.URLError, http.client.HTTPException, OSError) as e:
+            if attempt == retries:
+                raise
+            logger.warning(f"{what}: {e}, retrying ({attempt + 1}/{retries})")
+        time.sleep(min(2**attempt, 10))
+
+
+def _download_segment(url, fd, start, end, state, timeout, retries):
+    """Fetch bytes [start, end] into fd at their offsets; `state[start]` tracks progress."""
+
+    def attempt():
+        offset = start + state[start]
+        if offset > end:
+            return
+        req = urllib.request.Request(url, headers={"Range": f"bytes={offset}-{end}"})
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            if response.status != 206:
+                raise DownloadError(f"server ignored Range for bytes {offset}-{end}")
+            while True:
+                chunk = response.read(CHUNK_BYTES)
+                if not chunk:
+                    break
+                os.pwrite(fd, chunk, start + state[start])
+                state[start] += len(chunk)
+        if start + state[start] <= end:
+            raise DownloadError(f"connection closed early at byte {start + state[start]} of {end}")
+
+    _with_retries(attempt, retries, f"bytes {start}-{end}")
+
+
+def _download_parallel(url, part, size, connections, timeout, retries):
+    segment = max(MIN_SEGMENT_BYTES, -(-size // connections))
+    ranges = [(start, min(start + segment, size) - 1) for start in range(0, size, segment)]
+    state = {start: 0 for start, _ in ranges}
+    fd = os.open(part, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        os.ftruncate(fd, size)
+        with ThreadPoolExecutor(max_workers=len(ranges)) as pool:
+            futures = [
+                pool.submit(_download_segment, url, fd, start, end, state, timeout, retries) for start, end in ranges
+            ]
+            for future in futures:
+                future.result()
+    finally:
+        os.close(fd)
+
+
+def _download_stream(url, part, remote, max_bytes, timeout, retries):
+    def attempt():
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        headers = {}
+        if offset and remote.accepts_ranges:
+            headers["Range"] = f"bytes={offset}-"
+            if remote.validator:
+                headers["If-Range"] = remote.validator
+        req = urllib.request.Request(url, headers=headers)
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            mode = "ab" if response.status == 206 else "wb"
+            written = offset if mode == "ab" else 0
+            with open(part, mode) as f:
+                while True:
+                    chunk = response.read(CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    written += len(chunk)
+                    if max_bytes and written > max_bytes:
+                        raise DownloadTooLarge(
+                            f"{url[:80]} exceeded the {max_bytes / 1024 / 1024:g}MB limit while downloading"
+                        )
+                    f.write(chunk)
+        if remote.size is not None and written < remote.size:
+            raise DownloadError(f"connection closed early at byte {written} of {remote.size}")
+
+    _with_retries(attempt, retries, url[:80])
+
+
+def download(
+    url: str,
+    dest: str,
+    max_bytes: Optional[int] = None,
+    connections: int = 4,
+    retries: int = 4,
+    timeout: float = 30,
+    remote: Optional[RemoteFile] = None,
+) -> str:
+    """
+    Download `url` to `dest` (atomically, via `<dest>.part`) and return `dest`.
+
+    Pass `remote` when the caller already probed `url`, to skip a second probe.
+    """
+    if remote is None:
+        remote = _with_retries(lambda: probe(url, timeout), retries, f"probe {url[:80]}")
+    _check_size(remote.size, max_bytes, url)
+    os.makedirs(os.path.dirname(dest) or ".", exist_ok=True)
+    part = dest + ".part"
+    started = time.monotonic()
+    try:
+        if remote.accepts_ranges and remote.size and connections > 1 and remote.size >= 2 * MIN_SEGMENT_BYTES:
+            _download_parallel(url, part, remote.size, connections, timeout, retries)
+        else:
+            _download_stream(url, part, remote, max_bytes, timeout, retries)
+    except DownloadTooLarge:
+        if os.path.exists(part):
+            os.remove(part)
+        raise
+    os.replace(part, dest)
+    size = os.path.getsize(dest)
+    elapsed = time.monotonic() - started
+    logger.info(f"Downloaded {url[:80]} -> {dest} ({size / 1024 / 1024:.1f}MB in {elapsed:.1f}s)")
+    return dest
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Parallel, resumable HTTP download")
+    parser.add_argument("url")
+    parser.add_argument("dest")
+    parser.add_argument("--connections", type=int, default=4)
+    parser.add_argument("--retries", type=int, default=4)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--max-mb", type=float, default=0)
+    args = parser.parse_args()
+    download(
+        args.url,
+        args.dest,
+        max_bytes=int(args.max_mb * 1024 * 1024) or None,
+        connections=args.connections,
+        retries=args.retries,
+        timeout=args.timeout,
+    )
@@ -0,0 +1,195 @@
+"""
+On-disk LRU cache for job inputs (driving videos, reference images).
+
+Entries are content-addressed by a hash of the source identity plus its validator
+(MinIO bucket/key + ETag, or URL + ETag/Last-Modified), so a changed object never
+serves stale bytes. Fills are atomic (temp file + os.replace) and serialised per key
+with flock, so concurrent jobs asking for the same input download it once.
+
+`link_or_copy` places cached entries (or bundled templates) where ComfyUI reads them
+without copying the bytes.
+"""
+
+import fcntl
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# linux/fs.h FICLONE: share extents between two files (btrfs, xfs, overlayfs on those).
+_FICLONE = 0x40049409
+
+
+def cache_key(*parts) -> str:
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(str(part).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def _reflink(src: str, dest: str) -> None:
+    with open(src, "rb") as src_file, open(dest, "wb") as dest_file:
+        fcntl.ioctl(dest_file.fileno(), _FICLONE, src_file.fileno())
+
+
+def link_or_copy(src: str, dest: str, allow_symlink: bool = False) -> str:
+    """
+    Make `src` available at `dest` without copying bytes where possible; return the method.
+
+    Hardlinks and reflinks give `dest` its own directory entry, so evicting `src` from the
+    cache mid-job is harmless and removing `dest` never touches `src`. Symlinks are only
+    used when the caller says `src` is never evicted or rewritten (bundled templates).
+    Copies are the fallback, e.g. across filesystems.
+    """
+    src = os.path.realpath(src)
+    tmp = f"{dest}.{os.getpid()}.{threading.get_ident()}.tmp"
+    if os.path.lexists(tmp):
+        os.remove(tmp)
+    method = None
+    if allow_symlink:
+        os.symlink(src, tmp)
+        method = "symlink"
+    if method is None:
+        try:
+            os.link(src, tmp)
+            method = "hardlink"
+        except OSError:
+            pass
+    if method is None:
+        try:
+            _reflink(src, tmp)
+            method = "reflink"
+        except OSError:
+            if os.path.lexists(tmp):
+                os.remove(tmp)
+    if method is None:
+        shutil.copyfile(src, tmp)
+        method = "copy"
+    os.replace(tmp, dest)
+    return method
+
+
+class InputCache:
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._objects_dir = os.path.join(root, "objects")
+        self._locks_dir = os.path.join(root, "locks")
+        os.makedirs(self._objects_dir, exist_ok=True)
+        os.makedirs(self._locks_dir, exist_ok=True)
+
+    def path_for(self, key: str, suffix: str = "") -> str:
+        return os.path.join(self._objects_dir, key[:2], key + suffix)
+
+    @contextmanager
+    def _flock(self, name: str):
+        lock_path = os.path.join(self._locks_dir, name + ".lock")
+        with open(lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def get(self, key: str, suffix: str = "") -> Optional[str]:
+        path = self.path_for(key, suffix)
+        if os.path.isfile(path):
+            # mtime is the LRU clock (atime is unreliable on noatime mounts).
+            try:
+                os.utime(path)
+            except OSError:
+                return None
+            return path
+        return None
+
+    def fetch(self, key: str, fill: Callable[[str], None], suffix: str = "") -> str:
+        """
+        Return the cached path for `key`, calling `fill(tmp_path)` to populate it on a miss.
+        """
+        path = self.get(key, suffix)
+        if path:
+            logger.info(f"Input cache hit: {key[:12]}")
+            return path
+
+        path = self.path_for(key, suffix)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._flock(key):
+            # Another job may have filled it while we waited for the lock.
+            if self.get(key, suffix):
+                logger.info(f"Input cache hit after wait: {key[:12]}")
+                return path
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                fill(tmp)
+                os.replace(tmp, path)
+            finally:
+                # A failed download leaves its partial `<tmp>.part` behind; the name is
+                # unique to this attempt, so it would never be resumed or evicted.
+                for leftover in (tmp, tmp + ".part"):
+                    if os.path.exists(leftover):
+                        os.remove(leftover)
+        logger.info(f"Input cache fill: {key[:12]} ({os.path.getsize(path)} bytes)")
+        self.evict(keep=path)
+        return path
+
+    def put(self, key: str, src_path: str, suffix: str = "") -> str:
+        """Adopt an already-written file (same filesystem) as the entry for `key`."""
+        path = self.path_for(key, suffix)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._flock(key):
+            os.replace(src_path, path)
+        self.evict(keep=path)
+        return path
+
+    def _entries(self):
+        entries = []
+        for dirpath, _, filenames in os.walk(self._objects_dir):
+            for name in filenames:
+                if name.endswith((".tmp", ".part")):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def evict(self, keep: Optional[str] = None, protect_s: float = 300) -> None:
+        """
+        Drop least-recently-used entries until the cache fits its byte budget.
+
+        Entries used within `protect_s` seconds are kept even over budget: they are most
+        likely about to be read by an in-flight job.
+        """
+        with self._flock("_evict"):
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            now = time.time()
+            for mtime, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                if path == keep or now - mtime < protect_s:
+                    continue
+                try:
+                    os.remove(path)
+                    total -= size
+                    logger.info(f"Input cache evicted {os.path.basename(path)} ({size} bytes)")
+                except OSError:
+                    pass
+
+    def stats(self) -> dict:
+        entries = self._entries()
+        return {
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+            "oldest_age_s": round(time.time() - min((m for m, _, _ in entries), default=time.time()), 1),
+        }
@@ -0,0 +1,122 @@
+"""
+Cheap inspection of resolved job inputs, so pathological media is rejected (or trimmed)
+before it reaches ComfyUI.
+
+Videos are read with ffprobe (container/stream headers only, no decode); images with
+Pillow, which reads just the header, falling back to ffprobe without Pillow.
+
+    python input_probe.py driving.mp4 reference.jpg
+"""
+
+import json
+import os
+import subprocess
+import sys
+from dataclasses import dataclass
+from typing import Optional
+
+
+class ProbeError(Exception):
+    pass
+
+
+@dataclass
+class VideoProbe:
+    width: int
+    height: int
+    codec: str
+    duration_s: float
+    fps: float
+    frames: int
+    has_audio: bool
+    size_bytes: int
+
+    def frames_at(self, fps: float) -> int:
+        """Frame count after resampling to `fps` (VHS_LoadVideo's force_rate)."""
+        return int(self.duration_s * fps)
+
+
+@dataclass
+class ImageProbe:
+    width: int
+    height: int
+    format: Optional[str]
+    size_bytes: int
+
+
+def _ffprobe(path: str) -> dict:
+    try:
+        out = subprocess.check_output(
+            [
+                "ffprobe",
+                "-v",
+                "error",
+                "-show_entries",
+                "format=duration:stream=codec_type,codec_name,width,height,avg_frame_rate,nb_frames,duration",
+                "-of",
+                "json",
+                path,
+            ],
+            stderr=subprocess.PIPE,
+        )
+    except subprocess.CalledProcessError as e:
+        raise ProbeError(f"ffprobe could not read {os.path.basename(path)}: {e.stderr.decode(errors='replace').strip()}")
+    return json.loads(out)
+
+
+def _rate(value: str) -> float:
+    num, _, den = (value or "0/1").partition("/")
+    try:
+        return float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+
+
+def probe_video(path: str) -> VideoProbe:
+    info = _ffprobe(path)
+    streams = info.get("streams") or []
+    video = next((s for s in streams if s.get("codec_type") == "video"), None)
+    if video is None:
+        raise ProbeError(f"{os.path.basename(path)} has no video stream")
+    fps = _rate(video.get("avg_frame_rate"))
+    duration = float(video.get("duration") or (info.get("format") or {}).get("duration") or 0)
+    frames = int(video.get("nb_frames") or 0) or int(duration * fps)
+    return VideoProbe(
+        width=int(video.get("width") or 0),
+        height=int(video.get("height") or 0),
+        codec=video.get("codec_name") or "unknown",
+        duration_s=round(duration, 3),
+        fps=round(fps, 3),
+        frames=frames,
+        has_audio=any(s.get("codec_type") == "audio" for s in streams),
+        size_bytes=os.path.getsize(path),
+    )
+
+
+def probe_image(path: str) -> ImageProbe:
+    try:
+        from PIL import Image
+    except ImportError:
+        video = next((s for s in _ffprobe(path).get("streams") or [] if s.get("width")), None)
+        if video is None:
+            raise ProbeError(f"{os.path.basename(path)} is not a readable image")
+        return ImageProbe(int(video["width"]), int(video["height"]), video.get("codec_name"), os.path.getsize(path))
+
+    try:
+        with Image.open(path) as img:
+            width, height = img.size
+            # EXIF orientation 5-8 means the stored image is rotated a quarter turn.
+            if (img.getexif() or {}).get(0x0112) in (5, 6, 7, 8):
+                width, height = height, width
+            return ImageProbe(width, height, img.format, os.path.getsize(path))
+    except Exception as e:
+        raise ProbeError(f"{os.path.basename(path)} is not a readable image: {e}")
+
+
+if __name__ == "__main__":
+    from dataclasses import asdict
+
+    for arg in sys.argv[1:]:
+        is_image = os.path.splitext(arg)[1].lower() in (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+        result = probe_image(arg) if is_image else probe_video(arg)
+        print(arg, json.dumps(asdict(result)))
@@ -0,0 +1,91 @@
+"""
+Frame-rate up-conversion for renders sampled below the output rate.
+
+The handler can diffuse the driving video at a reduced `render_fps` (e.g. 12) and bring
+the result back to the contracted 24 fps here, on the CPU. Interpolators are looked up by
+name in `INTERPOLATORS`, or given as `module:function` to plug in another one (e.g. a
+RIFE/FILM wrapper) with the signature `fn(src_path, out_path, fps)`.
+
+- `minterpolate`: ffmpeg motion-compensated interpolation (best quality, slowest)
+- `blend`: ffmpeg `framerate` cross-blending (fast; soft on large motion)
+- `duplicate`: repeat frames (fastest; visibly steppy)
+
+    python interpolate.py render_12fps.mp4 out_24fps.mp4 --fps 24 --method blend
+"""
+
+import argparse
+import importlib
+import subprocess
+from typing import Callable, Dict
+
+# Motion-compensated with overlapped block MC and variable-size blocks; bidirectional
+# search suits the small, smooth motion of avatar footage.
+_MINTERPOLATE = "minterpolate=fps={fps}:mi_mode=mci:mc_mode=aobmc:me_mode=bidir:vsbmc=1"
+
+
+def _ffmpeg_filter(vf: str) -> Callable[[str, str, float], None]:
+    def run(src_path: str, out_path: str, fps: float) -> None:
+        subprocess.run(
+            [
+                "ffmpeg",
+                "-y",
+                "-hide_banner",
+                "-loglevel",
+                "error",
+                "-i",
+                src_path,
+                "-map",
+                "0:v",
+                "-map",
+                "0:a?",
+                "-vf",
+                vf.format(fps=fps),
+                "-r",
+                str(fps),
+                "-c:v",
+                "libx264",
+                "-crf",
+                "19",
+                "-pix_fmt",
+                "yuv420p",
+                "-c:a",
+                "copy",
+                "-movflags",
+                "+faststart",
+                out_path,
+            ],
+            check=True,
+        )
+
+    return run
+
+
+INTERPOLATORS: Dict[str, Callable[[str, str, float], None]] = {
+    "minterpolate": _ffmpeg_filter(_MINTERPOLATE),
+    "blend": _ffmpeg_filter("framerate=fps={fps}"),
+    "duplicate": _ffmpeg_filter("fps={fps}"),
+}
+
+
+def get_interpolator(name: str) -> Callable[[str, str, float], None]:
+    if name in INTERPOLATORS:
+        return INTERPOLATORS[name]
+    module, sep, attr = name.partition(":")
+    if not sep:
+        raise ValueError(f"Unknown interpolator {name!r}; expected one of {', '.join(INTERPOLATORS)} or module:function")
+    return getattr(importlib.import_module(module), attr)
+
+
+def interpolate(src_path: str, out_path: str, fps: float, method: str = "minterpolate") -> str:
+    get_interpolator(method)(src_path, out_path, fps)
+    return out_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Up-convert a video's frame rate")
+    parser.add_argument("src")
+    parser.add_argument("dest")
+    parser.add_argument("--fps", type=float, default=24)
+    parser.add_argument("--method", default="minterpolate")
+    args = parser.parse_args()
+    interpolate(args.src, args.dest, args.fps, args.method)
@@ -0,0 +1,140 @@
+"""
+Seamless idle loops from a short render.
+
+Instead of diffusing every frame of the driving clip, the handler renders a short span
+and this CPU stage turns it into a loop of the requested duration:
+
+- `crossfade`: pick the loop end whose frames best match the clip's opening (mean
+  absolute difference of small grayscale thumbnails over the blend window), then blend
+  the frames after it into the opening so the unit repeats without a seam.
+- `pingpong`: the render already plays forward then backward (VHS_VideoCombine's
+  `pingpong`), so it is repeated as is.
+
+Loops are silent: driving-video audio does not loop.
+
+    python loop_synth.py render.mp4 idle.mp4 --seconds 30 [--mode pingpong]
+"""
+
+import argparse
+import math
+import subprocess
+from dataclasses import dataclass
+from typing import List
+
+MODES = ("crossfade", "pingpong")
+# Thumbnail size for the similarity search; enough to see pose, small enough to be cheap.
+_THUMB_W, _THUMB_H = 64, 36
+
+
+@dataclass
+class LoopInfo:
+    mode: str
+    source_frames: int
+    loop_frames: int
+    blend_frames: int
+    seconds: float
+    match_score: float = 0.0
+
+
+def _luma_thumbnails(path: str) -> List[bytes]:
+    raw = subprocess.check_output(
+        [
+            "ffmpeg",
+            "-hide_banner",
+            "-loglevel",
+            "error",
+            "-i",
+            path,
+            "-vf",
+            f"scale={_THUMB_W}:{_THUMB_H},format=gray",
+            "-f",
+            "rawvideo",
+            "-",
+        ]
+    )
+    size = _THUMB_W * _THUMB_H
+    return [raw[i : i + size] for i in range(0, len(raw) - size + 1, size)]
+
+
+def _diff(a: bytes, b: bytes) -> float:
+    return sum(abs(x - y) for x, y in zip(a, b)) / len(a)
+
+
+def find_loop_end(frames: List[bytes], blend: int, min_frames: int) -> tuple:
+    """
+    Loop length j (frames [j, j + blend) will be blended into [0, blend)) with the lowest
+    mean difference between those two windows. Returns (j, score).
+    """
+    best = (len(frames) - blend, float("inf"))
+    for j in range(max(min_frames, blend), len(frames) - blend + 1):
+        score = sum(_diff(frames[j + k], frames[k]) for k in range(blend)) / blend
+        if score < best[1]:
+            best = (j, score)
+    return best
+
+
+def _encode(args: list, out_path: str, crf: int) -> None:
+    subprocess.run(
+        [
+            "ffmpeg",
+            "-y",
+            "-hide_banner",
+            "-loglevel",
+            "error",
+            *args,
+            "-an",
+            "-c:v",
+            "libx264",
+            "-crf",
+            str(crf),
+            "-pix_fmt",
+            "yuv420p",
+            "-movflags",
+            "+faststart",
+            out_path,
+        ],
+        check=True,
+    )
+
+
+def make_loop(
+    src_path: str, out_path: str, seconds: float, fps: float, mode: str = "crossfade", blend: int = 12, crf: int = 19
+) -> LoopInfo:
+    """Write a `seconds`-long seamless loop built from `src_path` to `out_path`."""
+    if mode not in MODES:
+        raise ValueError(f"Unknown loop mode {mode!r}; expected one of {', '.join(MODES)}")
+    frames = _luma_thumbnails(src_path)
+    total = int(round(seconds * fps))
+    norm = f"setpts=PTS-STARTPTS,fps={fps},settb=AVTB"
+    # Short renders cannot spare a long blend; keep at least half the clip as the body.
+    blend = min(blend, len(frames) // 4) if mode == "crossfade" else 0
+    if blend < 2:
+        loop_frames, score = len(frames), 0.0
+        graph = f"[0:v]{norm}[u]"
+        mode = "pingpong" if mode == "pingpong" else "repeat"
+    else:
+        loop_frames, score = find_loop_end(frames, blend, min_frames=len(frames) // 2)
+        graph = (
+            f"[0:v]split=3[a][b][c];"
+            f"[a]trim=start_frame={blend}:end_frame={loop_frames},{norm}[body];"
+            f"[b]trim=start_frame={loop_frames}:end_frame={loop_frames + blend},{norm}[tail];"
+            f"[c]trim=end_frame={blend},{norm}[head];"
+            f"[tail][head]xfade=transition=fade:duration={blend / fps:.4f}:offset=0[seam];"
+            f"[body][seam]concat=n=2:v=1:a=0[u]"
+        )
+    repeats = max(0, math.ceil(total / loop_frames) - 1)
+    graph += f";[u]loop=loop={repeats}:size={loop_frames}:start=0,trim=end_frame={total},setpts=N/({fps}*TB)[v]"
+    _encode(["-i", src_path, "-filter_complex", graph, "-map", "[v]", "-r", str(fps)], out_path, crf)
+    return LoopInfo(mode, len(frames), loop_frames, blend, round(total / fps, 3), round(score, 3))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a seamless loop from a short clip")
+    parser.add_argument("src")
+    parser.add_argument("dest")
+    parser.add_argument("--seconds", type=float, required=True)
+    parser.add_argument("--fps", type=float, default=24)
+    parser.add_argument("--mode", choices=MODES, default="crossfade")
+    parser.add_argument("--blend", type=int, default=12)
+    args = parser.parse_args()
+    print(make_loop(args.src, args.dest, args.seconds, args.fps, args.mode, args.blend))
@@ -0,0 +1,76 @@
+"""
+Model readiness status shared by the downloader, the handler and ComfyUI.
+
+`download_models.py` writes a JSON file mapping each destination path to its state
+(`pending`, `downloading`, `present`, `linked`, `downloaded`, `failed`) while it works
+through the manifest in first-use order. Readers use it to wait for one specific file
+instead of the whole model set.
+
+    python model_status.py            # print the current status
+"""
+
+import json
+import os
+import sys
+import time
+from typing import Dict, Iterable
+
+STATUS_PATH = os.getenv("MODEL_STATUS_PATH", "/tmp/model_status.json")
+READY_STATES = ("present", "linked", "downloaded")
+MODEL_WAIT_TIMEOUT_S = float(os.getenv("MODEL_WAIT_TIMEOUT_S", "1800"))
+
+
+def read_status(path: str = STATUS_PATH) -> Dict[str, dict]:
+    try:
+        with open(path, "r") as f:
+            return json.load(f).get("files", {})
+    except (OSError, ValueError):
+        return {}
+
+
+def write_status(files: Dict[str, dict], path: str = STATUS_PATH) -> None:
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({"updated": time.time(), "files": files}, f, indent=2)
+    os.replace(tmp, path)
+
+
+def pending_files(files: Dict[str, dict] = None) -> list:
+    files = read_status() if files is None else files
+    return [dest for dest, entry in files.items() if entry.get("status") not in READY_STATES]
+
+
+def wait_for_files(paths: Iterable[str], timeout: float = MODEL_WAIT_TIMEOUT_S, poll: float = 2.0) -> None:
+    """
+    Block until every path that the downloader tracks is ready.
+
+    Paths the downloader does not know about are left to the caller (they are either
+    already on disk or not managed by the manifest).
+    """
+    paths = list(paths)
+    deadline = time.monotonic() + timeout
+    while True:
+        files = read_status()
+        waiting = []
+        for path in paths:
+            state = (files.get(path) or {}).get("status")
+            if state is None or state in READY_STATES:
+                continue
+            if state == "failed":
+                raise RuntimeError(f"Model download failed: {path}: {files[path].get('error')}")
+            waiting.append(path)
+        if not waiting:
+            return
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Timed out after {timeout:.0f}s waiting for models: {waiting}")
+        time.sleep(poll)
+
+
+if __name__ == "__main__":
+    status = read_status()
+    json.dump(
+        {"pending": pending_files(status), "files": status},
+        sys.stdout,
+        indent=2,
+    )
+    print()
@@ -0,0 +1,110 @@
+"""
+Driving-video preprocessing cache.
+
+Pose rendering, face crops and the SAM2 replace mask in `workflow_replace.json` depend only
+on the driving video (node 63) and the render size, never on the user's image. On a cache
+miss the full workflow runs with extra save nodes that capture these artifacts; on a hit the
+detection/segmentation subgraph is removed and the artifacts are loaded from disk instead.
+"""
+
+import hashlib
+import json
+
+# Detection + segmentation subgraph fed only by VHS_LoadVideo (node 63).
+PREPROCESS_NODE_IDS = ("204", "205", "206", "208", "209", "210", "216", "217")
+
+# artifact name -> (source node id, output slot, cache node suffix)
+ARTIFACTS = {
+    "pose_images": ("210", 0, "Image"),
+    "face_images": ("216", 1, "Image"),
+    "mask": ("206", 0, "Mask"),
+}
+
+ARTIFACT_SUFFIX = ".pt"
+
+# Synthetic node ids for the cache save/load nodes (well clear of the workflow's own ids).
+_CACHE_NODE_BASE = 9000
+
+
+def file_sha256(path: str, chunk_size: int = 8 * 1024 * 1024) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def preprocess_key(video_sha256: str, workflow: dict) -> str:
+    """
+    Key artifacts by video content, every load parameter that changes the frames and the
+    settings of the preprocessing nodes (mask block size and growth, detector and SAM2
+    models, pose drawing).
+    """
+    load = workflow["63"]["inputs"]
+    nodes = {
+        node_id: {
+            "class_type": workflow[node_id]["class_type"],
+            # Links only wire the subgraph together; its literal inputs change the output.
+            "inputs": {
+                name: value
+                for name, value in workflow[node_id]["inputs"].items()
+                if not (isinstance(value, list) and len(value) == 2)
+            },
+        }
+        for node_id in PREPROCESS_NODE_IDS
+        if node_id in workflow
+    }
+    params = {
+        "video": video_sha256,
+        "width": workflow["150"]["inputs"]["value"],
+        "height": workflow["151"]["inputs"]["value"],
+        "fps": load.get("force_rate"),
+        "frame_load_cap": load.get("frame_load_cap"),
+        "skip_first_frames": load.get("skip_first_frames"),
+        "select_every_nth": load.get("select_every_nth"),
+        "nodes": nodes,
+    }
+    return hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def add_capture_nodes(workflow: dict, paths: dict) -> None:
+    """Attach save nodes so a normal run also persists the preprocessing artifacts."""
+    for i, (name, (node_id, slot, suffix)) in enumerate(ARTIFACTS.items()):
+        workflow[str(_CACHE_NODE_BASE + i)] = {
+            "inputs": {"value": [node_id, slot], "path": paths[name]},
+            "class_type": f"WanAvatarSave{suffix}",
+            "_meta": {"title": f"Cache {name}"},
+        }
+
+
+def use_cached_artifacts(workflow: dict, paths: dict) -> None:
+    """Replace the detection/segmentation subgraph with loaders for cached artifacts."""
+    replacements = {}
+    for i, (name, (node_id, slot, suffix)) in enumerate(ARTIFACTS.items()):
+        load_id = str(_CACHE_NODE_BASE + 10 + i)
+        workflow[load_id] = {
+            "inputs": {"path": paths[name]},
+            "class_type": f"WanAvatarLoad{suffix}",
+            "_meta": {"title": f"Cached {name}"},
+        }
+        replacements[(node_id, slot)] = [load_id, 0]
+
+    for node_id in PREPROCESS_NODE_IDS:
+        workflow.pop(node_id, None)
+
+    for node in workflow.values():
+        inputs = node.get("inputs") or {}
+        for input_name, value in inputs.items():
+            if isinstance(value, list) and len(value) == 2:
+                replacement = replacements.get((str(value[0]), value[1]))
+                if replacement:
+                    inputs[input_name] = replacement
+
+    dangling = [
+        (node_id, input_name)
+        for node_id, node in workflow.items()
+        for input_name, value in (node.get("inputs") or {}).items()
+        if isinstance(value, list) and len(value) == 2 and str(value[0]) not in workflow
+    ]
+    if dangling:
+        raise ValueError(f"Preprocess-cached workflow has dangling inputs: {dangling}")
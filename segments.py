@@ -0,0 +1,210 @@
+"""
+Segmented rendering for long driving videos.
+
+The clip is split into windows of roughly equal length that overlap by a few frames
+(`plan_segments`). Each window is rendered as its own prompt through node 63's
+`skip_first_frames` / `frame_load_cap`, so latency, VRAM and RAM depend on the window
+length, not the clip length.
+
+`SegmentStitcher` turns rendered windows into HLS pieces as soon as they can be final:
+piece k is window k's body plus a crossfade into window k+1 over the overlap, so seams
+are blended and playback can start while later windows are still rendering.
+`finalize()` joins the pieces into one MP4 with the driving video's audio.
+"""
+
+import json
+import math
+import os
+import subprocess
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+
+@dataclass
+class Segment:
+    index: int
+    skip: int  # frames skipped at the start of the driving video (at the render fps)
+    frames: int  # frames rendered for this window
+
+
+@dataclass
+class Piece:
+    index: int
+    path: str
+    start_s: float
+    duration_s: float
+
+
+def _ffprobe(path: str) -> dict:
+    out = subprocess.check_output(
+        [
+            "ffprobe",
+            "-v",
+            "error",
+            "-show_entries",
+            "format=duration:stream=codec_type,nb_frames,avg_frame_rate",
+            "-of",
+            "json",
+            path,
+        ]
+    )
+    return json.loads(out)
+
+
+def count_frames(path: str, fps: float) -> int:
+    """Frames `path` yields when resampled to `fps` (what VHS_LoadVideo's force_rate does)."""
+    info = _ffprobe(path)
+    duration = float((info.get("format") or {}).get("duration") or 0)
+    return int(duration * fps)
+
+
+def has_audio(path: str) -> bool:
+    return any(s.get("codec_type") == "audio" for s in _ffprobe(path).get("streams") or [])
+
+
+def plan_segments(total_frames: int, segment_frames: int, overlap: int) -> List[Segment]:
+    """
+    Windows of at most `segment_frames` covering `total_frames`, consecutive ones sharing
+    `overlap` frames. The new frames are split evenly (lengths differ by at most one), so
+    there is no short, expensive tail window.
+    """
+    if total_frames <= segment_frames:
+        return [Segment(0, 0, total_frames)]
+    span = total_frames - overlap
+    count = math.ceil(span / (segment_frames - overlap))
+    starts = [i * span // count for i in range(count + 1)]
+    return [Segment(i, starts[i], starts[i + 1] - starts[i] + overlap) for i in range(count)]
+
+
+def _run_ffmpeg(args: list) -> None:
+    subprocess.run(["ffmpeg", "-y", "-hide_banner", "-loglevel", "error", *args], check=True)
+
+
+def hls_playlist(pieces: List[Piece], urls: List[str], target_duration: float, ended: bool) -> str:
+    lines = [
+        "#EXTM3U",
+        "#EXT-X-VERSION:3",
+        "#EXT-X-PLAYLIST-TYPE:EVENT",
+        f"#EXT-X-TARGETDURATION:{math.ceil(target_duration)}",
+        "#EXT-X-MEDIA-SEQUENCE:0",
+    ]
+    for piece, url in zip(pieces, urls):
+        lines += [f"#EXTINF:{piece.duration_s:.3f},", url]
+    if ended:
+        lines.append("#EXT-X-ENDLIST")
+    return "\n".join(lines) + "\n"
+
+
+@dataclass
+class SegmentStitcher:
+    """
+    Build blended HLS pieces (MPEG-TS, continuous timestamps) from rendered windows.
+
+    `publish(piece)` is called for each piece as soon as it is final. Rendered window
+    files are deleted once no longer needed.
+    """
+
+    workdir: str
+    segments: List[Segment]
+    fps: float
+    overlap: int
+    crf: int = 19
+    publish: Optional[Callable[[Piece], None]] = None
+    pieces: List[Piece] = field(default_factory=list)
+    _pending: Optional[tuple] = None
+    _frames_out: int = 0
+
+    def add(self, index: int, video_path: str) -> None:
+        if self._pending is not None:
+            prev_index, prev_path = self._pending
+            self._emit(prev_index, prev_path, video_path)
+            os.remove(prev_path)
+        self._pending = (index, video_path)
+
+    def finish(self) -> List[Piece]:
+        if self._pending is not None:
+            index, path = self._pending
+            self._emit(index, path, None)
+            os.remove(path)
+            self._pending = None
+        return self.pieces
+
+    def discard(self) -> None:
+        """Delete a rendered window that has not been turned into a piece (after a failure)."""
+        if self._pending is not None:
+            try:
+                os.remove(self._pending[1])
+            except OSError:
+                pass
+            self._pending = None
+
+    def _emit(self, index: int, path: str, next_path: Optional[str]) -> None:
+        segment = self.segments[index]
+        # The head overlap of every window but the first was already blended into the
+        # previous piece.
+        head = self.overlap if index > 0 else 0
+        out = os.path.join(self.workdir, f"piece_{index:03d}.ts")
+        inputs = ["-i", path]
+        # xfade and concat need matching frame rates and time bases on their inputs.
+        norm = f"setpts=PTS-STARTPTS,fps={self.fps},settb=AVTB"
+        if next_path is None:
+            graph = f"[0:v]trim=start_frame={head},{norm}[v]"
+            frames = segment.frames - head
+        elif not self.overlap:
+            # Nothing to blend: cut at the next window's start.
+            step = self.segments[index + 1].skip - segment.skip
+            graph = f"[0:v]trim=end_frame={step},{norm}[v]"
+            frames = step
+        else:
+            step = self.segments[index + 1].skip - segment.skip
+            inputs += ["-i", next_path]
+            graph = (
+                f"[0:v]split[a][b];"
+                f"[a]trim=start_frame={head}:end_frame={step},{norm}[body];"
+                f"[b]trim=start_frame={step}:end_frame={step + self.overlap},{norm}[tail];"
+                f"[1:v]trim=end_frame={self.overlap},{norm}[next];"
+                f"[tail][next]xfade=transition=fade:duration={self.overlap / self.fps:.4f}:offset=0[seam];"
+                f"[body][seam]concat=n=2:v=1:a=0[v]"
+            )
+            frames = step - head + self.overlap
+        start_s = self._frames_out / self.fps
+        _run_ffmpeg(
+            [
+                *inputs,
+                "-filter_complex",
+                graph,
+                "-map",
+                "[v]",
+                "-r",
+                str(self.fps),
+                "-c:v",
+                "libx264",
+                "-crf",
+                str(self.crf),
+                "-pix_fmt",
+                "yuv420p",
+                "-output_ts_offset",
+                f"{start_s:.4f}",
+                "-f",
+                "mpegts",
+                out,
+            ]
+        )
+        self._frames_out += frames
+        piece = Piece(index, out, start_s, frames / self.fps)
+        self.pieces.append(piece)
+        if self.publish:
+            self.publish(piece)
+
+    def finalize(self, out_path: str, audio_source: Optional[str] = None) -> str:
+        """Join the pieces into one MP4 (video stream copied), adding `audio_source`'s audio."""
+        listing = os.path.join(self.workdir, "pieces.txt")
+        with open(listing, "w") as f:
+            for piece in self.pieces:
+                f.write(f"file '{os.path.abspath(piece.path)}'\n")
+        args = ["-f", "concat", "-safe", "0", "-i", listing]
+        if audio_source and has_audio(audio_source):
+            args += ["-i", audio_source, "-map", "0:v", "-map", "1:a", "-c:a", "aac", "-shortest"]
+        args += ["-c:v", "copy", "-movflags", "+faststart", out_path]
+        _run_ffmpeg(args)
+        return out_path
@@ -0,0 +1,18 @@
+import json
+import os
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Importing handler must not start the RunPod worker loop.
+os.environ.setdefault("RUNPOD_START_SERVERLESS", "false")
+sys.path.insert(0, REPO_DIR)
+
+
+@pytest.fixture
+def workflow():
+    """A fresh copy of the shipped workflow_replace.json."""
+    with open(os.path.join(REPO_DIR, "workflow_replace.json")) as f:
+        return json.load(f)
@@ -0,0 +1,66 @@
+from types import SimpleNamespace
+
+import pytest
+
+import handler
+from input_probe import ImageProbe, ProbeError, VideoProbe
+
+
+@pytest.fixture
+def admit(monkeypatch):
+    monkeypatch.setattr(handler, "MAX_DRIVING_FRAMES", 240)
+    monkeypatch.setattr(handler, "ADMISSION_AUTO_TRIM", False)
+    settings = SimpleNamespace(width=1000, height=1000, fps=12)
+
+    def admit(job_input=None, image=None, video=None):
+        image = image or ImageProbe(1024, 1024, "PNG", 1000)
+        video = video or VideoProbe(1280, 720, "h264", 5.0, 30.0, 150, True, 1000)
+        monkeypatch.setattr(handler, "probe_image", lambda path: image)
+        monkeypatch.setattr(handler, "probe_video", lambda path: video)
+        return handler.admit_inputs(job_input or {}, "i.png", "v.mp4", settings)
+
+    return admit
+
+
+def test_estimate_at_render_fps(admit):
+    probe, estimate, frame_cap = admit()
+    assert frame_cap is None
+    assert probe["video"]["codec"] == "h264"
+    assert estimate == {
+        "render_frames": 60,
+        "render_megapixels": 1.0,
+        "gpu_seconds": round(handler.COST_OVERHEAD_S + 60 * handler.COST_S_PER_MEGAPIXEL_FRAME, 1),
+    }
+
+
+@pytest.mark.parametrize(
+    "image, video, match",
+    [
+        (ImageProbe(8000, 8000, "PNG", 1), None, "Reference image is 8000x8000"),
+        (None, VideoProbe(640, 480, "gif", 5.0, 10.0, 50, False, 1), "codec gif is not allowed"),
+        (None, VideoProbe(7680, 4320, "hevc", 5.0, 30.0, 150, False, 1), "Driving video is 7680x4320"),
+        (None, VideoProbe(640, 480, "h264", 0.01, 30.0, 0, False, 1), "no frames"),
+    ],
+)
+def test_rejected(admit, image, video, match):
+    with pytest.raises(handler.InputError, match=match):
+        admit(image=image, video=video)
+
+
+def test_over_long_video(admit):
+    long_video = VideoProbe(640, 480, "h264", 20.0, 30.0, 600, False, 1)
+    with pytest.raises(handler.InputError, match="auto_trim"):
+        admit(video=long_video)
+    _, estimate, frame_cap = admit({"auto_trim": True}, video=long_video)
+    # 240 output frames at 24 fps is 120 frames at the 12 fps render rate.
+    assert frame_cap == estimate["render_frames"] == 120
+
+
+def test_probe_error_is_input_error(admit, monkeypatch):
+    def fail(path):
+        raise ProbeError("not a video")
+
+    admit()
+    monkeypatch.setattr(handler, "probe_video", fail)
+    with pytest.raises(handler.InputError, match="not a video"):
+        handler.admit_inputs({}, "i.png", "v.mp4", SimpleNamespace(width=16, height=16, fps=24))
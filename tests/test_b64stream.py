@@ -0,0 +1,33 @@
+import base64
+import binascii
+import os
+
+import pytest
+
+from b64stream import decode_to_file, encode_file
+
+
+@pytest.mark.parametrize("size", [0, 1, 2, 3, 1000, 4097])
+def test_round_trip_across_chunk_boundaries(tmp_path, size):
+    raw = os.urandom(size)
+    src = tmp_path / "src.bin"
+    src.write_bytes(raw)
+    encoded = encode_file(str(src), chunk_bytes=3 * 7)
+    assert encoded == base64.b64encode(raw).decode("ascii")
+    dest = tmp_path / "dest.bin"
+    assert decode_to_file(encoded, str(dest), chunk_chars=4 * 5) == size
+    assert dest.read_bytes() == raw
+
+
+def test_decode_accepts_data_uri_whitespace_and_missing_padding(tmp_path):
+    encoded = base64.b64encode(b"avatar frames").decode("ascii").rstrip("=")
+    data = "data:image/png;base64," + encoded[:6] + "\n " + encoded[6:]
+    dest = tmp_path / "out.bin"
+    decode_to_file(data, str(dest), chunk_chars=8)
+    assert dest.read_bytes() == b"avatar frames"
+
+
+@pytest.mark.parametrize("data", ["abc*", "abcde"])
+def test_decode_rejects_invalid_input(tmp_path, data):
+    with pytest.raises(binascii.Error):
+        decode_to_file(data, str(tmp_path / "out.bin"))
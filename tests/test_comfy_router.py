@@ -0,0 +1,132 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import handler
+from handler import ComfyExecutionError, ComfyRouter, ComfySession
+
+
+class _StubComfy(BaseHTTPRequestHandler):
+    """Answers ComfyUI's "/" readiness probe, optionally after a delay."""
+
+    delay = 0.0
+
+    def do_GET(self):
+        time.sleep(self.server.delay)
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    servers = []
+
+    def start(delay=0.0):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _StubComfy)
+        server.delay = delay
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server.server_address[1]
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def _session(port, connect_error=None):
+    session = ComfySession("127.0.0.1", port)
+
+    def ensure_connected():
+        if connect_error:
+            raise connect_error
+
+    session.ensure_connected = ensure_connected
+    return session
+
+
+def _closed_port():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubComfy)
+    port = server.server_address[1]
+    server.server_close()
+    return port
+
+
+@pytest.fixture(autouse=True)
+def fast_health(monkeypatch):
+    monkeypatch.setattr(handler, "COMFYUI_HEALTH_TTL_S", 0.05)
+
+
+def test_reserve_spreads_prompts_across_instances(stub_server):
+    a, b = _session(stub_server()), _session(stub_server())
+    router = ComfyRouter([a, b], max_in_flight=1)
+    first = router.reserve(timeout=1)
+    second = router.reserve(timeout=1)
+    assert {first, second} == {a, b}
+    router.release(first)
+    assert router.reserve(timeout=1) is first
+
+
+def test_reserve_skips_unhealthy_instance(stub_server):
+    down, up = _session(_closed_port()), _session(stub_server())
+    router = ComfyRouter([down, up])
+    assert router.reserve(timeout=1) is up
+
+
+def test_reserve_times_out_without_healthy_instance():
+    router = ComfyRouter([_session(_closed_port())])
+    started = time.monotonic()
+    with pytest.raises(ComfyExecutionError) as excinfo:
+        router.reserve(timeout=0.2)
+    assert excinfo.value.error_type == "no_instance"
+    assert time.monotonic() - started < 5
+
+
+def test_reserve_waits_for_busy_instance_past_timeout(stub_server):
+    session = _session(stub_server())
+    router = ComfyRouter([session], max_in_flight=1)
+    router.reserve(timeout=0.1)
+    threading.Timer(0.4, router.release, args=(session,)).start()
+    # Busy is not down: the wait for a slot outlives the readiness timeout.
+    assert router.reserve(timeout=0.1) is session
+
+
+def test_connect_failure_is_no_instance_and_frees_slot(stub_server):
+    session = _session(stub_server(), connect_error=Exception("Cannot connect to WebSocket"))
+    router = ComfyRouter([session], max_in_flight=1)
+    with pytest.raises(ComfyExecutionError) as excinfo:
+        router.reserve(timeout=1)
+    assert excinfo.value.error_type == "no_instance"
+    assert router.status()[0]["in_flight"] == 0
+
+
+def test_release_not_blocked_by_slow_probe(stub_server, monkeypatch):
+    monkeypatch.setattr(handler, "COMFYUI_HEALTH_TTL_S", 0.0)
+    fast, slow = _session(stub_server()), _session(stub_server(delay=1.0))
+    router = ComfyRouter([fast, slow], max_in_flight=1)
+    router._health[id(fast)] = router._health[id(slow)] = (time.monotonic() + 60, True)
+    held = router.reserve(timeout=5)
+    router._health.clear()
+    # The next reserve probes `slow` (1 s); release() must not wait for that probe.
+    waiter = threading.Thread(target=router.reserve, kwargs={"session": slow, "timeout": 5})
+    waiter.start()
+    time.sleep(0.1)
+    started = time.monotonic()
+    router.release(held)
+    assert time.monotonic() - started < 0.5
+    waiter.join()
+
+
+def test_idle_cold_instance_beats_busy_warm_one(stub_server):
+    warm, cold = _session(stub_server()), _session(stub_server())
+    warm.warm_shapes.add((1280, 720))
+    router = ComfyRouter([cold, warm], max_in_flight=2)
+    assert router.reserve(timeout=1, shape=(1280, 720)) is warm
+    assert router.reserve(timeout=1, shape=(1280, 720)) is cold
+    assert router.reserve(timeout=1, shape=(1280, 720)) is warm
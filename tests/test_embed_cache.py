@@ -0,0 +1,67 @@
+import json
+import os
+
+from embed_cache import (
+    CLIP_ENCODE_NODE_ID,
+    CLIP_LOADER_NODE_ID,
+    TEXT_ENCODE_NODE_ID,
+    clip_embeds_key,
+    text_embeds_key,
+    use_cached_clip_embeds,
+    use_cached_text_embeds,
+)
+
+
+def _manifest(tmp_path, model_name, sha256):
+    path = tmp_path / "manifest.json"
+    entry = {"repo_id": "r", "filename": model_name, "dest_path": f"/m/{model_name}", "sha256": sha256}
+    path.write_text(json.dumps({"files": [entry]}))
+    return str(path)
+
+
+def test_text_key_from_pinned_sha_before_download(tmp_path, workflow):
+    name = workflow[TEXT_ENCODE_NODE_ID]["inputs"]["model_name"]
+    manifest = _manifest(tmp_path, name, "ab" * 32)
+    key = text_embeds_key(workflow, str(tmp_path / "missing"), manifest)
+    assert key is not None
+    workflow[TEXT_ENCODE_NODE_ID]["inputs"]["positive_prompt"] += " smiling"
+    assert text_embeds_key(workflow, str(tmp_path / "missing"), manifest) != key
+
+
+def test_text_key_needs_content_identity_without_pin(tmp_path, workflow):
+    name = workflow[TEXT_ENCODE_NODE_ID]["inputs"]["model_name"]
+    manifest = _manifest(tmp_path, name, None)
+    assert text_embeds_key(workflow, str(tmp_path), manifest) is None
+
+    encoder = tmp_path / name
+    encoder.write_bytes(b"weights")
+    fingerprinted = text_embeds_key(workflow, str(tmp_path), manifest)
+    st = os.stat(encoder)
+    marker = {"size": st.st_size, "mtime": st.st_mtime, "sha256": "cd" * 32}
+    (tmp_path / f"{name}.verified.json").write_text(json.dumps(marker))
+    verified = text_embeds_key(workflow, str(tmp_path), manifest)
+    assert None not in (fingerprinted, verified) and fingerprinted != verified
+    # Same digest pinned in the manifest gives the same key.
+    assert text_embeds_key(workflow, str(tmp_path / "missing"), _manifest(tmp_path, name, "cd" * 32)) == verified
+
+
+def test_clip_key_tracks_resize_settings(workflow):
+    key = clip_embeds_key("img", workflow)
+    workflow["150"]["inputs"]["value"] = 960
+    assert clip_embeds_key("img", workflow) != key
+
+
+def _dangling(workflow):
+    return [
+        value
+        for node in workflow.values()
+        for value in (node.get("inputs") or {}).values()
+        if isinstance(value, list) and len(value) == 2 and str(value[0]) not in workflow
+    ]
+
+
+def test_cached_embeds_replace_their_encoders(workflow):
+    use_cached_text_embeds(workflow, "/cache/text.pt")
+    use_cached_clip_embeds(workflow, "/cache/clip.pt")
+    assert not {TEXT_ENCODE_NODE_ID, CLIP_ENCODE_NODE_ID, CLIP_LOADER_NODE_ID} & set(workflow)
+    assert _dangling(workflow) == []
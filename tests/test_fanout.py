@@ -0,0 +1,26 @@
+import pytest
+
+import handler
+from handler import InputError
+
+
+@pytest.mark.parametrize("value", ["clip.mp4", {"driving_video_path": "clip.mp4"}, [], [1], [""]])
+def test_fanout_rejects_malformed_lists(value):
+    with pytest.raises(InputError):
+        handler._fanout_items({"driving_video_paths": value})
+
+
+def test_fanout_items_get_names():
+    items = handler._fanout_items(
+        {"driving_video_paths": ["templates/a.mp4", {"driving_video_url": "https://h/b.mp4?sig=1"}]}
+    )
+    assert [item["name"] for item in items] == ["0_a", "1_b"]
+
+
+def test_fanout_variants_share_default_avatar_id(monkeypatch):
+    keys = []
+    monkeypatch.setattr(handler, "resolve_driving_video", lambda item, task_id, name: "video.mp4")
+    monkeypatch.setattr(handler, "render_variant", lambda job_input, *args, **kwargs: keys.append(args[4]) or {})
+    handler.run_fanout({"user_id": "u", "driving_video_paths": ["a.mp4", "b.mp4"]}, "img.jpg", "img.jpg", "task")
+    assert len(keys) == 2
+    assert keys[0].split("/")[:2] == keys[1].split("/")[:2]
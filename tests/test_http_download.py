@@ -0,0 +1,101 @@
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import http_download
+from http_download import DownloadError, DownloadTooLarge, download, probe
+from input_cache import InputCache
+
+BODY = bytes(range(256)) * 4096  # 1 MiB
+
+
+class _RangeServer(BaseHTTPRequestHandler):
+    """Serves BODY with Range support; `server.drops` responses are cut off halfway."""
+
+    def do_GET(self):
+        start, end = 0, len(BODY) - 1
+        header = self.headers.get("Range")
+        # Recorded before responding, so the client never sees a reply before its request.
+        self.server.requests.append(header)
+        if header:
+            first, _, last = header.removeprefix("bytes=").partition("-")
+            start, end = int(first), int(last) if last else end
+        payload = BODY[start : end + 1]
+        self.send_response(206 if header else 200)
+        self.send_header("Content-Length", str(len(payload)))
+        self.send_header("ETag", '"v1"')
+        if header:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(BODY)}")
+        self.end_headers()
+        if len(payload) > 1 and self.server.drops > 0:
+            self.server.drops -= 1
+            self.wfile.write(payload[: len(payload) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(monkeypatch):
+    # No backoff between retries.
+    monkeypatch.setattr(http_download.time, "sleep", lambda s: None)
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _RangeServer)
+    httpd.drops = 0
+    httpd.requests = []
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _url(server):
+    return f"http://127.0.0.1:{server.server_address[1]}/clip.mp4"
+
+
+def test_probe_reads_size_and_validators(server):
+    remote = probe(_url(server))
+    assert (remote.size, remote.accepts_ranges, remote.etag) == (len(BODY), True, '"v1"')
+
+
+def test_stream_resumes_after_early_close(server, tmp_path):
+    server.drops = 2
+    dest = str(tmp_path / "clip.mp4")
+    download(_url(server), dest, connections=1, retries=3)
+    assert open(dest, "rb").read() == BODY
+    # Retries continue from the bytes already on disk.
+    assert server.requests[-1].startswith("bytes=") and server.requests[-1] != "bytes=0-"
+
+
+def test_parallel_ranges(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(http_download, "MIN_SEGMENT_BYTES", 128 * 1024)
+    server.drops = 1
+    dest = str(tmp_path / "clip.mp4")
+    download(_url(server), dest, connections=4, retries=2)
+    assert open(dest, "rb").read() == BODY
+
+
+def test_reuses_caller_probe(server, tmp_path):
+    remote = probe(_url(server))
+    server.requests.clear()
+    download(_url(server), str(tmp_path / "clip.mp4"), connections=1, remote=remote)
+    assert "bytes=0-0" not in server.requests
+
+
+def test_too_large_rejected_before_body(server, tmp_path):
+    with pytest.raises(DownloadTooLarge):
+        download(_url(server), str(tmp_path / "clip.mp4"), max_bytes=1024)
+    assert server.requests == ["bytes=0-0"]
+
+
+def test_cache_fill_failure_leaves_no_partial_file(server, tmp_path):
+    server.drops = 10
+    cache = InputCache(str(tmp_path / "cache"), max_bytes=1 << 30)
+    with pytest.raises(DownloadError):
+        cache.fetch("k" * 64, lambda tmp: download(_url(server), tmp, connections=1, retries=1), ".mp4")
+    leftovers = [name for _, _, names in os.walk(tmp_path / "cache" / "objects") for name in names]
+    assert leftovers == []
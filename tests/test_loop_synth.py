@@ -0,0 +1,76 @@
+import pytest
+
+import handler
+import loop_synth
+from loop_synth import find_loop_end, make_loop
+
+
+def _frames(values):
+    return [bytes([v]) * 16 for v in values]
+
+
+def test_find_loop_end_picks_best_matching_window():
+    # Frames 6-7 repeat the opening frames 0-1 exactly.
+    frames = _frames([10, 20, 30, 40, 50, 60, 10, 20, 90, 90])
+    assert find_loop_end(frames, blend=2, min_frames=4) == (6, 0.0)
+
+
+@pytest.fixture
+def encoded(monkeypatch):
+    calls = []
+    monkeypatch.setattr(loop_synth, "_encode", lambda args, out_path, crf: calls.append(args))
+    return calls
+
+
+def test_crossfade_graph(monkeypatch, encoded):
+    monkeypatch.setattr(loop_synth, "_luma_thumbnails", lambda path: _frames(list(range(0, 240, 4))))
+    info = make_loop("in.mp4", "out.mp4", seconds=10, fps=24, blend=12)
+    graph = encoded[0][encoded[0].index("-filter_complex") + 1]
+    assert info.mode == "crossfade" and info.blend_frames == 12
+    assert f"trim=start_frame=12:end_frame={info.loop_frames}" in graph
+    assert "xfade=transition=fade:duration=0.5000" in graph
+    assert f"loop=loop={-(-240 // info.loop_frames) - 1}:size={info.loop_frames}" in graph
+    assert "trim=end_frame=240" in graph
+    assert info.seconds == 10
+
+
+def test_short_render_is_repeated_without_blend(monkeypatch, encoded):
+    monkeypatch.setattr(loop_synth, "_luma_thumbnails", lambda path: _frames([1, 2, 3, 4, 5]))
+    info = make_loop("in.mp4", "out.mp4", seconds=1, fps=24, blend=12)
+    graph = encoded[0][encoded[0].index("-filter_complex") + 1]
+    assert info.mode == "repeat" and "xfade" not in graph
+
+
+def test_unknown_mode_rejected():
+    with pytest.raises(ValueError):
+        make_loop("in.mp4", "out.mp4", seconds=1, fps=24, mode="bounce")
+
+
+def test_loop_request_parsing():
+    assert handler._loop_request({}) is None
+    assert handler._loop_request({"loop_seconds": "30", "loop_render_seconds": 4}) == (30.0, "crossfade", 4.0)
+    # Ping-pong renders half the span and plays it back reversed.
+    assert handler._loop_request({"loop_seconds": 30, "loop_mode": "pingpong", "loop_render_seconds": 4}) == (
+        30.0,
+        "pingpong",
+        2.0,
+    )
+    for bad in ({"loop_seconds": "nan"}, {"loop_seconds": 5, "loop_mode": "x"}, {"loop_seconds": 5, "loop_render_seconds": 0}):
+        with pytest.raises(handler.InputError):
+            handler._loop_request(bad)
+
+
+def test_loop_seconds_bounded_at_admission(monkeypatch):
+    from types import SimpleNamespace
+
+    from input_probe import ImageProbe, VideoProbe
+
+    monkeypatch.setattr(handler, "probe_image", lambda path: ImageProbe(512, 512, "PNG", 1000))
+    monkeypatch.setattr(handler, "probe_video", lambda path: VideoProbe(512, 512, "h264", 10.0, 24.0, 240, False, 1000))
+    monkeypatch.setattr(handler, "MAX_DRIVING_FRAMES", 240)
+    settings = SimpleNamespace(width=512, height=512, fps=24)
+
+    _, estimate, frame_cap = handler.admit_inputs({}, "i.png", "v.mp4", settings, loop=(10.0, "crossfade", 4.0))
+    assert estimate["render_frames"] == 96 and frame_cap is None
+    with pytest.raises(handler.InputError, match="loop_seconds"):
+        handler.admit_inputs({}, "i.png", "v.mp4", settings, loop=(11.0, "crossfade", 4.0))
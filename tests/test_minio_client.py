@@ -0,0 +1,50 @@
+import pytest
+from minio.error import S3Error
+
+import handler
+
+
+class _StubMinio:
+    def __init__(self, fail_upload=None):
+        self.calls = []
+        self.fail_upload = fail_upload
+
+    def bucket_exists(self, bucket):
+        self.calls.append("bucket_exists")
+        return True
+
+    def fput_object(self, bucket, name, path, **kwargs):
+        self.calls.append(("fput_object", kwargs["num_parallel_uploads"]))
+        if self.fail_upload:
+            raise S3Error(
+                code=self.fail_upload, message="", resource=None, request_id=None, host_id=None, response=None
+            )
+
+    def presigned_get_object(self, bucket, name):
+        return f"https://minio/{bucket}/{name}"
+
+
+@pytest.fixture
+def client(monkeypatch):
+    stub = _StubMinio()
+    monkeypatch.setattr(handler, "get_minio_client", lambda: stub)
+    monkeypatch.setattr(handler, "_known_buckets", set())
+    return stub
+
+
+def test_bucket_checked_once_per_process(client, tmp_path):
+    handler.upload_to_minio(str(tmp_path / "a.mp4"), "a.mp4")
+    url = handler.upload_to_minio(str(tmp_path / "b.mp4"), "b.mp4")
+    assert client.calls.count("bucket_exists") == 1
+    assert ("fput_object", handler.MINIO_UPLOAD_CONCURRENCY) in client.calls
+    assert url.endswith("/b.mp4")
+
+
+def test_deleted_bucket_is_rechecked(client, tmp_path):
+    handler.upload_to_minio(str(tmp_path / "a.mp4"), "a.mp4")
+    client.fail_upload = "NoSuchBucket"
+    with pytest.raises(S3Error):
+        handler.upload_to_minio(str(tmp_path / "b.mp4"), "b.mp4")
+    client.fail_upload = None
+    handler.upload_to_minio(str(tmp_path / "c.mp4"), "c.mp4")
+    assert client.calls.count("bucket_exists") == 2
@@ -0,0 +1,18 @@
+import handler
+
+
+def test_waits_only_for_files_the_node_names(monkeypatch, workflow):
+    sam2 = "/ComfyUI/models/sam2/"
+    monkeypatch.setattr(
+        handler,
+        "read_status",
+        lambda: {
+            sam2 + "sam2.1_hiera_base_plus.safetensors": {"status": "pending"},
+            sam2 + "sam2.1_hiera_base_plus-fp16.safetensors": {"status": "pending"},
+            "/ComfyUI/models/vae/Wan2_1_VAE_bf16.safetensors": {"status": "pending"},
+        },
+    )
+    waited = []
+    monkeypatch.setattr(handler, "wait_for_files", waited.append)
+    handler.wait_for_ungated_models(workflow)
+    assert waited == [[sam2 + "sam2.1_hiera_base_plus.safetensors"]]
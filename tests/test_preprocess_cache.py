@@ -0,0 +1,58 @@
+import copy
+
+from preprocess_cache import (
+    ARTIFACTS,
+    PREPROCESS_NODE_IDS,
+    add_capture_nodes,
+    preprocess_key,
+    use_cached_artifacts,
+)
+
+def _links(workflow):
+    return [
+        (node_id, name, str(value[0]))
+        for node_id, node in workflow.items()
+        for name, value in (node.get("inputs") or {}).items()
+        if isinstance(value, list) and len(value) == 2
+    ]
+
+
+def test_key_ignores_video_name_but_not_preprocess_settings(workflow):
+    key = preprocess_key("sha", workflow)
+    renamed = copy.deepcopy(workflow)
+    renamed["63"]["inputs"]["video"] = "other_task_driving_video.mp4"
+    assert preprocess_key("sha", renamed) == key
+    assert preprocess_key("other", workflow) != key
+    for node_id, name, value in (("206", "block_size", 16), ("205", "expand", 4), ("63", "frame_load_cap", 5)):
+        changed = copy.deepcopy(workflow)
+        changed[node_id]["inputs"][name] = value
+        assert preprocess_key("sha", changed) != key, (node_id, name)
+
+
+def test_cached_artifacts_replace_the_subgraph(workflow):
+    paths = {name: f"/cache/{name}.pt" for name in ARTIFACTS}
+    use_cached_artifacts(workflow, paths)
+    assert not set(PREPROCESS_NODE_IDS) & set(workflow)
+    assert all(source in workflow for _, _, source in _links(workflow))
+    loaders = {node["inputs"]["path"] for node in workflow.values() if node["class_type"].startswith("WanAvatarLoad")}
+    assert loaders == set(paths.values())
+
+
+def test_capture_nodes_read_the_artifact_outputs(workflow):
+    paths = {name: f"/staging/{name}.pt" for name in ARTIFACTS}
+    add_capture_nodes(workflow, paths)
+    savers = {node["inputs"]["path"]: node["inputs"]["value"] for node in workflow.values() if "path" in node["inputs"]}
+    assert savers == {paths[name]: [node_id, slot] for name, (node_id, slot, _) in ARTIFACTS.items()}
+
+
+def test_cache_hits_are_staged_as_links(tmp_path):
+    import handler
+    from input_cache import InputCache
+
+    cache = InputCache(str(tmp_path), max_bytes=1 << 20)
+    cached = tmp_path / "mask.pt"
+    cached.write_bytes(b"mask")
+    staged = handler._stage_cached(cache, "task", {"mask": str(cached)}, ".pt")
+    cached.unlink()  # evicted mid-job
+    with open(staged["mask"], "rb") as f:
+        assert f.read() == b"mask"
@@ -0,0 +1,40 @@
+import pytest
+
+import handler
+import interpolate
+
+
+def test_standard_renders_at_configured_fps():
+    settings = handler.resolve_render_settings({"resolution": "720p"})
+    assert (settings.width, settings.height, settings.fps) == (1280, 720, handler.RENDER_FPS)
+    assert settings.interpolator == handler.FRAME_INTERPOLATOR
+
+
+def test_draft_renders_smaller_and_slower():
+    settings = handler.resolve_render_settings({"resolution": "720p", "quality": "draft"})
+    assert (settings.out_width, settings.out_height) == (1280, 720)
+    assert settings.width % 16 == 0 and settings.height % 16 == 0
+    assert settings.width < 1280 and settings.height < 720
+    assert (settings.fps, settings.interpolator) == (handler.DRAFT_RENDER_FPS, handler.DRAFT_INTERPOLATOR)
+
+
+def test_render_fps_override():
+    assert handler.resolve_render_settings({"render_fps": "8"}).fps == 8
+
+
+@pytest.mark.parametrize("value", [0, handler.FPS + 1, "fast", "inf"])
+def test_render_fps_out_of_range(value):
+    with pytest.raises(handler.InputError, match="render_fps"):
+        handler.resolve_render_settings({"render_fps": value})
+
+
+def test_unknown_quality_rejected():
+    with pytest.raises(handler.InputError, match="quality"):
+        handler.resolve_render_settings({"quality": "ultra"})
+
+
+def test_get_interpolator():
+    assert interpolate.get_interpolator("blend") is interpolate.INTERPOLATORS["blend"]
+    assert interpolate.get_interpolator("os.path:join") is __import__("os").path.join
+    with pytest.raises(ValueError, match="Unknown interpolator"):
+        interpolate.get_interpolator("rife")
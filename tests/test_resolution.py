@@ -0,0 +1,39 @@
+import pytest
+
+import handler
+from input_probe import ImageProbe
+
+
+@pytest.mark.parametrize(
+    "size, bucket",
+    [
+        ((1920, 1080), "720p"),
+        ((1080, 1920), "720p_portrait"),
+        ((500, 500), "square"),
+        ((960, 540), "540p"),
+    ],
+)
+def test_snap_resolution(size, bucket):
+    assert handler.snap_resolution(*size) == bucket
+
+
+def test_resolution_by_name():
+    assert handler.resolve_resolution({"resolution": "540p"}) == "540p"
+    assert handler.resolve_resolution({}) == handler.DEFAULT_RESOLUTION
+
+
+def test_unknown_resolution_rejected():
+    with pytest.raises(handler.InputError, match="resolution must be one of"):
+        handler.resolve_resolution({"resolution": "4k"})
+
+
+def test_width_height_snapped():
+    assert handler.resolve_resolution({"width": "700", "height": 1300}) == "720p_portrait"
+    for bad in ({"width": 720}, {"width": 0, "height": 720}, {"width": "wide", "height": 720}):
+        with pytest.raises(handler.InputError, match="width and height"):
+            handler.resolve_resolution(bad)
+
+
+def test_auto_follows_reference_image(monkeypatch):
+    monkeypatch.setattr(handler, "probe_image", lambda path: ImageProbe(3000, 4000, "JPEG", 1000))
+    assert handler.resolve_resolution({"resolution": "auto"}, "ref.jpg") == "720p_portrait"
@@ -0,0 +1,43 @@
+import pytest
+
+import handler
+
+
+@pytest.fixture
+def key(monkeypatch):
+    monkeypatch.setattr(handler, "image_content_sha256", lambda path: f"img:{path}")
+    monkeypatch.setattr(handler, "content_sha256", lambda path: f"vid:{path}")
+    settings = handler.resolve_render_settings({})
+
+    def key(job_input=None, seed=7, image="a.png", video="a.mp4", settings=settings):
+        job_input = {"idempotency_key": "job-1", "prompt": "smile", **(job_input or {})}
+        return handler.result_key(job_input, settings, image, video, seed)
+
+    return key
+
+
+def test_result_key_stable(key):
+    assert key() == key()
+
+
+def test_result_key_sensitive_to_render_inputs(key):
+    base = key()
+    assert key(seed=8) != base
+    assert key({"prompt": "frown"}) != base
+    assert key(image="b.png") != base
+    assert key(video="b.mp4") != base
+    assert key(settings=handler.resolve_render_settings({"quality": "draft"})) != base
+
+
+def test_idempotency_key_only_counts_when_unseeded(key):
+    assert key({"idempotency_key": "job-2"}) == key()
+    assert key({"idempotency_key": "job-2"}, seed=None) != key(seed=None)
+
+
+def test_corrupt_index_entry_is_a_miss(monkeypatch, tmp_path):
+    monkeypatch.setattr(handler, "RESULT_INDEX_DIR", str(tmp_path))
+    key = "ab" + "0" * 62
+    path = tmp_path / "ab" / f"{key}.json"
+    path.parent.mkdir()
+    path.write_text('{"minio_key": "out/')
+    assert handler.lookup_result(key) is None
@@ -0,0 +1,70 @@
+import pytest
+
+import segments
+from segments import SegmentStitcher, hls_playlist, plan_segments
+
+
+@pytest.mark.parametrize(
+    "total, window, overlap",
+    [(1000, 48, 12), (100, 30, 0), (77, 77, 12), (78, 77, 12), (2880, 240, 12), (500, 20, 5)],
+)
+def test_plan_covers_every_frame_with_balanced_windows(total, window, overlap):
+    plan = plan_segments(total, window, overlap)
+    assert plan[0].skip == 0
+    assert plan[-1].skip + plan[-1].frames == total
+    assert all(seg.frames <= window for seg in plan)
+    assert max(s.frames for s in plan) - min(s.frames for s in plan) <= 1
+    if len(plan) > 1:
+        assert all(b.skip == a.skip + a.frames - overlap for a, b in zip(plan, plan[1:]))
+
+
+def test_short_video_is_one_window():
+    assert plan_segments(40, 48, 12) == [segments.Segment(0, 0, 40)]
+
+
+def _stitch(monkeypatch, tmp_path, plan, overlap, fps=24):
+    graphs = []
+    monkeypatch.setattr(segments, "_run_ffmpeg", lambda args: graphs.append(args[args.index("-filter_complex") + 1]))
+    stitcher = SegmentStitcher(str(tmp_path), plan, fps, overlap)
+    for seg in plan:
+        path = tmp_path / f"window_{seg.index}.mp4"
+        path.write_bytes(b"")
+        stitcher.add(seg.index, str(path))
+    return stitcher.finish(), graphs
+
+
+@pytest.mark.parametrize("overlap", [0, 12])
+def test_pieces_are_contiguous(monkeypatch, tmp_path, overlap):
+    plan = plan_segments(300, 96, overlap)
+    pieces, graphs = _stitch(monkeypatch, tmp_path, plan, overlap)
+    assert len(pieces) == len(plan)
+    assert round(sum(p.duration_s for p in pieces) * 24) == 300
+    assert all(b.start_s == pytest.approx(a.start_s + a.duration_s) for a, b in zip(pieces, pieces[1:]))
+    assert ("xfade" in graphs[0]) == bool(overlap)
+    assert not list(tmp_path.glob("window_*"))
+
+
+def test_discard_removes_pending_window(tmp_path):
+    path = tmp_path / "window_0.mp4"
+    path.write_bytes(b"")
+    stitcher = SegmentStitcher(str(tmp_path), plan_segments(10, 10, 0), 24, 0)
+    stitcher.add(0, str(path))
+    stitcher.discard()
+    assert not path.exists()
+
+
+def test_playlist_ends_only_when_complete(monkeypatch, tmp_path):
+    pieces, _ = _stitch(monkeypatch, tmp_path, plan_segments(100, 60, 12), 12)
+    urls = [f"piece_{p.index}.ts" for p in pieces]
+    assert "#EXT-X-ENDLIST" not in hls_playlist(pieces, urls, 3, ended=False)
+    assert hls_playlist(pieces, urls, 3, ended=True).rstrip().endswith("#EXT-X-ENDLIST")
+
+
+def test_segment_seconds_validation():
+    import handler
+
+    assert handler._segment_frames({"segment_seconds": 0}, fps=24) == 0
+    assert handler._segment_frames({"segment_seconds": "2.5"}, fps=12) == 30
+    for value in (0.2, "abc", float("inf")):
+        with pytest.raises(handler.InputError):
+            handler._segment_frames({"segment_seconds": value}, fps=24)